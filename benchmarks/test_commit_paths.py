@@ -0,0 +1,52 @@
+"""Commit of a single appended file in a working copy with 20,000 tracked files."""
+import pathlib
+from typing import Optional, Sequence
+
+import pytest
+
+from gitformsaver.git_client import Git
+from gitformsaver.git_ops import GitOps
+from tests.git_utils import GIT_IDENTITY, git, make_remote
+
+FILES = 20000
+
+
+def test_add_all(benchmark, working_copy: Git, readme: pathlib.Path) -> None:
+    """Previous behaviour: `git add -A` and `is_dirty()` scan the whole working copy."""
+    _report(benchmark, working_copy, readme, None)
+
+
+def test_commit_paths(benchmark, working_copy: Git, readme: pathlib.Path) -> None:
+    _report(benchmark, working_copy, readme, [str(readme)])
+
+
+def _report(
+    benchmark, working_copy: Git, readme: pathlib.Path, paths: Optional[Sequence[str]]
+) -> None:
+    def run() -> None:
+        with open(readme, 'a', encoding='utf-8') as fobj:
+            fobj.write('text\n')
+        assert working_copy.commit('Save form submission', paths)
+
+    benchmark.pedantic(run, rounds=20, iterations=1, warmup_rounds=1)
+
+
+@pytest.fixture(name='working_copy')
+def _working_copy(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> Git:
+    for name, value in GIT_IDENTITY.items():
+        monkeypatch.setenv(name, value)
+    remote = make_remote(tmp_path, {'README.md': 'GFS-JWT:token\n'})
+    copy = tmp_path / 'copy'
+    git(tmp_path, 'clone', '--quiet', remote, str(copy))
+    for i in range(FILES):
+        directory = copy / 'data' / str(i % 100)
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f'{i}.txt').write_text(f'{i}\n', encoding='utf-8')
+    git(copy, 'add', '-A')
+    git(copy, 'commit', '--quiet', '-m', 'Add data')
+    return GitOps().existing(str(copy))
+
+
+@pytest.fixture(name='readme')
+def _readme(tmp_path: pathlib.Path) -> pathlib.Path:
+    return tmp_path / 'copy' / 'README.md'
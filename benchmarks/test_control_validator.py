@@ -0,0 +1,62 @@
+"""Validation of control fields of a submission: marshmallow schema vs precompiled validator."""
+from typing import Any, Mapping
+
+import marshmallow
+import pytest
+from multidict import MultiDict
+
+from gitformsaver.control_validator import ValidationError, format_errors
+from gitformsaver.form_saver_service import CONTROL_VALIDATOR, Control
+from gitformsaver.formatters import Formatter
+
+VALID = MultiDict(
+    repo='git@github.com:user/repo.git',
+    file='README.md',
+    formatter='JSON',
+    redirect='https://example.com/thanks',
+)
+INVALID = MultiDict(repo='git@github.com:user/repo.git', formatter='XML', redirect='thanks')
+
+
+class ControlSchema(marshmallow.Schema):
+    """Schema used before the validator."""
+
+    class Meta:
+        unknown = marshmallow.EXCLUDE
+
+    repo = marshmallow.fields.String(required=True)
+    file = marshmallow.fields.String(required=True)
+    formatter = marshmallow.fields.Enum(Formatter, load_default=Formatter.PLAIN_TEXT)
+    redirect = marshmallow.fields.URL()
+
+    @marshmallow.post_load
+    def make_control(self, data, **kwargs):
+        del kwargs
+        return Control(**data)
+
+
+SCHEMA = ControlSchema()
+
+
+@pytest.mark.parametrize('form', [VALID, INVALID], ids=['valid', 'invalid'])
+def test_marshmallow(benchmark, form: Mapping[str, Any]) -> None:
+    benchmark(_load_schema, form)
+
+
+@pytest.mark.parametrize('form', [VALID, INVALID], ids=['valid', 'invalid'])
+def test_control_validator(benchmark, form: Mapping[str, Any]) -> None:
+    assert benchmark(_load_validator, form) == _load_schema(form)
+
+
+def _load_schema(form: Mapping[str, Any]) -> Any:
+    try:
+        return SCHEMA.load(form)
+    except marshmallow.ValidationError as exc:
+        return '\n'.join(f'{key}: {" ".join(values)}' for key, values in exc.messages_dict.items())
+
+
+def _load_validator(form: Mapping[str, Any]) -> Any:
+    try:
+        return CONTROL_VALIDATOR.load(form)
+    except ValidationError as exc:
+        return format_errors(exc)
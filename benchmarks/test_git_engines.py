@@ -0,0 +1,95 @@
+"""Clone and push one submission to each of 1,000 local bare repos with both git engines.
+
+Set BENCH_REPOS to change the number of repos.
+"""
+import asyncio
+import os
+import pathlib
+import shutil
+from typing import List
+from unittest import mock
+
+import pytest
+
+from gitformsaver.async_git import AsyncGitOps, AsyncLazyGit
+from gitformsaver.async_git_thread import AsyncGitTaskHandler, AsyncGitThread
+from gitformsaver.authentication_interface import AuthenticationInterface
+from gitformsaver.git_ops import GitOps
+from gitformsaver.git_task_handler import GitTaskHandler
+from gitformsaver.git_thread import CoalescingPolicy, GitThread
+from gitformsaver.lazy_git import LazyGit
+from gitformsaver.worker_pool import WorkerPool
+from tests.git_utils import GIT_IDENTITY, make_remote
+
+REPOS = int(os.environ.get('BENCH_REPOS', 1000))
+WORKERS = 8
+COALESCING = CoalescingPolicy(max_latency=0)
+
+
+def test_threads_engine(benchmark, remotes: List[str], tmp_path: pathlib.Path) -> None:
+    def run() -> None:
+        pool = WorkerPool(WORKERS)
+        git_threads = []
+        for i, remote in enumerate(remotes):
+            handler = GitTaskHandler(
+                git=LazyGit(str(tmp_path / 'threads' / str(i)), GitOps()),
+                repo=remote,
+                authentication=_authentication(),
+            )
+            git_thread = GitThread(handler, COALESCING, pool=pool)
+            git_thread.clone_soon(remote)
+            git_thread.push_soon('README.md', 'text\n')
+            git_threads.append(git_thread)
+        for git_thread in git_threads:
+            git_thread.stop()
+        pool.stop()
+        assert sum(git_thread.stats.batch_size.count for git_thread in git_threads) == REPOS
+
+    _report(benchmark, run)
+
+
+def test_asyncio_engine(benchmark, remotes: List[str], tmp_path: pathlib.Path) -> None:
+    async def scenario() -> None:
+        git_ops = AsyncGitOps(network_concurrency=WORKERS)
+        git_threads = []
+        for i, remote in enumerate(remotes):
+            handler = AsyncGitTaskHandler(
+                git=AsyncLazyGit(str(tmp_path / 'asyncio' / str(i)), git_ops),
+                repo=remote,
+                authentication=_authentication(),
+            )
+            git_thread = AsyncGitThread(handler, COALESCING)
+            git_thread.clone_soon(remote)
+            git_thread.push_soon('README.md', 'text\n')
+            git_threads.append(git_thread)
+        for git_thread in git_threads:
+            git_thread.stop()
+        await asyncio.gather(*(git_thread.drain() for git_thread in git_threads))
+        assert sum(git_thread.stats.batch_size.count for git_thread in git_threads) == REPOS
+
+    _report(benchmark, lambda: asyncio.run(scenario()))
+
+
+def _report(benchmark, run) -> None:
+    benchmark.pedantic(run, rounds=1, iterations=1)
+    benchmark.extra_info['repos_per_second'] = round(REPOS / benchmark.stats['mean'], 1)
+
+
+def _authentication() -> AuthenticationInterface:
+    authentication = mock.Mock(spec_set=AuthenticationInterface)
+    authentication.extract_token.return_value = 'token'
+    authentication.is_valid_token.return_value = True
+    return authentication
+
+
+@pytest.fixture(name='remotes')
+def _remotes(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> List[str]:
+    for name, value in GIT_IDENTITY.items():
+        monkeypatch.setenv(name, value)
+    seed = make_remote(tmp_path, {'README.md': 'GFS-JWT:token\n'})
+    remotes = []
+    for i in range(REPOS):
+        remote = str(tmp_path / 'remotes' / f'{i}.git')
+        shutil.copytree(seed, remote)
+        remotes.append(remote)
+    return remotes
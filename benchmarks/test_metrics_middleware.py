@@ -0,0 +1,38 @@
+"""Per-request cost of the metrics middleware, next to the handler it wraps."""
+import asyncio
+from unittest import mock
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+from gitformsaver.git_thread_manager import GitThreadManager
+from gitformsaver.metrics_service import MetricsService
+
+REQUESTS = 1000
+
+
+async def handle(request: web.Request) -> web.Response:
+    del request
+    return web.Response()
+
+
+@pytest.mark.parametrize('with_metrics', [False, True], ids=['bare', 'metrics'])
+def test_request_overhead(benchmark, with_metrics: bool) -> None:
+    service = MetricsService(git_thread_manager=mock.Mock(spec_set=GitThreadManager))
+    app = web.Application()
+    route = app.router.add_post('/', handle)
+    request = make_mocked_request('POST', '/', app=app)
+    request.match_info.add_app(app)
+    request.match_info._route = route  # pylint: disable=protected-access
+
+    async def run() -> None:
+        for _ in range(REQUESTS):
+            if with_metrics:
+                await service.middleware(request, handle)
+            else:
+                await handle(request)
+
+    loop = asyncio.new_event_loop()
+    benchmark(lambda: loop.run_until_complete(run()))
+    loop.close()
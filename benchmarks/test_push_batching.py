@@ -0,0 +1,79 @@
+"""Pushes per 1,000 submissions interleaved across several files."""
+import pathlib
+import random
+from typing import List, Sequence
+from unittest import mock
+
+import pytest
+
+from gitformsaver.authentication_interface import AuthenticationInterface
+from gitformsaver.git_task_handler import GitTaskHandler, WriteTask
+
+SUBMISSIONS = 1000
+FILES = ('a.md', 'b.md', 'c.md', 'd.md')
+
+
+class CountingGit:
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.pulls = 0
+        self.pushes = 0
+
+    def maybe_pull(self) -> None:
+        self.pulls += 1
+
+    def commit(self, commit_message: str, paths: Sequence[str]) -> bool:
+        del commit_message, paths
+        return True
+
+    def push(self) -> None:
+        self.pushes += 1
+
+
+def test_per_file_run_transactions(benchmark, git: CountingGit, tasks: List[WriteTask]) -> None:
+    """Previous behaviour: one transaction per run of consecutive writes to the same file."""
+    handler = _make_handler(git)
+
+    def run() -> None:
+        run_tasks: List[WriteTask] = []
+        for task in tasks:
+            if run_tasks and run_tasks[-1].rel_path != task.rel_path:
+                handler.handle_writes(run_tasks)
+                run_tasks = []
+            run_tasks.append(task)
+        handler.handle_writes(run_tasks)
+
+    _report(benchmark, git, run)
+    assert git.pushes > SUBMISSIONS // 2
+
+
+def test_single_flush_transaction(benchmark, git: CountingGit, tasks: List[WriteTask]) -> None:
+    handler = _make_handler(git)
+    _report(benchmark, git, lambda: handler.handle_writes(tasks))
+    assert git.pushes == 1
+
+
+def _report(benchmark, git: CountingGit, run) -> None:
+    benchmark.pedantic(run, rounds=1, iterations=1)
+    benchmark.extra_info['pushes_per_1000'] = git.pushes * 1000 // SUBMISSIONS
+    benchmark.extra_info['pulls_per_1000'] = git.pulls * 1000 // SUBMISSIONS
+
+
+def _make_handler(git: CountingGit) -> GitTaskHandler:
+    authentication = mock.Mock(spec_set=AuthenticationInterface)
+    authentication.extract_token.return_value = 'token'
+    authentication.is_valid_token.return_value = True
+    return GitTaskHandler(git=git, repo='repo', authentication=authentication)  # type: ignore
+
+
+@pytest.fixture(name='git')
+def _git(tmp_path: pathlib.Path) -> CountingGit:
+    for name in FILES:
+        (tmp_path / name).write_text('GFS-JWT:token\n', encoding='utf-8')
+    return CountingGit(str(tmp_path))
+
+
+@pytest.fixture(name='tasks')
+def _tasks() -> List[WriteTask]:
+    rnd = random.Random(0)
+    return [WriteTask(rel_path=rnd.choice(FILES), text=f'{i}\n') for i in range(SUBMISSIONS)]
@@ -0,0 +1,71 @@
+"""Clone 500 forks of one repo with and without a shared reference store.
+
+Clones are bare, so the disk usage is only made of objects and refs.
+Set BENCH_FORKS to change the number of forks.
+"""
+import hashlib
+import os
+import pathlib
+import shutil
+from typing import List
+
+import pytest
+
+from gitformsaver.git_ops import GitOps
+from gitformsaver.reference_store import ReferenceStore
+from tests.git_utils import GIT_IDENTITY, git, make_remote
+
+FORKS = int(os.environ.get('BENCH_FORKS', 500))
+FILES = 200
+
+
+@pytest.mark.parametrize('shallow', [True, False])
+def test_independent_clones(
+    benchmark, forks: List[str], tmp_path: pathlib.Path, shallow: bool
+) -> None:
+    _report(benchmark, GitOps(shallow=shallow, bare=True), forks, tmp_path / 'independent')
+
+
+def test_reference_store(benchmark, forks: List[str], tmp_path: pathlib.Path) -> None:
+    store = ReferenceStore(str(tmp_path / 'references'))
+    _report(benchmark, GitOps(bare=True, reference_store=store), forks, tmp_path / 'shared', store)
+
+
+def _report(benchmark, git_ops: GitOps, forks: List[str], root: pathlib.Path, *stores) -> None:
+    def run() -> None:
+        for i, fork in enumerate(forks):
+            git_ops.clone(url=fork, to_path=str(root / str(i)))
+
+    benchmark.pedantic(run, rounds=1, iterations=1)
+    benchmark.extra_info['forks_per_second'] = round(FORKS / benchmark.stats['mean'], 1)
+    paths = [root] + [pathlib.Path(store.path_for(forks[0])) for store in stores]
+    benchmark.extra_info['disk_kb'] = sum(_disk_usage(path, '*') for path in paths) // 1024
+    benchmark.extra_info['objects_kb'] = (
+        sum(_disk_usage(path, 'objects/**/*') for path in paths) // 1024
+    )
+
+
+def _disk_usage(root: pathlib.Path, pattern: str) -> int:
+    return sum(path.lstat().st_blocks * 512 for path in root.rglob(pattern))
+
+
+@pytest.fixture(name='forks')
+def _forks(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> List[str]:
+    for name, value in GIT_IDENTITY.items():
+        monkeypatch.setenv(name, value)
+    seed = pathlib.Path(make_remote(tmp_path, {'README.md': 'GFS-JWT:token\n'}))
+    work = tmp_path / 'work'
+    git(tmp_path, 'clone', '--quiet', str(seed), str(work))
+    for commit in range(10):
+        for i in range(FILES):
+            text = hashlib.sha256(f'{commit} {i}'.encode()).hexdigest() + '\n'
+            (work / f'{i}.txt').write_text(text * 20, encoding='utf-8')
+        git(work, 'add', '-A')
+        git(work, 'commit', '--quiet', '-m', f'Commit {commit}')
+    git(work, 'push', '--quiet')
+    forks = []
+    for i in range(FORKS):
+        fork = tmp_path / 'forks' / f'{i}.git'
+        shutil.copytree(seed, fork)
+        forks.append(f'file://{fork}')
+    return forks
@@ -0,0 +1,29 @@
+"""Token issue rate and verification latency of the signing backends."""
+import os
+
+import pytest
+
+from gitformsaver.authentication import Authentication
+from gitformsaver.signing_backends import Ed25519Backend, HMACBackend, RSABackend
+
+KEYS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'tests', 'keys')
+BACKENDS = {
+    'RS256': lambda: RSABackend(os.path.join(KEYS_PATH, 'id_rsa')),
+    'EdDSA': lambda: Ed25519Backend(os.path.join(KEYS_PATH, 'id_ed25519')),
+    'HS256': lambda: HMACBackend('benchmark-server-secret-of-32-bytes'),
+}
+
+
+@pytest.mark.parametrize('algorithm', BACKENDS)
+def test_issue_token(benchmark, algorithm: str) -> None:
+    authentication = Authentication(backends=[BACKENDS[algorithm]()])
+    benchmark.group = 'issue'
+    assert benchmark(authentication.create_token, 'repo', 'path', 'secret')
+
+
+@pytest.mark.parametrize('algorithm', BACKENDS)
+def test_verify_token(benchmark, algorithm: str) -> None:
+    authentication = Authentication(backends=[BACKENDS[algorithm]()])
+    token = authentication.extract_token(authentication.create_token('repo', 'path', 'secret'))
+    benchmark.group = 'verify'
+    assert benchmark(authentication.is_valid_token, token, 'repo', 'path', 'secret')
@@ -0,0 +1,64 @@
+"""Cost of a single submission to a hot file, with the git commands stubbed out."""
+import pathlib
+from typing import List, Sequence
+from unittest import mock
+
+import pytest
+
+from gitformsaver.authentication_interface import AuthenticationInterface
+from gitformsaver.git_task_handler import GitTaskHandler, WriteTask
+
+REL_PATH = 'forms/2024/contact/submissions.md'
+
+
+class NoopGit:
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def maybe_pull(self) -> None:
+        pass
+
+    def push(self) -> None:
+        pass
+
+    def commit(self, commit_message: str, paths: Sequence[str]) -> bool:
+        del commit_message, paths
+        return True
+
+    def push_or_rebase(self) -> int:
+        return 0
+
+
+class ReindexingGitTaskHandler(GitTaskHandler):
+    """Previous behaviour: the path is resolved and the header is read on every write."""
+
+    def _is_current(self, target) -> bool:
+        return False
+
+
+@pytest.mark.parametrize(
+    'handler_class,optimistic',
+    [
+        (ReindexingGitTaskHandler, True),
+        (GitTaskHandler, False),
+        (GitTaskHandler, True),
+    ],
+    ids=['reindex', 'pull-stat', 'optimistic-index'],
+)
+def test_hot_file_write(benchmark, git: NoopGit, handler_class, optimistic: bool) -> None:
+    authentication = mock.Mock(spec_set=AuthenticationInterface)
+    authentication.extract_token.return_value = 'token'
+    authentication.is_valid_token.return_value = True
+    handler = handler_class(
+        git=git, repo='repo', authentication=authentication, optimistic=optimistic
+    )
+    tasks: List[WriteTask] = [WriteTask(rel_path=REL_PATH, text='submission\n')]
+    benchmark(handler.handle_writes, tasks)
+
+
+@pytest.fixture(name='git')
+def _git(tmp_path: pathlib.Path) -> NoopGit:
+    path = tmp_path / REL_PATH
+    path.parent.mkdir(parents=True)
+    path.write_text('GFS-JWT:token\n' + 'x' * 4096 + '\n', encoding='utf-8')
+    return NoopGit(str(tmp_path))
@@ -0,0 +1,70 @@
+"""Burst of RS256 token requests, and how long it blocks the event loop at once."""
+import asyncio
+import concurrent.futures
+import itertools
+import multiprocessing
+import os
+import time
+from typing import List, Optional
+
+import pytest
+
+from gitformsaver.http_server import make_authentication
+from gitformsaver.settings import Settings
+from gitformsaver.token_signer import TokenSigner, init_worker, sign_in_worker
+
+KEYS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'tests', 'keys')
+SETTINGS = Settings(private_key_path=os.path.join(KEYS_PATH, 'id_rsa'))
+BURST = 64
+
+
+def make_signer(executor_kind: str) -> TokenSigner:
+    authentication = make_authentication(SETTINGS)
+    if executor_kind == 'process':
+        executor: Optional[concurrent.futures.Executor] = concurrent.futures.ProcessPoolExecutor(
+            2,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=(make_authentication, SETTINGS),
+        )
+        return TokenSigner(authentication, executor, sign_in_worker)
+    executor = concurrent.futures.ThreadPoolExecutor(2) if executor_kind == 'thread' else None
+    return TokenSigner(authentication, executor)
+
+
+@pytest.mark.parametrize('executor_kind', ['inline', 'thread', 'process'])
+@pytest.mark.parametrize('distinct', [True, False], ids=['distinct', 'identical'])
+def test_token_burst(benchmark, executor_kind: str, distinct: bool) -> None:
+    signer = make_signer(executor_kind)
+    rounds = itertools.count()
+    stalls: List[float] = []
+
+    async def heartbeat(done: asyncio.Event) -> None:
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0)
+            now = time.perf_counter()
+            stalls.append(now - last)
+            last = now
+
+    async def burst() -> None:
+        number = next(rounds)
+        done = asyncio.Event()
+        ticker = asyncio.ensure_future(heartbeat(done))
+        await asyncio.gather(
+            *(
+                signer.create_token('repo', f'{number}/{index if distinct else 0}')
+                for index in range(BURST)
+            )
+        )
+        done.set()
+        await ticker
+
+    loop = asyncio.new_event_loop()
+    # Warm up the workers, which load the key on first use
+    loop.run_until_complete(signer.create_token('repo', 'warm-up'))
+    benchmark.group = 'distinct' if distinct else 'identical'
+    benchmark(lambda: loop.run_until_complete(burst()))
+    benchmark.extra_info['max_loop_stall_ms'] = max(stalls) * 1000
+    signer.close()
+    loop.close()
@@ -0,0 +1,73 @@
+"""Memory, OS threads and idle wake-ups of 10,000 repos."""
+import threading
+import time
+import tracemalloc
+from typing import Callable, List
+from unittest import mock
+
+from gitformsaver.git_task_handler import GitTaskHandler
+from gitformsaver.git_thread import CoalescingPolicy, GitThread
+from gitformsaver.worker_pool import WorkerPool
+
+REPOS = 10000
+IDLE_SECONDS = 2.0
+
+
+def test_thread_per_repo(benchmark) -> None:
+    """Previous behaviour: every repo thread polls its queue once a second."""
+    threads_before = threading.active_count()
+    stop = threading.Event()
+    wakeups = [0]
+
+    def poll() -> None:
+        while not stop.wait(timeout=1):
+            wakeups[0] += 1
+
+    threads: List[threading.Thread] = []
+
+    def start() -> None:
+        threads.extend(threading.Thread(target=poll, daemon=True) for _ in range(REPOS))
+        for thread in threads:
+            thread.start()
+
+    try:
+        _report(benchmark, start, lambda: wakeups[0], threads_before)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def test_worker_pool(benchmark) -> None:
+    threads_before = threading.active_count()
+    pool = WorkerPool()
+    handler = mock.Mock(spec_set=GitTaskHandler)
+    repos: List[GitThread] = []
+
+    def start() -> None:
+        repos.extend(
+            GitThread(handler, CoalescingPolicy(max_latency=0), pool=pool) for _ in range(REPOS)
+        )
+        for repo in repos:
+            repo.push_soon('file', 'text')
+
+    try:
+        _report(benchmark, start, lambda: pool.wakeups, threads_before)
+        assert sum(repo.stats.batch_size.count for repo in repos) == REPOS
+    finally:
+        pool.stop()
+
+
+def _report(
+    benchmark, start: Callable[[], None], wakeups: Callable[[], int], threads_before: int
+) -> None:
+    tracemalloc.start()
+    benchmark.pedantic(start, rounds=1, iterations=1)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    time.sleep(IDLE_SECONDS / 2)
+    before = wakeups()
+    time.sleep(IDLE_SECONDS)
+    benchmark.extra_info['os_threads'] = threading.active_count() - threads_before
+    benchmark.extra_info['python_bytes_per_repo'] = memory // REPOS
+    benchmark.extra_info['idle_wakeups_per_second'] = (wakeups() - before) / IDLE_SECONDS
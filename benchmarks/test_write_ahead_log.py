@@ -0,0 +1,59 @@
+"""Acknowledged submissions per second with and without the write-ahead log."""
+import os
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator
+
+import pytest
+
+from gitformsaver.git_task_handler import WriteTask
+from gitformsaver.write_ahead_log import GroupCommitter, WriteAheadLog
+
+SUBMISSIONS = 2000
+CLIENTS = 32
+TASK = WriteTask(rel_path='file.md', text='name: value\n' * 8)
+
+
+def test_in_memory_queue(benchmark) -> None:
+    _report(benchmark, lambda: None)
+
+
+def test_group_commit(benchmark, wal: WriteAheadLog) -> None:
+    def submit() -> None:
+        _, durable = wal.append(TASK)
+        durable.result()
+
+    _report(benchmark, submit)
+
+
+def test_fsync_per_submission(benchmark, tmp_path: pathlib.Path) -> None:
+    fd = os.open(str(tmp_path / 'naive.wal'), os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+    record = repr(TASK).encode('utf-8')
+
+    def submit() -> None:
+        os.write(fd, record)
+        os.fsync(fd)
+
+    try:
+        _report(benchmark, submit)
+    finally:
+        os.close(fd)
+
+
+def _report(benchmark, submit: Callable[[], None]) -> None:
+    def run() -> None:
+        with ThreadPoolExecutor(CLIENTS) as executor:
+            for _ in executor.map(lambda _: submit(), range(SUBMISSIONS)):
+                pass
+
+    benchmark.pedantic(run, rounds=3, iterations=1)
+    benchmark.extra_info['submissions_per_second'] = int(SUBMISSIONS / benchmark.stats['mean'])
+
+
+@pytest.fixture(name='wal')
+def _wal(tmp_path: pathlib.Path) -> Iterator[WriteAheadLog]:
+    committer = GroupCommitter()
+    wal = WriteAheadLog(str(tmp_path / 'wal'), 'repo', committer)
+    yield wal
+    wal.close()
+    committer.stop()
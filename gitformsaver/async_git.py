@@ -0,0 +1,336 @@
+import asyncio
+import logging
+import os
+import shutil
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .git_client import GitConflictError, GitError, PushRejectedError, appended, write_appends
+from .git_ops import ssh_env
+from .ssh_pool import SshConnectionPool
+
+LOG = logging.getLogger(__name__)
+_REJECTED_MARKERS = ('[rejected]', 'non-fast-forward', 'fetch first')
+
+
+class AsyncGit:
+    """Working copy driven by git subprocesses on the event loop.
+
+    Commands talking to the remote wait for the semaphore shared by all repos.
+    """
+
+    _PUSH_BACKOFF = 0.1
+
+    def __init__(
+        self,
+        path: str,
+        network: asyncio.Semaphore,
+        env: Optional[Dict[str, str]] = None,
+        max_push_retries: int = 3,
+        connections: Optional[SshConnectionPool] = None,
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        self._path = path
+        self._network = network
+        self._env = env
+        self._max_push_retries = max_push_retries
+        self._connections = connections
+        self._url: Optional[str] = None
+        self._known_clean = False
+
+    async def push(self) -> None:
+        code, stderr = await self._remote('push', '--quiet', check=False)
+        if code and any(marker in stderr for marker in _REJECTED_MARKERS):
+            raise PushRejectedError(stderr)
+        if code:
+            raise GitError(stderr)
+
+    async def maybe_pull(self) -> None:
+        """Download remote changes if copy is clean."""
+        if self._known_clean or await self._is_clean():
+            await self._remote('pull', '--quiet')
+
+    async def maybe_push(self, commit_message: str, paths: Optional[Sequence[str]] = None) -> None:
+        """Add-commit-push changes."""
+        if await self.commit(commit_message, paths):
+            await self.push()
+
+    async def commit(self, commit_message: str, paths: Optional[Sequence[str]] = None) -> bool:
+        """Commit all changes, or only the paths, return False if there was nothing to commit."""
+        self._known_clean = False
+        if paths is None:
+            committed = await self._commit_all(commit_message)
+        else:
+            committed = await self._commit_paths(commit_message, paths)
+        self._known_clean = True
+        return committed
+
+    async def push_or_rebase(self) -> int:
+        """Push local commits, rebasing them onto remote ones if the push is rejected.
+
+        Returns the number of retries it took.
+        Raises GitConflictError if local commits can't be rebased.
+        """
+        for attempt in range(self._max_push_retries + 1):
+            try:
+                await self.push()
+                return attempt
+            except PushRejectedError:
+                if attempt == self._max_push_retries:
+                    raise
+            if attempt:
+                await asyncio.sleep(self._PUSH_BACKOFF * 2 ** (attempt - 1))
+            await self._rebase()
+        return self._max_push_retries
+
+    async def reapply_on_upstream(self) -> None:
+        """Replace local commits by ones appending the same texts to the upstream files.
+
+        Raises GitConflictError if a local commit does more than appending to files.
+        """
+        appends: List[Tuple[str, Dict[str, bytes]]] = []
+        commits = await self._output('rev-list', '--reverse', 'HEAD', '^@{upstream}')
+        for commit in commits.split():
+            names = await self._output(
+                'diff-tree', '--no-commit-id', '--name-only', '-r', '-z', commit
+            )
+            texts = {}
+            for rel_path in filter(None, names.split('\0')):
+                old = await self._blob(f'{commit}^:{rel_path}')
+                texts[rel_path] = appended(rel_path, old, await self._blob(f'{commit}:{rel_path}'))
+            appends.append((await self._output('log', '-1', '--format=%B', commit), texts))
+        await self._run('reset', '--quiet', '--hard', '@{upstream}')
+        self._known_clean = True
+        loop = asyncio.get_running_loop()
+        for commit_message, texts in appends:
+            paths = await loop.run_in_executor(None, write_appends, self._path, texts)
+            if paths:
+                await self.commit(commit_message, paths)
+
+    def close(self) -> None:
+        """Nothing to release, no git process outlives its command."""
+
+    @property
+    def root(self) -> str:
+        return os.path.abspath(self._path)
+
+    async def _commit_all(self, commit_message: str) -> bool:
+        await self._run('add', '-A')
+        if await self._is_clean():
+            return False
+        await self._run('commit', '--quiet', '--no-verify', '-m', commit_message)
+        return True
+
+    async def _commit_paths(self, commit_message: str, paths: Sequence[str]) -> bool:
+        """Commit the files with plumbing commands, see Git._commit_paths."""
+        root = os.path.realpath(self._path)
+        await self._run('update-index', '--add', '--', *(os.path.relpath(p, root) for p in paths))
+        tree = await self._output('write-tree')
+        parent = await self._output('rev-parse', 'HEAD')
+        if tree == await self._output('rev-parse', 'HEAD^{tree}'):
+            return False
+        commit = await self._output('commit-tree', tree, '-p', parent, '-m', commit_message)
+        await self._run('update-ref', '-m', f'commit: {commit_message}', 'HEAD', commit, parent)
+        return True
+
+    async def _rebase(self) -> None:
+        await self._remote('fetch', '--quiet')
+        code, stderr = await self._run('rebase', '--quiet', '@{upstream}', check=False)
+        if code:
+            await self._run('rebase', '--abort')
+            raise GitConflictError(stderr)
+
+    async def _blob(self, spec: str) -> bytes:
+        """Contents of the file at revision:path, empty if it doesn't exist."""
+        code, stdout, _ = await run_git_bytes(
+            'cat-file', 'blob', spec, cwd=self._path, env=self._env
+        )
+        return b'' if code else stdout
+
+    async def _is_clean(self) -> bool:
+        return not await self._output('status', '--porcelain')
+
+    async def _remote(self, *args: str, check: bool = True) -> Tuple[int, str]:
+        if self._connections is not None:
+            if self._url is None:
+                self._url = await self._output('remote', 'get-url', 'origin')
+            await _check_connection(self._connections, self._url)
+        async with self._network:
+            return await self._run(*args, check=check)
+
+    async def _run(self, *args: str, check: bool = True) -> Tuple[int, str]:
+        code, _, stderr = await run_git(*args, cwd=self._path, env=self._env)
+        if check and code:
+            raise GitError(stderr)
+        return code, stderr
+
+    async def _output(self, *args: str) -> str:
+        code, stdout, stderr = await run_git(*args, cwd=self._path, env=self._env)
+        if code:
+            raise GitError(stderr)
+        return stdout
+
+
+class AsyncGitOps:
+    """Asyncio counterpart of GitOps, selected with ``GFS_GIT_ENGINE=asyncio``."""
+
+    def __init__(
+        self,
+        private_key_path: str = '',
+        shallow: bool = True,
+        max_push_retries: int = 3,
+        network_concurrency: int = 16,
+        connections: Optional[SshConnectionPool] = None,
+    ) -> None:
+        """Connections are multiplexed through the pool, and health-checked in the executor."""
+        # pylint: disable=too-many-arguments
+        self._private_key_path = private_key_path
+        self._shallow = shallow
+        self._max_push_retries = max_push_retries
+        self._network_concurrency = network_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._connections = connections
+
+    async def clone(self, url: str, to_path: str) -> AsyncGit:
+        """Update existing working copy of the url, or clone it from scratch."""
+        if not await self._reuse(url, to_path):
+            await self._clone(url, to_path)
+        return self.existing(to_path)
+
+    def close(self) -> None:
+        if self._connections is not None:
+            self._connections.close()
+
+    def existing(self, path: str) -> AsyncGit:
+        return AsyncGit(
+            path,
+            self._network,
+            env=self._git_env,
+            max_push_retries=self._max_push_retries,
+            connections=self._connections,
+        )
+
+    async def _reuse(self, url: str, to_path: str) -> bool:
+        if not os.path.isdir(os.path.join(to_path, '.git')):
+            return False
+        code, remote_url, _ = await run_git('remote', 'get-url', 'origin', cwd=to_path)
+        if code or remote_url != url:
+            LOG.info("Directory %s doesn't hold a working copy of %s", to_path, url)
+            return False
+        # The copy may hold commits which weren't pushed, so it's never re-cloned from now on.
+        LOG.info("Fast-forwarding existing working copy of %s in %s", url, to_path)
+        if self._connections is not None:
+            await _check_connection(self._connections, url)
+        async with self._network:
+            code, _, stderr = await run_git('fetch', '--quiet', cwd=to_path, env=self._git_env)
+        if code:
+            raise GitError(stderr)
+        code, _, stderr = await run_git('merge', '--quiet', '--ff-only', '@{upstream}', cwd=to_path)
+        if code:
+            LOG.warning("Rebasing unpushed commits of %s onto upstream", to_path)
+            code, _, stderr = await run_git('rebase', '--quiet', '@{upstream}', cwd=to_path)
+        if code:
+            if os.path.isdir(os.path.join(to_path, '.git', 'rebase-merge')):
+                await run_git('rebase', '--abort', cwd=to_path)
+            LOG.error("Working copy %s needs manual repair: %s", to_path, stderr)
+            raise GitError(f"Can't rebase unpushed commits of {to_path}")
+        return True
+
+    async def _clone(self, url: str, to_path: str) -> None:
+        shutil.rmtree(to_path, ignore_errors=True)
+        options = ['--depth=1', '--single-branch', '--filter=blob:none'] if self._shallow else []
+        LOG.info("Cloning %s to %s", url, to_path)
+        if self._connections is not None:
+            await _check_connection(self._connections, url)
+        async with self._network:
+            code, _, stderr = await run_git(
+                'clone', '--quiet', *options, url, to_path, env=self._git_env
+            )
+        if code:
+            raise GitError(stderr)
+
+    @property
+    def _network(self) -> asyncio.Semaphore:
+        # Created on first use, so that it belongs to the running loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._network_concurrency)
+        return self._semaphore
+
+    @property
+    def _git_env(self) -> Optional[Dict[str, str]]:
+        env = ssh_env(self._private_key_path, self._connections)
+        if not env:
+            return None
+        return dict(os.environ, **env)
+
+
+class AsyncLazyGit:
+    """Asyncio counterpart of LazyGit."""
+
+    def __init__(self, path: str, git_ops: AsyncGitOps) -> None:
+        self._path = path
+        self._git_ops = git_ops
+        self._actual_git: Optional[AsyncGit] = None
+
+    async def clone(self, url: str) -> None:
+        self._actual_git = await self._git_ops.clone(url=url, to_path=self._path)
+
+    async def maybe_pull(self) -> None:
+        await self._git.maybe_pull()
+
+    async def push(self) -> None:
+        await self._git.push()
+
+    async def maybe_push(self, commit_message: str, paths: Optional[Sequence[str]] = None) -> None:
+        await self._git.maybe_push(commit_message, paths)
+
+    async def commit(self, commit_message: str, paths: Optional[Sequence[str]] = None) -> bool:
+        return await self._git.commit(commit_message, paths)
+
+    async def push_or_rebase(self) -> int:
+        return await self._git.push_or_rebase()
+
+    async def reapply_on_upstream(self) -> None:
+        await self._git.reapply_on_upstream()
+
+    def close(self) -> None:
+        self._actual_git = None
+
+    @property
+    def root(self) -> str:
+        return os.path.abspath(self._path)
+
+    @property
+    def _git(self) -> AsyncGit:
+        if self._actual_git is None:
+            self._actual_git = self._git_ops.existing(self._path)
+        return self._actual_git
+
+
+async def _check_connection(connections: SshConnectionPool, url: str) -> None:
+    """SshConnectionPool.check, which may fork ssh, without blocking the loop."""
+    await asyncio.get_running_loop().run_in_executor(None, connections.check, url)
+
+
+async def run_git(
+    *args: str, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None
+) -> Tuple[int, str, str]:
+    """Run git command, return its exit code, stdout and stderr."""
+    code, stdout, stderr = await run_git_bytes(*args, cwd=cwd, env=env)
+    return code, stdout.decode('utf-8', 'replace').strip(), stderr
+
+
+async def run_git_bytes(
+    *args: str, cwd: Optional[str] = None, env: Optional[Dict[str, str]] = None
+) -> Tuple[int, bytes, str]:
+    """Run git command, return its exit code, raw stdout and stderr."""
+    process = await asyncio.create_subprocess_exec(
+        'git',
+        *args,
+        cwd=cwd,
+        env=env,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    return process.returncode or 0, stdout, stderr.decode('utf-8', 'replace').strip()
@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import replace
+from typing import Deque, List, Optional, Sequence, Set, Tuple
+
+from . import errors
+from .async_git import AsyncLazyGit
+from .authentication_interface import AuthenticationInterface
+from .backpressure import Backlog, QueueDepth, QueueLimits
+from .git_client import GitConflictError
+from .git_task_handler import CloneTask, GitTaskHandler, WriteTask, _Groups
+from .git_thread import CoalescingPolicy, _size
+from .metrics import RepoStats
+from .token_cache import TokenCache
+from .tracing import Tracer
+from .write_ahead_log import WriteAheadLog
+
+LOG = logging.getLogger(__name__)
+
+
+class AsyncGitTaskHandler(GitTaskHandler):
+    """GitTaskHandler running git commands as subprocesses on the event loop.
+
+    Validation and appends are shared with the threaded handler, they read files and may verify
+    tokens, so they run on the default executor to keep the loop responsive.
+    """
+
+    def __init__(
+        self,
+        git: AsyncLazyGit,
+        repo: str,
+        authentication: AuthenticationInterface,
+        *,
+        token_cache: Optional[TokenCache] = None,
+        optimistic: bool = False,
+        stats: Optional[RepoStats] = None,
+        tracer: Optional[Tracer] = None,
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        super().__init__(
+            git=git,  # type: ignore[arg-type]
+            repo=repo,
+            authentication=authentication,
+            token_cache=token_cache,
+            optimistic=optimistic,
+            stats=stats,
+            tracer=tracer,
+        )
+        self._async_git = git
+
+    async def handle_clone_async(self, clone_task: CloneTask) -> None:
+        with self._phase('clone'):
+            await self._async_git.clone(clone_task.url)
+
+    async def handle_writes_async(self, write_tasks: Sequence[WriteTask]) -> None:
+        groups = self._group(write_tasks)
+        with self._traced(write_tasks):
+            if self._optimistic:
+                written, failures = await self._append_async(groups)
+                if written:
+                    await self._commit_and_push_async(written)
+            else:
+                with self._phase('pull'):
+                    await self._async_git.maybe_pull()
+                self._invalidate_targets()
+                written, failures = await self._append_async(groups)
+                if written and await self._commit_async(written):
+                    with self._phase('push'), self._unpushed_on_failure():
+                        await self._async_git.push()
+        if failures:
+            raise failures[0]
+
+    def close(self) -> None:
+        self._async_git.close()
+
+    async def _append_async(
+        self, groups: _Groups
+    ) -> Tuple[List[str], List[errors.UserFacingError]]:
+        return await asyncio.get_running_loop().run_in_executor(None, self._append, groups)
+
+    async def _commit_and_push_async(self, written: List[str]) -> None:
+        await self._commit_async(written)
+        with self._unpushed_on_failure():
+            retries = await self._push_reapplying_async()
+        if retries:
+            self._invalidate_targets()
+        self._stats.push_retries += retries
+
+    async def _push_reapplying_async(self) -> int:
+        for _ in range(self._MAX_REAPPLIES):
+            try:
+                return await self._push_or_rebase_async()
+            except GitConflictError as exc:
+                self._stats.push_conflicts += 1
+                LOG.warning("Re-applying local commits on top of remote changes: %s", exc.stderr)
+            with self._phase('pull'):
+                await self._async_git.reapply_on_upstream()
+            self._invalidate_targets()
+        return await self._push_or_rebase_async()
+
+    async def _commit_async(self, written: List[str]) -> bool:
+        with self._phase('commit'):
+            return await self._async_git.commit(self._COMMIT_MESSAGE, written)
+
+    async def _push_or_rebase_async(self) -> int:
+        with self._phase('push'):
+            return await self._async_git.push_or_rebase()
+
+
+class AsyncGitThread:  # pylint: disable=too-many-instance-attributes
+    """Asyncio counterpart of GitThread, must be used from the event loop.
+
+    Batches of a repo are serialized with a per-repo lock, while any number of repos
+    run concurrently. Git commands talking to remotes are limited by a global semaphore.
+    """
+
+    def __init__(
+        self,
+        git_task_handler: AsyncGitTaskHandler,
+        coalescing: CoalescingPolicy = CoalescingPolicy(),
+        *,
+        stats: Optional[RepoStats] = None,
+        backlog: Optional[Backlog] = None,
+        wal: Optional[WriteAheadLog] = None,
+        tracer: Optional[Tracer] = None,
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        self._handler = git_task_handler
+        self._coalescing = coalescing
+        self._stats = stats or RepoStats()
+        self._backlog = backlog or Backlog(QueueLimits.max_tasks, QueueLimits.max_bytes)
+        self._wal = wal
+        self._tracer = tracer
+        self._lock = asyncio.Lock()
+        self._queued: Deque[WriteTask] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_at: Optional[float] = None
+        self._jobs: Set[asyncio.Task] = set()
+        self._running = True
+        self._failed = False
+        self._last_active = time.monotonic()
+
+    def push_soon(
+        self, rel_path: str, text: str, repo: str = '', accepted_at: float = 0.0
+    ) -> Optional[Future]:
+        """Queue the submission or raise QueueFullError if the backlog is over the limits.
+
+        Repo is the URL the submission was made to, if it differs from the URL of the queue.
+        Accepted_at is the monotonic time its request was accepted, for tracing.
+        With a write-ahead log, returns a future resolved once the submission is on disk.
+        """
+        if not self.is_running:
+            raise errors.QueueFullError("Repository is unavailable", is_global=True)
+        task = WriteTask(
+            rel_path=rel_path,
+            text=text,
+            repo=repo,
+            queued_at=time.monotonic(),
+            trace_id=self._tracer.new_trace_id() if self._tracer is not None else '',
+            accepted_at=accepted_at,
+        )
+        self._backlog.reserve(_size(text))
+        durable = None
+        if self._wal is not None:
+            try:
+                record, durable = self._wal.append(task)
+            except OSError:
+                self._backlog.release(_size(text))
+                raise
+            task = replace(task, wal_record=record)
+        self._enqueue(task)
+        return durable
+
+    def clone_soon(self, url: str) -> None:
+        self._spawn(self._clone(CloneTask(url=url)))
+
+    def recover(self) -> int:
+        """Queue submissions left in the write-ahead log by a previous process."""
+        if self._wal is None:
+            return 0
+        recovered = self._wal.replay()
+        for record, task in recovered:
+            self._backlog.reserve(_size(task.text), force=True)
+            self._enqueue(replace(task, queued_at=time.monotonic(), wal_record=record))
+        if recovered:
+            LOG.info("Recovered %d queued submission(s) from the write-ahead log", len(recovered))
+        return len(recovered)
+
+    def stop(self, block: bool = True, timeout: float = 0.0) -> None:
+        """Flush queued tasks regardless of the coalescing window.
+
+        Never blocks the event loop, await drain() to wait for the flush.
+        """
+        del block, timeout
+        self._running = False
+        self._reschedule()
+
+    async def drain(self) -> None:
+        while self._jobs:
+            await asyncio.gather(*self._jobs, return_exceptions=True)
+
+    def close(self) -> None:
+        self.stop()
+        self._handler.close()
+        if self._wal is not None:
+            self._wal.close()
+
+    @property
+    def is_running(self) -> bool:
+        return self._running and not self._failed
+
+    @property
+    def idle_since(self) -> Optional[float]:
+        if self._queued or self._jobs or self._lock.locked():
+            return None
+        return self._last_active
+
+    @property
+    def stats(self) -> RepoStats:
+        return self._stats
+
+    @property
+    def depth(self) -> QueueDepth:
+        return QueueDepth(
+            tasks=self._backlog.tasks,
+            bytes=self._backlog.bytes,
+            age=time.monotonic() - self._queued[0].queued_at if self._queued else 0.0,
+        )
+
+    def _enqueue(self, task: WriteTask) -> None:
+        self._queued.append(task)
+        self._reschedule()
+
+    def _reschedule(self) -> None:
+        """Flush when the coalescing window closes, or right away if the batch is full."""
+        if not self._queued:
+            return
+        if not self._running or self._is_batch_full():
+            self._schedule(0)
+        else:
+            deadline = self._queued[0].queued_at + self._coalescing.max_latency
+            self._schedule(deadline - time.monotonic())
+
+    def _schedule(self, delay: float) -> None:
+        flush_at = time.monotonic() + max(delay, 0)
+        if self._flush_at is not None and self._flush_at <= flush_at:
+            # The flush is already due earlier, or waits for the lock.
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._flush_at = flush_at
+        if delay > 0:
+            self._timer = asyncio.get_running_loop().call_later(delay, self._start_flush)
+        else:
+            self._spawn(self._flush())
+
+    def _start_flush(self) -> None:
+        self._timer = None
+        self._spawn(self._flush())
+
+    def _spawn(self, coroutine) -> None:
+        job = asyncio.ensure_future(coroutine)
+        self._jobs.add(job)
+        job.add_done_callback(self._jobs.discard)
+
+    async def _clone(self, clone_task: CloneTask) -> None:
+        async with self._lock:
+            try:
+                await self._handler.handle_clone_async(clone_task)
+            except Exception as exc:  # pylint: disable=broad-except
+                LOG.exception("Git task failed, dropping the queue")
+                self._stats.count_error(exc)
+                self._fail()
+
+    async def _flush(self) -> None:
+        async with self._lock:
+            self._flush_at = None
+            tasks = self._take()
+            try:
+                await self._handle_batch(tasks)
+            except Exception as exc:  # pylint: disable=broad-except
+                LOG.exception("Git task failed, dropping the queue")
+                self._stats.count_error(exc)
+                self._fail()
+            self._last_active = time.monotonic()
+        self._reschedule()
+
+    async def _handle_batch(self, tasks: List[WriteTask]) -> None:
+        if not tasks or self._failed:
+            return
+        now = time.monotonic()
+        self._stats.batch_size.observe(len(tasks))
+        for task in tasks:
+            self._stats.wait_seconds.observe(now - task.queued_at)
+        try:
+            await self._handler.handle_writes_async(tasks)
+        except errors.UserFacingError as exc:
+            LOG.warning("Batch of %d submission(s) partially rejected: %s", len(tasks), exc)
+        except errors.UnpushedError:
+            # Replaying them would commit them twice.
+            self._complete(tasks)
+            raise
+        self._complete(tasks)
+
+    def _complete(self, tasks: List[WriteTask]) -> None:
+        if self._wal is not None:
+            self._wal.complete(task.wal_record for task in tasks)
+
+    def _take(self) -> List[WriteTask]:
+        tasks: List[WriteTask] = []
+        size = 0
+        while self._queued and len(tasks) < self._coalescing.max_tasks:
+            if size >= self._coalescing.max_bytes:
+                break
+            task = self._queued.popleft()
+            tasks.append(task)
+            size += _size(task.text)
+            self._backlog.release(_size(task.text))
+        return tasks
+
+    def _fail(self) -> None:
+        self._failed = True
+        for task in self._queued:
+            self._backlog.release(_size(task.text))
+        self._queued.clear()
+
+    def _is_batch_full(self) -> bool:
+        return (
+            self._backlog.tasks >= self._coalescing.max_tasks
+            or self._backlog.bytes >= self._coalescing.max_bytes
+        )
@@ -1,27 +1,30 @@
 import hmac
 import logging
-import os
 import re
-from functools import cached_property
-from typing import Dict, cast
+from typing import Dict, Sequence
 
 import jwt
-from cryptography.hazmat.primitives.asymmetric import rsa
-from cryptography.hazmat.primitives.serialization.ssh import load_ssh_private_key
 
 from .authentication_interface import AuthenticationInterface
+from .signing_backends import RSABackend, SigningBackend
 
 LOG = logging.getLogger(__name__)
 
 
 class Authentication(AuthenticationInterface):
-    _ALGORITHM = "RS256"
     _HASH_ALGORITHM = "SHA256"
     _TEMPLATE = 'GFS-JWT:{}'
     _RE_JWT_TOKEN = re.compile('GFS-JWT:([a-zA-Z0-9._-]{32,1000})')
 
-    def __init__(self, private_key_path: str = '') -> None:
-        self._private_key_path = private_key_path or os.path.expanduser("~/.ssh/id_rsa")
+    def __init__(
+        self, private_key_path: str = '', backends: Sequence[SigningBackend] = ()
+    ) -> None:
+        """New tokens are signed by the first backend, any of them can verify a token.
+
+        Without backends, tokens are signed with RS256 using SSH key at ``private_key_path``.
+        """
+        self._backends = list(backends) or [RSABackend(private_key_path)]
+        self._verifiers = {backend.algorithm: backend for backend in self._backends}
 
     def create_token(self, repo: str, path: str, secret: str = '') -> str:
         return self._TEMPLATE.format(self._encode(self._format_payload(repo, path, secret)))
@@ -42,6 +45,8 @@ class Authentication(AuthenticationInterface):
             LOG.debug("Decoded token:  %s", decoded)
         except jwt.exceptions.InvalidSignatureError:
             LOG.exception("Invalid signature")
+        except jwt.exceptions.InvalidTokenError as exc:
+            LOG.warning("Invalid token: %s", exc)
         return False
 
     def _format_payload(self, repo: str, path: str, secret: str) -> Dict[str, str]:
@@ -57,19 +62,12 @@ class Authentication(AuthenticationInterface):
         return result
 
     def _encode(self, payload: Dict[str, str]) -> str:
-        return jwt.encode(
-            payload=payload, key=cast(str, self._private_key), algorithm=self._ALGORITHM
-        )
+        signer = self._backends[0]
+        return jwt.encode(payload=payload, key=signer.signing_key, algorithm=signer.algorithm)
 
     def _decode(self, token: str) -> Dict[str, str]:
-        return jwt.decode(jwt=token, key=cast(str, self._public_key), algorithms=[self._ALGORITHM])
-
-    @cached_property
-    def _private_key(self) -> rsa.RSAPrivateKey:
-        with open(self._private_key_path, "rb") as fobj:
-            # Only RSA supports signing
-            return cast(rsa.RSAPrivateKey, load_ssh_private_key(fobj.read(), password=None))
-
-    @cached_property
-    def _public_key(self) -> rsa.RSAPublicKey:
-        return self._private_key.public_key()
+        algorithm = jwt.get_unverified_header(token).get('alg', '')
+        verifier = self._verifiers.get(algorithm)
+        if verifier is None:
+            raise jwt.exceptions.InvalidAlgorithmError(f"Unsupported algorithm {algorithm!r}")
+        return jwt.decode(jwt=token, key=verifier.verifying_key, algorithms=[algorithm])
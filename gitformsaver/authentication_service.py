@@ -1,11 +1,12 @@
 from dataclasses import dataclass
-from typing import Union
+from typing import Optional, Union
 
 import aiohttp
-import marshmallow
 from aiohttp import web
 
 from .authentication_interface import AuthenticationInterface
+from .control_validator import ControlValidator, Field, ValidationError, format_errors
+from .token_signer import TokenSigner
 
 
 @dataclass(frozen=True)
@@ -15,44 +16,42 @@ class Control:
     secret: str
 
 
-class ControlSchema(marshmallow.Schema):
-    repo = marshmallow.fields.String(required=True)
-    file = marshmallow.fields.String(required=True)
-    secret = marshmallow.fields.String(required=False, load_default='')
-
-    @marshmallow.post_load
-    def make_control(self, data, **kwargs):
-        del kwargs
-        return Control(**data)
+CONTROL_VALIDATOR = ControlValidator(
+    Control,
+    [Field('repo', required=True), Field('file', required=True), Field('secret', default='')],
+    allow_unknown=False,
+)
 
 
 class AuthenticationService:
-    _control_schema = ControlSchema()
+    _control_validator = CONTROL_VALIDATOR
     _HEADERS = {
         'Access-Control-Allow-Origin': '*',
     }
 
-    def __init__(self, authentication: AuthenticationInterface) -> None:
-        self._authentication = authentication
+    def __init__(
+        self, authentication: AuthenticationInterface, signer: Optional[TokenSigner] = None
+    ) -> None:
+        self._signer = signer or TokenSigner(authentication)
 
     async def handle(self, request: aiohttp.web.Request) -> Union[web.HTTPOk, web.HTTPBadRequest]:
         try:
-            control = self._control_schema.load(await request.post())
-        except marshmallow.ValidationError as exc:
-            return web.HTTPBadRequest(
-                headers=self._HEADERS, text=self._format_validation_error(exc)
-            )
+            control = self._control_validator.load(await request.post())
+        except ValidationError as exc:
+            return web.HTTPBadRequest(headers=self._HEADERS, text=format_errors(exc))
         return web.HTTPOk(
             headers=self._HEADERS,
-            text=self._authentication.create_token(
+            text=await self._signer.create_token(
                 repo=control.repo,
                 path=control.file,
                 secret=control.secret,
             ),
         )
 
-    def _format_validation_error(self, exc: marshmallow.ValidationError) -> str:
-        return '\n'.join(f'{key}: {" ".join(values)}' for key, values in exc.messages_dict.items())
-
     def setup(self, app: web.Application) -> None:
         app.router.add_post("/token", self.handle)
+        app.on_shutdown.append(self.on_shutdown)
+
+    async def on_shutdown(self, app: web.Application) -> None:
+        del app
+        self._signer.close()
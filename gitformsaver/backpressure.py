@@ -0,0 +1,63 @@
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from . import errors
+
+
+@dataclass(frozen=True)
+class QueueLimits:
+    max_tasks: int = 10000
+    max_bytes: int = 16 << 20
+    global_max_tasks: int = 100000
+    global_max_bytes: int = 256 << 20
+
+
+@dataclass(frozen=True)
+class QueueDepth:
+    tasks: int
+    bytes: int
+    age: float = 0.0
+
+
+class Backlog:
+    """Thread-safe count of queued submissions and their size, bounded by the limits.
+
+    Reservations in a repo backlog are also made in its parent, the server-wide backlog.
+    """
+
+    def __init__(
+        self, max_tasks: int, max_bytes: int, parent: Optional['Backlog'] = None
+    ) -> None:
+        self._max_tasks = max_tasks
+        self._max_bytes = max_bytes
+        self._parent = parent
+        self._lock = threading.Lock()
+        self.tasks = 0
+        self.bytes = 0
+
+    def reserve(self, size: int, force: bool = False) -> None:
+        """Account for a new submission or raise QueueFullError, unless forced."""
+        with self._lock:
+            # A lone oversized submission is let through, otherwise it would be rejected forever.
+            if not force and self.tasks and (
+                self.tasks >= self._max_tasks or self.bytes + size > self._max_bytes
+            ):
+                raise errors.QueueFullError(
+                    "Too many queued submissions", is_global=self._parent is None
+                )
+            if self._parent is not None:
+                self._parent.reserve(size, force=force)
+            self.tasks += 1
+            self.bytes += size
+
+    def release(self, size: int) -> None:
+        with self._lock:
+            self.tasks -= 1
+            self.bytes -= size
+            if self._parent is not None:
+                self._parent.release(size)
+
+    @property
+    def depth(self) -> QueueDepth:
+        return QueueDepth(tasks=self.tasks, bytes=self.bytes)
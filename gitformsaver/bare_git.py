@@ -0,0 +1,160 @@
+import errno
+import io
+import logging
+import posixpath
+from typing import Dict, List, Mapping, Optional, Tuple, Union
+
+import git
+from git.objects.fun import tree_to_stream
+from gitdb import IStream  # type: ignore[import-untyped]
+
+from .git_client import GitError, GitInterface, appended_by, check_push
+from .ssh_pool import SshConnectionPool
+
+LOG = logging.getLogger(__name__)
+
+_TREE_MODE = 0o040000
+_BLOB_MODE = 0o100644
+# Nested {name: subtree changes or new blob sha} of a single commit.
+_Changes = Dict[str, Union['_Changes', bytes]]
+
+
+class BareGit(GitInterface):  # pylint: disable=abstract-method
+    """Bare repo without a working copy, objects are read and written directly.
+
+    Syncs move the local branch to the remote one and append the texts of unpushed commits
+    to the remote versions of the files again, so on rejection the batch is rebuilt rather
+    than rebased.
+    """
+
+    def __init__(self, repo: git.Repo, connections: Optional[SshConnectionPool] = None) -> None:
+        # pylint: disable=super-init-not-called
+        self._repo = repo
+        self._connections = connections
+
+    def sync(self) -> None:
+        """Move the local branch to the remote one, with unpushed commits applied on top of it.
+
+        Raises GitConflictError if a local commit does more than appending to files.
+        """
+        self._check_connection()
+        try:
+            self._repo.remotes[0].fetch()
+            head = self._repo.head.commit
+            commit = self._repo.commit(self._upstream_ref)
+            for local in self._repo.iter_commits(f'{self._upstream_ref}..HEAD', reverse=True):
+                commit = self._commit_texts(commit, appended_by(local), str(local.message))
+            self._repo.git.update_ref(self._branch_ref, commit.hexsha, head.hexsha)
+        except git.GitCommandError as exc:
+            raise GitError(exc.stderr.strip()) from exc
+
+    def read_header(self, rel_path: str, size: int) -> str:
+        blob = _blob(self._repo.head.commit, rel_path)
+        return blob.data_stream.read(size).decode('utf-8', 'replace')
+
+    def commit_appends(self, appends: Mapping[str, str], commit_message: str) -> bool:
+        """Commit the texts appended to the files, without materializing the tree."""
+        head = self._repo.head.commit
+        texts = {rel_path: text.encode('utf-8') for rel_path, text in appends.items()}
+        commit = self._commit_texts(head, texts, commit_message)
+        if commit == head:
+            return False
+        self._repo.git.update_ref(self._branch_ref, commit.hexsha, head.hexsha)
+        return True
+
+    def push(self) -> None:
+        self._check_connection()
+        try:
+            push_infos = self._repo.remotes[0].push(f'{self._branch_ref}:{self._branch_ref}')
+        except git.GitCommandError as exc:
+            raise GitError(exc.stderr.strip()) from exc
+        check_push(push_infos)
+
+    def close(self) -> None:
+        """Stop git processes kept running for this repo."""
+        self._repo.close()
+
+    def _commit_texts(
+        self, parent: git.Commit, texts: Mapping[str, bytes], commit_message: str
+    ) -> git.Commit:
+        """Child of the parent appending the texts to its files, the parent if nothing changes."""
+        changes: _Changes = {}
+        for rel_path, text in texts.items():
+            try:
+                data = _blob(parent, rel_path).data_stream.read() + text
+            except FileNotFoundError:
+                LOG.warning("Dropping %d bytes appended to removed %s", len(text), rel_path)
+                continue
+            *dirs, name = rel_path.split('/')
+            node = changes
+            for dir_name in dirs:
+                node = node.setdefault(dir_name, {})  # type: ignore[assignment]
+            node[name] = self._store('blob', data)
+        tree_sha = self._write_tree(parent.tree, changes)
+        if tree_sha == parent.tree.binsha:
+            return parent
+        return git.Commit.create_from_tree(
+            self._repo, git.Tree(self._repo, tree_sha, _TREE_MODE, ''), commit_message, [parent]
+        )
+
+    def _write_tree(self, tree: Optional[git.Tree], changes: _Changes) -> bytes:
+        entries: Dict[str, Tuple[bytes, int]] = {}
+        if tree is not None:
+            entries = {item.name: (item.binsha, item.mode) for item in tree}
+        for name, change in changes.items():
+            if isinstance(change, dict):
+                subtree = _subtree(tree, name)
+                entries[name] = (self._write_tree(subtree, change), _TREE_MODE)
+            else:
+                entries[name] = (change, entries.get(name, (b'', _BLOB_MODE))[1])
+        ordered: List[Tuple[bytes, int, str]] = sorted(
+            ((sha, mode, name) for name, (sha, mode) in entries.items()),
+            # Git sorts trees as if their names ended with a slash.
+            key=lambda entry: entry[2] + ('/' if entry[1] == _TREE_MODE else ''),
+        )
+        stream = io.BytesIO()
+        tree_to_stream(ordered, stream.write)
+        return self._store('tree', stream.getvalue())
+
+    def _check_connection(self) -> None:
+        if self._connections is not None:
+            self._connections.check(self._repo.remotes[0].url)
+
+    def _store(self, kind: str, data: bytes) -> bytes:
+        return self._repo.odb.store(IStream(kind, len(data), io.BytesIO(data))).binsha
+
+    @property
+    def _branch_ref(self) -> str:
+        return self._repo.head.ref.path
+
+    @property
+    def _upstream_ref(self) -> str:
+        return f'refs/remotes/{self._repo.remotes[0].name}/{self._repo.head.ref.name}'
+
+
+def normalize_path(rel_path: str) -> Optional[str]:
+    """Path inside the repo tree, or None if it points outside of it."""
+    path = posixpath.normpath(rel_path.lstrip('/'))
+    if path in ('.', '..') or path.startswith('../'):
+        return None
+    return path
+
+
+def _blob(commit: git.Commit, rel_path: str) -> git.Blob:
+    try:
+        blob = commit.tree / rel_path
+    except KeyError as exc:
+        raise FileNotFoundError(errno.ENOENT, "No such file or directory") from exc
+    if not isinstance(blob, git.Blob):
+        raise IsADirectoryError(errno.EISDIR, "Is a directory")
+    return blob
+
+
+def _subtree(tree: Optional[git.Tree], name: str) -> Optional[git.Tree]:
+    if tree is None:
+        return None
+    try:
+        item = tree / name
+    except KeyError:
+        return None
+    return item if isinstance(item, git.Tree) else None
@@ -0,0 +1,351 @@
+"""Load generator running the real app against local bare repos served by git daemon.
+
+Every repo gets a form file headed with a valid token. Submissions carry unique markers,
+and the remotes are polled for them to measure how long a submission takes to show up.
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import os
+import re
+import secrets
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field, replace
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import aiohttp
+from aiohttp import web
+
+from .http_server import make_authentication, setup_app
+from .settings import Settings
+
+LOG = logging.getLogger(__name__)
+FORM_FILE = 'form.md'
+_MARKER = re.compile(r'bench-(\d+)')
+_PUSHES = re.compile(r'^gitformsaver_git_duration_seconds_count\{.*phase="push"\} (\d+)$', re.M)
+_GIT_IDENTITY = {
+    'GIT_AUTHOR_NAME': 'Bench',
+    'GIT_AUTHOR_EMAIL': 'bench@localhost',
+    'GIT_COMMITTER_NAME': 'Bench',
+    'GIT_COMMITTER_EMAIL': 'bench@localhost',
+}
+
+
+@dataclass(frozen=True)
+class BenchConfig:
+    repos: int = 4
+    requests: int = 1000
+    concurrency: int = 32
+    # Share of the requests going to /token instead of /
+    token_share: float = 0.1
+    visibility_timeout: float = 60.0
+    poll_interval: float = 0.1
+
+
+@dataclass
+class RouteResult:
+    requests: int = 0
+    errors: int = 0
+    p50_ms: float = 0.0
+    p99_ms: float = 0.0
+
+
+@dataclass
+class BenchResult:  # pylint: disable=too-many-instance-attributes
+    config: BenchConfig
+    duration_seconds: float
+    requests_per_second: float
+    routes: Dict[str, RouteResult]
+    commits: int
+    pushes: int
+    visibility_lag_p50_ms: float
+    visibility_lag_p99_ms: float
+    visibility_lag_max_ms: float
+    # Accepted submissions that didn't reach the remote within the visibility timeout
+    invisible: int
+
+
+@dataclass
+class _Load:
+    latencies: Dict[str, List[float]] = field(default_factory=lambda: {'/': [], '/token': []})
+    errors: Dict[str, int] = field(default_factory=lambda: {'/': 0, '/token': 0})
+    # Monotonic send time of accepted submissions by marker
+    sent: Dict[int, float] = field(default_factory=dict)
+    # Monotonic time the marker was first seen in the remote
+    visible: Dict[int, float] = field(default_factory=dict)
+
+
+async def run_benchmark(config: BenchConfig, root: str, settings: Settings) -> BenchResult:
+    """Serve repos from root/remotes, keep working copies in root/work and run the load."""
+    settings = replace(
+        settings, signing_algorithms=('HS256',), signing_secret=secrets.token_hex(16)
+    )
+    remotes_dir = os.path.join(root, 'remotes')
+    work_dir = os.path.join(root, 'work')
+    os.makedirs(remotes_dir)
+    os.makedirs(work_dir)
+    with git_daemon(remotes_dir) as url_prefix, _working_directory(work_dir), _git_identity():
+        remotes = make_remotes(
+            remotes_dir, url_prefix, config.repos, make_authentication(settings).create_token
+        )
+        app = setup_app(web.Application(), settings)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        try:
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            host, port = runner.addresses[0][:2]
+            return await _measure(config, f'http://{host}:{port}', remotes)
+        finally:
+            await runner.cleanup()
+
+
+async def _measure(config: BenchConfig, base_url: str, remotes: Dict[str, str]) -> BenchResult:
+    load = _Load()
+    done = asyncio.Event()
+    watcher = asyncio.ensure_future(_watch(list(remotes.values()), load, done, config))
+    async with aiohttp.ClientSession() as session:
+        started_at = time.monotonic()
+        await _send(session, config, base_url, list(remotes), load)
+        duration = time.monotonic() - started_at
+        done.set()
+        await watcher
+        async with session.get(f'{base_url}/metrics') as response:
+            metrics = await response.text()
+    lags = sorted(
+        load.visible[marker] - sent for marker, sent in load.sent.items() if marker in load.visible
+    )
+    commits = sum([await _count_commits(path) for path in remotes.values()])
+    return BenchResult(
+        config=config,
+        duration_seconds=duration,
+        requests_per_second=config.requests / duration if duration else 0.0,
+        routes={
+            route: RouteResult(
+                requests=len(latencies) + load.errors[route],
+                errors=load.errors[route],
+                p50_ms=_percentile(sorted(latencies), 0.5) * 1000,
+                p99_ms=_percentile(sorted(latencies), 0.99) * 1000,
+            )
+            for route, latencies in load.latencies.items()
+        },
+        commits=commits,
+        pushes=sum(int(count) for count in _PUSHES.findall(metrics)),
+        visibility_lag_p50_ms=_percentile(lags, 0.5) * 1000,
+        visibility_lag_p99_ms=_percentile(lags, 0.99) * 1000,
+        visibility_lag_max_ms=(lags[-1] if lags else 0.0) * 1000,
+        invisible=len(load.sent) - len(lags),
+    )
+
+
+async def _send(
+    session: aiohttp.ClientSession,
+    config: BenchConfig,
+    base_url: str,
+    urls: Sequence[str],
+    load: _Load,
+) -> None:
+    """Send the requests from concurrent workers, spreading /token requests evenly."""
+    # pylint: disable=too-many-arguments
+    counter = itertools.count()
+
+    async def worker() -> None:
+        while (number := next(counter)) < config.requests:
+            repo = urls[number % len(urls)]
+            is_token = int((number + 1) * config.token_share) > int(number * config.token_share)
+            route = '/token' if is_token else '/'
+            data = {'repo': repo, 'file': FORM_FILE}
+            if not is_token:
+                data['marker'] = f'bench-{number}'
+            started_at = time.monotonic()
+            try:
+                async with session.post(
+                    base_url + route,
+                    data=data,
+                    headers={'Referer': 'http://localhost/'},
+                    allow_redirects=False,
+                ) as response:
+                    await response.read()
+                    status = response.status
+            except aiohttp.ClientError as exc:
+                LOG.warning("Request to %s failed: %s", route, exc)
+                status = 0
+            if status != (200 if is_token else 302):
+                load.errors[route] += 1
+                continue
+            load.latencies[route].append(time.monotonic() - started_at)
+            if not is_token:
+                load.sent[number] = started_at
+
+    await asyncio.gather(*(worker() for _ in range(config.concurrency)))
+
+
+async def _watch(paths: Sequence[str], load: _Load, done: asyncio.Event, config: BenchConfig):
+    """Poll the remotes for markers until all sent ones are seen or the timeout expires."""
+    deadline: Optional[float] = None
+    while True:
+        for path in paths:
+            text = await _git_output(path, 'cat-file', 'blob', f'HEAD:{FORM_FILE}')
+            now = time.monotonic()
+            for match in _MARKER.finditer(text):
+                load.visible.setdefault(int(match.group(1)), now)
+        if done.is_set():
+            deadline = deadline or time.monotonic() + config.visibility_timeout
+            if load.sent.keys() <= load.visible.keys() or time.monotonic() > deadline:
+                return
+        await asyncio.sleep(config.poll_interval)
+
+
+async def _count_commits(path: str) -> int:
+    """Commits pushed on top of the initial one."""
+    return int(await _git_output(path, 'rev-list', '--count', 'HEAD')) - 1
+
+
+async def _git_output(git_dir: str, *args: str) -> str:
+    process = await asyncio.create_subprocess_exec(
+        'git',
+        f'--git-dir={git_dir}',
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    stdout, _ = await process.communicate()
+    return stdout.decode('utf-8', 'replace')
+
+
+@contextlib.contextmanager
+def git_daemon(base_path: str) -> Iterator[str]:
+    """Serve the bare repos in base_path over git:// with pushes enabled, yield the URL prefix."""
+    port = _free_port()
+    with subprocess.Popen(
+        [
+            'git',
+            'daemon',
+            '--reuseaddr',
+            '--export-all',
+            '--enable=receive-pack',
+            f'--base-path={base_path}',
+            '--listen=127.0.0.1',
+            f'--port={port}',
+            base_path,
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    ) as process:
+        try:
+            _wait_for_port(port)
+            yield f'git://127.0.0.1:{port}'
+        finally:
+            process.terminate()
+
+
+def make_remotes(base_path: str, url_prefix: str, count: int, create_token) -> Dict[str, str]:
+    """Create bare repos with a form file headed by its token, return their paths by URL."""
+    remotes = {}
+    for index in range(count):
+        name = f'repo{index}.git'
+        url = f'{url_prefix}/{name}'
+        path = os.path.join(base_path, name)
+        _git(base_path, 'init', '--quiet', '--bare', '--initial-branch=main', path)
+        content = f'# Benchmark form\n\n{create_token(url, FORM_FILE)}\n\n'
+        blob = _git(path, 'hash-object', '-w', '--stdin', stdin=content)
+        tree = _git(path, 'mktree', stdin=f'100644 blob {blob}\t{FORM_FILE}\n')
+        commit = _git(path, 'commit-tree', tree, '-m', 'Initial commit')
+        _git(path, 'update-ref', 'refs/heads/main', commit)
+        remotes[url] = path
+    return remotes
+
+
+def _git(cwd: str, *args: str, stdin: Optional[str] = None) -> str:
+    return subprocess.run(
+        ['git', *args],
+        cwd=cwd,
+        input=stdin,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+@contextlib.contextmanager
+def _working_directory(path: str) -> Iterator[None]:
+    """Working copies are cloned relative to the current directory."""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+@contextlib.contextmanager
+def _git_identity() -> Iterator[None]:
+    """Commits of the server need an author, even where git has none configured."""
+    previous = {name: os.environ.get(name) for name in _GIT_IDENTITY}
+    os.environ.update(_GIT_IDENTITY)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
+
+
+def _percentile(sorted_values: Sequence[float], quantile: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * quantile), len(sorted_values) - 1)]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    default = BenchConfig()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repos', type=int, default=default.repos)
+    parser.add_argument('--requests', type=int, default=default.requests)
+    parser.add_argument('--concurrency', type=int, default=default.concurrency)
+    parser.add_argument('--token-share', type=float, default=default.token_share)
+    parser.add_argument('--visibility-timeout', type=float, default=default.visibility_timeout)
+    parser.add_argument('--output', help="File to save the results to as JSON")
+    args = parser.parse_args(argv)
+    config = BenchConfig(
+        repos=args.repos,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        token_share=args.token_share,
+        visibility_timeout=args.visibility_timeout,
+    )
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory(prefix='gfs-bench-') as root:
+        result = asyncio.run(run_benchmark(config, root, Settings.from_env()))
+    text = json.dumps(asdict(result), indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fobj:
+            fobj.write(text + '\n')
+    sys.stdout.write(text + '\n')
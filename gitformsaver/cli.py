@@ -2,16 +2,25 @@ import sys
 import logging
 from aiohttp import web
 
-from .http_server import setup_app
-from .authentication import Authentication
+from . import bench, multiprocess_server
+from .http_server import make_authentication, setup_app
+from .settings import Settings
 
 
 def generate_token() -> None:
     logging.basicConfig(level=logging.DEBUG)
     repo, path = sys.argv[1:3]
-    print(Authentication().create_token(repo, path))
+    print(make_authentication(Settings.from_env()).create_token(repo, path))
 
 
 def run_http_server():
     logging.basicConfig(level=logging.INFO)
-    web.run_app(setup_app(web.Application()))
+    settings = Settings.from_env()
+    if settings.http_workers:
+        multiprocess_server.serve(settings)
+    else:
+        web.run_app(setup_app(web.Application(), settings))
+
+
+def run_benchmark():
+    bench.main(sys.argv[1:])
@@ -0,0 +1,257 @@
+"""Serving repos from several nodes behind one load balancer.
+
+A node writes to a repo only while it holds the lease on its repo_key(), and forwards the
+submissions of repos leased by other nodes to them. Repos nobody holds go to the node
+preferred by a consistent hash of the live nodes, which takes the lease. When nodes join or
+leave, the preference changes and nodes hand over idle repos they aren't preferred for.
+
+If a lease is lost, e.g. to a paused node, two nodes may push to the repo for a while,
+which git resolves by rejecting and rebasing the later push.
+
+Forwarded submissions are signed with the secret shared by the nodes, since they're
+accepted on the public port.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar, Union
+
+import aiohttp
+from aiohttp import web
+
+from . import errors
+from .backpressure import QueueDepth
+from .git_thread_manager import AnyGitThread, GitThreadManager
+from .leases import Lease, LeaseBackendInterface
+from .metrics import RepoStats
+from .repo_key import repo_key
+from .sharding import DeferredGitThread, HashRing, RemoteGitThread, accept_forwarded
+
+LOG = logging.getLogger(__name__)
+_T = TypeVar('_T')
+FORWARD_PATH = '/cluster/submit'
+
+
+class ClusterGitThreadManager:  # pylint: disable=too-many-instance-attributes
+    """Stands in for GitThreadManager, which handles the repos leased by this node.
+
+    The node is named by the URL the other nodes reach it at, and signs the submissions it
+    forwards to them with the secret.
+    """
+
+    def __init__(
+        self,
+        git_thread_manager: GitThreadManager,
+        backend: LeaseBackendInterface,
+        node: str,
+        *,
+        lease_ttl: float = 30.0,
+        clock: Callable[[], float] = time.time,
+        secret: bytes = b'',
+    ) -> None:
+        # pylint: disable=too-many-arguments
+        self._git_thread_manager = git_thread_manager
+        self._backend = backend
+        self._node = node
+        self._lease_ttl = lease_ttl
+        self._clock = clock
+        self._secret = secret
+        # Expiry of the leases held by this node
+        self._held: Dict[str, float] = {}
+        # Leases of other nodes, remembered for a maintenance interval at most
+        self._remote: Dict[str, Lease] = {}
+        self._ring = HashRing([node])
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Lease backend calls from the event loop run one at a time on this thread
+        self._leases = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='leases')
+        self._maintainer: Optional['asyncio.Task[None]'] = None
+
+    def __call__(self, repo: str) -> Union[AnyGitThread, RemoteGitThread, DeferredGitThread]:
+        """Git thread of the repo, deferred to its first push if the lease isn't known."""
+        owner = self._known_owner(repo_key(repo) or repo)
+        if owner is None:
+            return DeferredGitThread(self._resolve, repo)
+        return self._git_thread(repo, owner)
+
+    def local(self, repo: str) -> Union[AnyGitThread, DeferredGitThread]:
+        """Git thread of a repo forwarded to this node, which never forwards it further."""
+        if self._holds(repo_key(repo) or repo):
+            return self._git_thread_manager(repo)
+        return DeferredGitThread(self._resolve_local, repo)
+
+    @property
+    def held(self) -> List[str]:
+        return sorted(self._holds_keys())
+
+    @property
+    def depth(self) -> QueueDepth:
+        return self._git_thread_manager.depth
+
+    def queue_depths(self) -> Dict[str, QueueDepth]:
+        return self._git_thread_manager.queue_depths()
+
+    def stats(self) -> Dict[str, RepoStats]:
+        return self._git_thread_manager.stats()
+
+    def recover(self) -> None:
+        """Join the cluster and recover write-ahead logs of the repos this node can lease.
+
+        Runs on startup, before serving, so it waits for the lease backend in place.
+        """
+        self.maintain()
+        self._git_thread_manager.recover(owns=self._can_own)
+        self._maintainer = asyncio.ensure_future(self._maintain_periodically())
+
+    def stop(self) -> None:
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+        self._git_thread_manager.stop()
+
+    async def drain(self) -> None:
+        """Leave the cluster once queued submissions are pushed."""
+        await self._git_thread_manager.drain()
+        await self._in_lease_thread(self._backend.leave, self._node)
+        self._held.clear()
+        self._leases.shutdown()
+        if self._session is not None:
+            await self._session.close()
+
+    def maintain(self) -> None:
+        """Heartbeat, renew leases and hand over the idle repos other nodes are preferred for."""
+        keys = self._holds_keys()
+        self._release(self._hand_over(keys, *self._renew(keys)))
+
+    def owner(self, repo: str) -> str:
+        """Node to handle the repo, the lease is taken if it's this node."""
+        key = repo_key(repo) or repo
+        return self._known_owner(key) or self._record(self._fetch(key))
+
+    async def _resolve(self, repo: str) -> Union[AnyGitThread, RemoteGitThread]:
+        key = repo_key(repo) or repo
+        owner = self._known_owner(key) or self._record(
+            await self._in_lease_thread(self._fetch, key)
+        )
+        return self._git_thread(repo, owner)
+
+    async def _resolve_local(self, repo: str) -> AnyGitThread:
+        key = repo_key(repo) or repo
+        if not self._holds(key):
+            lease = await self._in_lease_thread(
+                self._backend.acquire, key, self._node, self._lease_ttl
+            )
+            if self._record(lease) != self._node:
+                raise errors.QueueFullError(f"{repo} is moving to another node", is_global=True)
+        return self._git_thread_manager(repo)
+
+    def _git_thread(self, repo: str, owner: str) -> Union[AnyGitThread, RemoteGitThread]:
+        if owner == self._node:
+            return self._git_thread_manager(repo)
+        return RemoteGitThread(
+            self._client(), repo, owner.rstrip('/') + FORWARD_PATH, secret=self._secret
+        )
+
+    def _known_owner(self, key: str) -> Optional[str]:
+        """Node holding the lease on the key as far as this node knows, without the backend."""
+        if self._holds(key):
+            return self._node
+        lease = self._remote.get(key)
+        if lease is not None and lease.expires_at > self._clock():
+            return lease.node
+        return None
+
+    def _fetch(self, key: str) -> Lease:
+        """Lease on the key, taken if this node is preferred for it. Calls the backend."""
+        preferred = self._ring.key_owner(key)
+        if preferred == self._node:
+            return self._backend.acquire(key, self._node, self._lease_ttl)
+        return self._backend.lookup(key) or Lease(key, preferred, 0.0)
+
+    def _record(self, lease: Lease) -> str:
+        """Remember the lease until it expires or the next maintenance, return its node."""
+        if lease.node == self._node:
+            self._held[lease.key] = lease.expires_at
+        elif lease.expires_at:
+            self._remote[lease.key] = lease
+        return lease.node
+
+    def _renew(self, keys: List[str]) -> Tuple[List[str], Dict[str, float]]:
+        """Heartbeat and renew the leases on the keys, return live nodes and renewed leases."""
+        self._backend.heartbeat(self._node, self._lease_ttl)
+        nodes = self._backend.nodes()
+        return nodes, self._backend.renew(self._node, keys, self._lease_ttl)
+
+    def _hand_over(
+        self, keys: List[str], nodes: List[str], renewed: Dict[str, float]
+    ) -> List[str]:
+        """Apply the renewal of the keys, unload repos of other nodes and return their keys."""
+        self._ring = HashRing(nodes or [self._node])
+        # Leases taken while the keys were being renewed are kept
+        taken = set(self._holds_keys()) - set(keys)
+        self._held = {**{key: self._held[key] for key in taken}, **renewed}
+        released = []
+        for key in list(self._held):
+            if self._ring.key_owner(key) != self._node and self._git_thread_manager.unload(key):
+                LOG.info("Handing %s over to %s", key, self._ring.key_owner(key))
+                del self._held[key]
+                released.append(key)
+        for key in self._git_thread_manager.repos():
+            if key not in self._held:
+                # Lease was lost, the thread goes once it pushed what it has
+                self._git_thread_manager.unload(key)
+        self._remote.clear()
+        return released
+
+    def _release(self, keys: List[str]) -> None:
+        for key in keys:
+            self._backend.release(key, self._node)
+
+    def _can_own(self, repo: str) -> bool:
+        key = repo_key(repo) or repo
+        return self._holds(key) or self._record(
+            self._backend.acquire(key, self._node, self._lease_ttl)
+        ) == self._node
+
+    def _holds(self, key: str) -> bool:
+        return self._held.get(key, 0.0) > self._clock()
+
+    def _holds_keys(self) -> List[str]:
+        now = self._clock()
+        return [key for key, expires_at in self._held.items() if expires_at > now]
+
+    def _client(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def _in_lease_thread(self, function: Callable[..., _T], *args: Any) -> _T:
+        return await asyncio.get_running_loop().run_in_executor(self._leases, function, *args)
+
+    async def _maintain_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._lease_ttl / 3)
+            try:
+                keys = self._holds_keys()
+                renewal = await self._in_lease_thread(self._renew, keys)
+                await self._in_lease_thread(self._release, self._hand_over(keys, *renewal))
+            except Exception:  # pylint: disable=broad-except
+                LOG.exception("Cluster maintenance failed")
+
+
+class ClusterService:
+    """Accepts submissions forwarded by other nodes, signed with the secret if it's set."""
+
+    def __init__(self, cluster: ClusterGitThreadManager, secret: bytes = b'') -> None:
+        self._cluster = cluster
+        self._secret = secret
+
+    async def handle_submit(self, request: web.Request) -> web.Response:
+        return await accept_forwarded(request, self._cluster.local, self._secret)
+
+    async def handle_leases(self, request: web.Request) -> web.Response:
+        del request
+        return web.json_response({'leases': self._cluster.held})
+
+    def setup(self, app: web.Application) -> None:
+        app.router.add_post(FORWARD_PATH, self.handle_submit)
+        app.router.add_get('/cluster/leases', self.handle_leases)
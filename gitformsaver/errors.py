@@ -1,2 +1,22 @@
 class UserFacingError(Exception):
     pass
+
+
+class FormTooLargeError(UserFacingError):
+    """Submitted form exceeds one of the size limits."""
+
+    def __init__(self, message: str, limit: int) -> None:
+        self.limit = limit
+        super().__init__(message)
+
+
+class QueueFullError(Exception):
+    """Submission doesn't fit into the queue of the repo, or of the whole server."""
+
+    def __init__(self, message: str, is_global: bool = False) -> None:
+        self.is_global = is_global
+        super().__init__(message)
+
+
+class UnpushedError(Exception):
+    """Submissions were committed to the local copy, but not pushed. The next push sends them."""
@@ -0,0 +1,122 @@
+from dataclasses import dataclass, field
+from typing import Collection, Dict, List, Tuple
+from urllib.parse import unquote_to_bytes
+
+from aiohttp import BodyPartReader, web
+
+from . import errors
+
+Pairs = List[Tuple[str, str]]
+_CHUNK_SIZE = 1 << 16
+
+
+@dataclass(frozen=True)
+class FormLimits:
+    max_field_bytes: int = 64 << 10
+    max_form_bytes: int = 1 << 20
+    max_fields: int = 1000
+
+
+@dataclass
+class Form:
+    """First value of each control field, and all other fields in the order of submission."""
+
+    controls: Dict[str, str] = field(default_factory=dict)
+    pairs: Pairs = field(default_factory=list)
+
+
+class _FormBuilder:
+    def __init__(self, control_fields: Collection[str], limits: FormLimits) -> None:
+        self.form = Form()
+        self._control_fields = control_fields
+        self._limits = limits
+        self._size = 0
+        self._fields = 0
+
+    def consume(self, size: int) -> None:
+        self._size += size
+        if self._size > self._limits.max_form_bytes:
+            raise errors.FormTooLargeError(
+                f"Form is larger than {self._limits.max_form_bytes} bytes",
+                self._limits.max_form_bytes,
+            )
+
+    def check_field(self, size: int) -> None:
+        if size > self._limits.max_field_bytes:
+            raise errors.FormTooLargeError(
+                f"Form field is larger than {self._limits.max_field_bytes} bytes",
+                self._limits.max_field_bytes,
+            )
+
+    def add(self, name: str, value: str) -> None:
+        self._fields += 1
+        if self._fields > self._limits.max_fields:
+            raise errors.FormTooLargeError(
+                f"Form has more than {self._limits.max_fields} fields", self._limits.max_fields
+            )
+        if name in self._control_fields:
+            self.form.controls.setdefault(name, value)
+        else:
+            self.form.pairs.append((name, value))
+
+
+async def parse_form(
+    request: web.Request, control_fields: Collection[str], limits: FormLimits
+) -> Form:
+    """Read urlencoded or multipart form chunk by chunk, never holding more than the limits.
+
+    Raises FormTooLargeError when a limit is exceeded, and UserFacingError on malformed forms.
+    Uploaded files are skipped, other content types give an empty form.
+    """
+    builder = _FormBuilder(control_fields, limits)
+    if request.content_type == 'multipart/form-data':
+        await _parse_multipart(request, builder)
+    elif request.content_type in ('', 'application/x-www-form-urlencoded'):
+        await _parse_urlencoded(request, builder)
+    return builder.form
+
+
+async def _parse_urlencoded(request: web.Request, builder: _FormBuilder) -> None:
+    charset = request.charset or 'utf-8'
+    tail = b''
+    async for chunk in request.content.iter_chunked(_CHUNK_SIZE):
+        builder.consume(len(chunk))
+        *fields, tail = (tail + chunk).split(b'&')
+        for raw_field in fields:
+            _add_urlencoded(builder, raw_field, charset)
+        builder.check_field(len(tail))
+    _add_urlencoded(builder, tail.rstrip(), charset)
+
+
+def _add_urlencoded(builder: _FormBuilder, raw_field: bytes, charset: str) -> None:
+    builder.check_field(len(raw_field))
+    if not raw_field:
+        return
+    name, _, value = raw_field.partition(b'=')
+    builder.add(_unquote(name, charset), _unquote(value, charset))
+
+
+def _unquote(raw: bytes, charset: str) -> str:
+    return unquote_to_bytes(raw.replace(b'+', b' ')).decode(charset, 'replace')
+
+
+async def _parse_multipart(request: web.Request, builder: _FormBuilder) -> None:
+    try:
+        reader = await request.multipart()
+        while (part := await reader.next()) is not None:
+            if not isinstance(part, BodyPartReader):
+                raise errors.UserFacingError("Nested multipart forms aren't supported")
+            raw = bytearray()
+            while chunk := await part.read_chunk(_CHUNK_SIZE):
+                builder.consume(len(chunk))
+                if part.filename:
+                    continue
+                builder.check_field(len(raw) + len(chunk))
+                raw.extend(chunk)
+            if not part.filename:
+                # Transfer and content encodings don't split on chunks, decode the whole field.
+                value = part.decode(raw)
+                builder.check_field(len(value))
+                builder.add(part.name or '', value.decode(part.get_charset('utf-8'), 'replace'))
+    except ValueError as exc:
+        raise errors.UserFacingError(f"Malformed multipart form: {exc}") from exc
@@ -1,17 +1,28 @@
-from dataclasses import dataclass
-from typing import List, Mapping, Optional, Tuple, Union
+import asyncio
+import time
+from dataclasses import asdict, dataclass
+from typing import Mapping, Optional, Union
 
 import aiohttp
-import marshmallow
 from aiohttp import web
-from multidict import MultiDictProxy
 
+from . import errors
+from .control_validator import (
+    ControlValidator,
+    EnumField,
+    Field,
+    URLField,
+    ValidationError,
+    format_errors,
+)
+from .form_parser import Form, FormLimits, Pairs, parse_form
 from .formatters import Formatter, FormatterInterface
+from .cluster import ClusterGitThreadManager
 from .git_thread_manager import GitThreadManager
+from .sharding import ShardedGitThreadManager
 
 FORMS_REPO_PATH = "forms"
 FORM_FILE_PATH = "README.md"
-Pairs = List[Tuple[str, str]]
 
 
 @dataclass(frozen=True)
@@ -29,70 +40,122 @@ class Payload:
     error: str
 
 
-class ControlSchema(marshmallow.Schema):
-    class Meta:
-        unknown = marshmallow.EXCLUDE
-
-    repo = marshmallow.fields.String(required=True)
-    file = marshmallow.fields.String(required=True)
-    formatter = marshmallow.fields.Enum(Formatter, load_default=Formatter.PLAIN_TEXT)
-    redirect = marshmallow.fields.URL()
-
-    @marshmallow.post_load
-    def make_control(self, data, **kwargs):
-        del kwargs
-        return Control(**data)
+CONTROL_VALIDATOR = ControlValidator(
+    Control,
+    [
+        Field('repo', required=True),
+        Field('file', required=True),
+        EnumField('formatter', Formatter, default=Formatter.PLAIN_TEXT),
+        URLField('redirect'),
+    ],
+)
 
 
 class GitFormSaverService:
-    _control_schema = ControlSchema()
+    _control_validator = CONTROL_VALIDATOR
+    _BLOCK_POLL_INTERVAL = 0.05
 
     def __init__(
         self,
-        git_thread_manager: GitThreadManager,
+        git_thread_manager: Union[
+            GitThreadManager, ShardedGitThreadManager, ClusterGitThreadManager
+        ],
         formatters: Mapping[Formatter, FormatterInterface],
+        retry_after: int = 5,
+        block_timeout: float = 0.0,
+        form_limits: FormLimits = FormLimits(),
     ) -> None:
+        """When queues are full, wait up to block_timeout seconds before rejecting."""
+        # pylint: disable=too-many-arguments
         self._git_thread_manager = git_thread_manager
         self._formatters = formatters
+        self._retry_after = retry_after
+        self._block_timeout = block_timeout
+        self._form_limits = form_limits
 
     async def handle(
         self, request: aiohttp.web.Request
-    ) -> Union[web.HTTPFound, web.HTTPBadRequest]:
-        form_data = await request.post()
-        payload = self._parse_data(form_data)
+    ) -> Union[
+        web.HTTPFound,
+        web.HTTPBadRequest,
+        web.HTTPRequestEntityTooLarge,
+        web.HTTPTooManyRequests,
+        web.HTTPServiceUnavailable,
+    ]:
+        accepted_at = time.monotonic()
+        try:
+            form = await parse_form(request, self._control_validator.names, self._form_limits)
+        except errors.FormTooLargeError as exc:
+            return web.HTTPRequestEntityTooLarge(max_size=exc.limit, text=str(exc))
+        except errors.UserFacingError as exc:
+            return web.HTTPBadRequest(text=str(exc))
+        payload = self._parse_data(form)
         if payload.error or not payload.control or not payload.pairs:
             return web.HTTPBadRequest(text=payload.error)
         text = self._formatters[payload.control.formatter](payload.pairs)
         if text:
-            self._git_thread_manager(payload.control.repo).push_soon(payload.control.file, text)
+            try:
+                await self._push(payload.control.repo, payload.control.file, text, accepted_at)
+            except errors.QueueFullError as exc:
+                return self._overloaded(exc)
         return web.HTTPFound(
             payload.control.redirect or request.headers["Referer"]
         )
 
-    def _parse_data(self, form_data: MultiDictProxy) -> Payload:
+    async def handle_queues(self, request: aiohttp.web.Request) -> web.Response:
+        del request
+        return web.json_response(
+            {
+                'total': asdict(self._git_thread_manager.depth),
+                'repos': {
+                    repo: asdict(depth)
+                    for repo, depth in self._git_thread_manager.queue_depths().items()
+                },
+            }
+        )
+
+    async def _push(self, repo: str, rel_path: str, text: str, accepted_at: float) -> None:
+        deadline = time.monotonic() + self._block_timeout
+        while True:
+            try:
+                durable = self._git_thread_manager(repo).push_soon(
+                    rel_path, text, repo=repo, accepted_at=accepted_at
+                )
+                if durable is not None:
+                    await asyncio.wrap_future(durable)
+                return
+            except errors.QueueFullError:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise
+            await asyncio.sleep(min(remaining, self._BLOCK_POLL_INTERVAL))
+
+    def _overloaded(
+        self, exc: errors.QueueFullError
+    ) -> Union[web.HTTPTooManyRequests, web.HTTPServiceUnavailable]:
+        headers = {'Retry-After': str(self._retry_after)}
+        if exc.is_global:
+            return web.HTTPServiceUnavailable(headers=headers, text=str(exc))
+        return web.HTTPTooManyRequests(headers=headers, text=str(exc))
+
+    def _parse_data(self, form: Form) -> Payload:
         try:
-            control, pairs = self._unsafe_parse_data(form_data)
-            return Payload(control=control, pairs=pairs, error='')
-        except marshmallow.ValidationError as exc:
-            return Payload(control=None, pairs=[], error=self._format_validation_error(exc))
-
-    def _unsafe_parse_data(
-        self, form_data: MultiDictProxy
-    ) -> Tuple[Control, List[Tuple[str, str]]]:
-        control = self._control_schema.load(form_data)
-        pairs: List[Tuple[str, str]] = []
-        for key in form_data:
-            if key not in self._control_schema.declared_fields:
-                pairs.extend((key, value) for value in form_data.getall(key))
-        return control, pairs
-
-    def _format_validation_error(self, exc: marshmallow.ValidationError) -> str:
-        return '\n'.join(f'{key}: {" ".join(values)}' for key, values in exc.messages_dict.items())
+            control = self._control_validator.load(form.controls)
+            return Payload(control=control, pairs=form.pairs, error='')
+        except ValidationError as exc:
+            return Payload(control=None, pairs=[], error=format_errors(exc))
 
     def setup(self, app: web.Application) -> None:
         app.router.add_post("/", self.handle)
+        app.router.add_get("/queues", self.handle_queues)
+        app.on_startup.append(self.on_startup)
         app.on_shutdown.append(self.on_shutdown)
 
+    async def on_startup(self, app: web.Application) -> None:
+        del app
+        self._git_thread_manager.recover()
+
     async def on_shutdown(self, app: web.Application) -> None:
         del app
         self._git_thread_manager.stop()
+        await self._git_thread_manager.drain()
@@ -1,5 +1,14 @@
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence
+
 import git
 
+from .ssh_pool import SshConnectionPool
+
+LOG = logging.getLogger(__name__)
+
 
 class GitInterface:
     def push(self):
@@ -8,37 +17,205 @@ class GitInterface:
     def maybe_pull(self) -> None:
         raise NotImplementedError()
 
-    def maybe_push(self, commit_message: str) -> None:
+    def maybe_push(self, commit_message: str, paths: Optional[Sequence[str]] = None) -> None:
+        raise NotImplementedError()
+
+    def commit(self, commit_message: str, paths: Optional[Sequence[str]] = None) -> bool:
+        raise NotImplementedError()
+
+    def push_or_rebase(self) -> int:
+        raise NotImplementedError()
+
+    def reapply_on_upstream(self) -> None:
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        raise NotImplementedError()
+
+    def sync(self) -> None:
+        raise NotImplementedError()
+
+    def read_header(self, rel_path: str, size: int) -> str:
         raise NotImplementedError()
 
+    def commit_appends(self, appends: Mapping[str, str], commit_message: str) -> bool:
+        raise NotImplementedError()
+
+
+class Git(GitInterface):  # pylint: disable=abstract-method
+    _PUSH_BACKOFF = 0.1
 
-class Git(GitInterface):
-    def __init__(self, repo: git.Repo) -> None:
+    def __init__(
+        self,
+        repo: git.Repo,
+        max_push_retries: int = 3,
+        connections: Optional[SshConnectionPool] = None,
+    ) -> None:
         self._repo = repo
+        self._max_push_retries = max_push_retries
+        self._connections = connections
+        # Set once everything written to the working copy is known to be committed,
+        # so that pulls don't have to scan it.
+        self._known_clean = False
 
     def push(self):
+        self._check_connection()
         try:
-            self._repo.remotes[0].push()
+            push_infos = self._repo.remotes[0].push()
         except git.GitCommandError as exc:
             raise GitError(exc.stderr.strip()) from exc
+        check_push(push_infos)
 
     def maybe_pull(self) -> None:
         """Download remote changes if copy is clean."""
-        if self._is_clean():
+        if self._known_clean or self._is_clean():
+            self._check_connection()
             self._repo.remotes[0].pull()
 
-    def maybe_push(self, commit_message: str) -> None:
+    def maybe_push(self, commit_message: str, paths: Optional[Sequence[str]] = None) -> None:
         """Add-commit-push changes."""
-        self._repo.git.add(A=True)
-        if not self._is_clean():
-            self._repo.index.commit(commit_message)
+        if self.commit(commit_message, paths):
             self.push()
 
+    def commit(self, commit_message: str, paths: Optional[Sequence[str]] = None) -> bool:
+        """Commit all changes, or only the paths, return False if there was nothing to commit."""
+        self._known_clean = False
+        if paths is None:
+            committed = self._commit_all(commit_message)
+        else:
+            committed = self._commit_paths(commit_message, paths)
+        self._known_clean = True
+        return committed
+
+    def push_or_rebase(self) -> int:
+        """Push local commits, rebasing them onto remote ones if the push is rejected.
+
+        Returns the number of retries it took.
+        Raises GitConflictError if local commits can't be rebased.
+        """
+        for attempt in range(self._max_push_retries + 1):
+            try:
+                self.push()
+                return attempt
+            except PushRejectedError:
+                if attempt == self._max_push_retries:
+                    raise
+            if attempt:
+                time.sleep(self._PUSH_BACKOFF * 2 ** (attempt - 1))
+            self._rebase()
+        return self._max_push_retries
+
+    def reapply_on_upstream(self) -> None:
+        """Replace local commits by ones appending the same texts to the upstream files.
+
+        Raises GitConflictError if a local commit does more than appending to files.
+        """
+        appends = [
+            (str(commit.message), appended_by(commit))
+            for commit in self._repo.iter_commits('@{upstream}..HEAD', reverse=True)
+        ]
+        self._repo.git.reset('--hard', '@{upstream}')
+        self._known_clean = True
+        for commit_message, texts in appends:
+            paths = write_appends(str(self._repo.working_tree_dir or ''), texts)
+            if paths:
+                self.commit(commit_message, paths)
+
+    def close(self) -> None:
+        """Stop git processes kept running for this repo."""
+        self._repo.close()
+
+    def _commit_all(self, commit_message: str) -> bool:
+        self._repo.git.add(A=True)
+        if self._is_clean():
+            return False
+        self._repo.index.commit(commit_message)
+        return True
+
+    def _commit_paths(self, commit_message: str, paths: Sequence[str]) -> bool:
+        """Commit the files with plumbing commands, without scanning the working copy.
+
+        Only the index entries of the paths are refreshed, and write-tree rebuilds
+        only the trees containing them, so the cost doesn't depend on the repo size.
+        """
+        root = os.path.realpath(self._repo.working_tree_dir or '')
+        rel_paths = [os.path.relpath(path, root) for path in paths]
+        self._repo.git.update_index('--add', '--', *rel_paths)
+        tree = self._repo.git.write_tree()
+        parent = self._repo.git.rev_parse('HEAD')
+        if tree == self._repo.git.rev_parse('HEAD^{tree}'):
+            return False
+        commit = self._repo.git.commit_tree(tree, '-p', parent, '-m', commit_message)
+        self._repo.git.update_ref('-m', f'commit: {commit_message}', 'HEAD', commit, parent)
+        return True
+
+    def _rebase(self) -> None:
+        self._check_connection()
+        self._repo.remotes[0].fetch()
+        try:
+            self._repo.git.rebase('@{upstream}')
+        except git.GitCommandError as exc:
+            self._repo.git.rebase('--abort')
+            raise GitConflictError(exc.stderr.strip()) from exc
+
     def _is_clean(self) -> bool:
         return not self._repo.is_dirty()
 
+    def _check_connection(self) -> None:
+        if self._connections is not None:
+            self._connections.check(self._repo.remotes[0].url)
+
+
+def check_push(push_infos: Iterable[git.PushInfo]) -> None:
+    """Raise if any ref wasn't pushed, GitPython doesn't do it itself."""
+    for push_info in push_infos:
+        if push_info.flags & git.PushInfo.REJECTED:
+            raise PushRejectedError(push_info.summary.strip())
+        if push_info.flags & (git.PushInfo.REMOTE_REJECTED | git.PushInfo.ERROR):
+            raise GitError(push_info.summary.strip())
+
+
+def appended(rel_path: str, old: bytes, new: bytes) -> bytes:
+    """Text appended to the file, raise GitConflictError if it was changed otherwise."""
+    if not new.startswith(old):
+        raise GitConflictError(f"Local commit does more than appending to {rel_path}")
+    return new[len(old) :]
+
+
+def write_appends(root: str, appends: Mapping[str, bytes]) -> List[str]:
+    """Append texts to the files of the working copy, return paths of the written ones."""
+    paths = []
+    for rel_path, text in appends.items():
+        path = os.path.join(os.path.realpath(root), rel_path)
+        if not os.path.isfile(path):
+            LOG.warning("Dropping %d bytes appended to %s, removed upstream", len(text), rel_path)
+            continue
+        with open(path, 'ab') as fobj:
+            fobj.write(text)
+        paths.append(path)
+    return paths
+
+
+def appended_by(commit: git.Commit) -> Dict[str, bytes]:
+    """Texts appended to the files by the commit, see appended."""
+    texts = {}
+    for diff in commit.parents[0].diff(commit):
+        old = diff.a_blob.data_stream.read() if diff.a_blob else b''
+        new = diff.b_blob.data_stream.read() if diff.b_blob else b''
+        rel_path = diff.b_path or diff.a_path or ''
+        texts[rel_path] = appended(rel_path, old, new)
+    return texts
+
 
 class GitError(RuntimeError):
     def __init__(self, stderr: str) -> None:
         self.stderr = stderr
         super().__init__(stderr)
+
+
+class PushRejectedError(GitError):
+    """Remote has commits missing in the local copy."""
+
+
+class GitConflictError(GitError):
+    """Local commits conflict with remote ones."""
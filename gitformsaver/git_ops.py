@@ -1,9 +1,13 @@
 import os
 import shutil
 import logging
+from typing import Any, Dict, Optional
 
 import git
-from .git_client import Git
+from .bare_git import BareGit
+from .git_client import Git, GitInterface
+from .reference_store import ReferenceStore
+from .ssh_pool import SshConnectionPool, SshStats
 
 _HERE = os.path.dirname(__file__)
 _SSH_EXECUTABLE = os.path.join(_HERE, 'ssh.sh')
@@ -11,19 +15,133 @@ LOG = logging.getLogger(__name__)
 
 
 class GitOps:
-    def __init__(self, private_key_path: str = '') -> None:
+    def __init__(
+        self,
+        private_key_path: str = '',
+        shallow: bool = True,
+        max_push_retries: int = 3,
+        *,
+        bare: bool = False,
+        reference_store: Optional[ReferenceStore] = None,
+        connections: Optional[SshConnectionPool] = None,
+    ) -> None:
+        """Bare repos have no working copy, only the objects.
+
+        With a reference store, new clones borrow objects from the store of their host.
+        With a connection pool, SSH sessions to the same host share a connection.
+        """
+        # pylint: disable=too-many-arguments
         self._private_key_path = private_key_path
+        self._shallow = shallow
+        self._max_push_retries = max_push_retries
+        self._bare = bare
+        self._reference_store = reference_store
+        self._connections = connections
+
+    def clone(self, url: str, to_path: str) -> GitInterface:
+        """Update existing working copy of the url, or clone it from scratch."""
+        repo = self._reuse(url, to_path)
+        if repo is None:
+            repo = self._clone(url, to_path)
+        return self._wrap(repo)
+
+    def existing(self, path: str) -> GitInterface:
+        LOG.info("Loading existing repo from %s", path)
+        return self._wrap(git.Repo(path=path))
+
+    def close(self) -> None:
+        if self._connections is not None:
+            self._connections.close()
+
+    @property
+    def ssh_stats(self) -> Optional[SshStats]:
+        return self._connections.stats if self._connections is not None else None
+
+    def _wrap(self, repo: git.Repo) -> GitInterface:
+        # Pulls and pushes need the same SSH setup as clones.
+        repo.git.update_environment(**self._git_env)
+        if repo.bare:
+            return BareGit(repo, connections=self._connections)
+        return Git(repo, max_push_retries=self._max_push_retries, connections=self._connections)
+
+    def _reuse(self, url: str, to_path: str) -> Optional[git.Repo]:
+        try:
+            repo = git.Repo(path=to_path)
+        except (git.InvalidGitRepositoryError, git.NoSuchPathError):
+            return None
+        if repo.bare != self._bare or not repo.remotes or repo.remotes[0].url != url:
+            LOG.info("Directory %s doesn't hold a working copy of %s", to_path, url)
+            return None
+        # The copy may hold commits which weren't pushed, so it's never re-cloned from now on.
+        try:
+            LOG.info("Fast-forwarding existing working copy of %s in %s", url, to_path)
+            self._check_connection(url)
+            with repo.git.custom_environment(**self._git_env):
+                repo.remotes[0].fetch()
+        except git.GitCommandError as exc:
+            raise git.GitError(exc.stderr.strip()) from exc
+        if not repo.bare:
+            _fast_forward(repo, to_path)
+        return repo
 
-    def clone(self, url: str, to_path: str) -> Git:
-        git_env = {'GIT_SSH': _SSH_EXECUTABLE} if self._private_key_path else {}
+    def _clone(self, url: str, to_path: str) -> git.Repo:
         shutil.rmtree(to_path, ignore_errors=True)
+        self._check_connection(url)
+        options: Dict[str, Any] = {}
+        if self._reference_store is not None:
+            # All objects are already local, history costs nothing but a few refs.
+            options['reference'] = self._reference_store.update(url, self._git_env)
+        elif self._shallow:
+            options = {'depth': 1, 'single_branch': True}
+            if not self._bare:
+                # Bare repos read the files they append to, without blobs each read is a fetch.
+                options['filter'] = 'blob:none'
+        if self._bare:
+            options['bare'] = True
         try:
             LOG.info("Cloning %s to %s", url, to_path)
-            repo = git.Repo.clone_from(url=url, to_path=to_path, env=git_env)
+            repo = git.Repo.clone_from(url=url, to_path=to_path, env=self._git_env, **options)
         except git.GitCommandError as exc:
             raise git.GitError(exc.stderr.strip()) from exc
-        return Git(repo)
+        if self._bare:
+            # Bare clones don't track remote branches by default.
+            branch = repo.head.ref.name
+            with repo.config_writer() as config:
+                config.set_value(
+                    'remote "origin"', 'fetch', f'+refs/heads/{branch}:refs/remotes/origin/{branch}'
+                )
+        return repo
 
-    def existing(self, path: str) -> Git:
-        LOG.info("Loading existing repo from %s", path)
-        return Git(repo=git.Repo(path=path))
+    def _check_connection(self, url: str) -> None:
+        if self._connections is not None:
+            self._connections.check(url)
+
+    @property
+    def _git_env(self) -> Dict[str, str]:
+        return ssh_env(self._private_key_path, self._connections)
+
+
+def _fast_forward(repo: git.Repo, to_path: str) -> None:
+    """Bring the working copy up to upstream, rebasing its unpushed commits onto it."""
+    try:
+        repo.git.merge('--ff-only', '@{upstream}')
+        return
+    except git.GitCommandError:
+        LOG.warning("Rebasing unpushed commits of %s onto upstream", to_path)
+    try:
+        repo.git.rebase('@{upstream}')
+    except git.GitCommandError as exc:
+        if os.path.isdir(os.path.join(repo.git_dir, 'rebase-merge')):
+            repo.git.rebase('--abort')
+        LOG.error("Working copy %s needs manual repair: %s", to_path, exc.stderr.strip())
+        raise git.GitError(f"Can't rebase unpushed commits of {to_path}") from exc
+
+
+def ssh_env(private_key_path: str, connections: Optional[SshConnectionPool]) -> Dict[str, str]:
+    """Environment making git connect through ssh.sh with the key and the connection pool."""
+    env: Dict[str, str] = {}
+    if private_key_path:
+        env.update(GIT_SSH=_SSH_EXECUTABLE, DIARY_ID_RSA=private_key_path)
+    if connections is not None:
+        env.update(GIT_SSH=_SSH_EXECUTABLE, **connections.env())
+    return env
@@ -1,20 +1,38 @@
+import contextlib
 import logging
 import os
+import time
 from dataclasses import dataclass
-from typing import Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
 
 from . import errors
 from .authentication_interface import AuthenticationInterface
+from .bare_git import normalize_path
+from .git_client import GitConflictError, PushRejectedError
 from .lazy_git import LazyGit
+from .metrics import RepoStats
+from .token_cache import TokenCache
+from .tracing import Stage, Tracer
 
 LOG = logging.getLogger(__name__)
+# Texts by (rel_path, secret, repo URL)
+_Groups = Dict[Tuple[str, str, str], List[str]]
+# Modification time in ns and size of a file
+_Version = Tuple[int, int]
 
 
 @dataclass(frozen=True)
-class WriteTask:
+class WriteTask:  # pylint: disable=too-many-instance-attributes
     rel_path: str
     text: str
     secret: str = ''
+    repo: str = ''
+    queued_at: float = 0.0
+    # Segment and number of the record in the write-ahead log
+    wal_record: Tuple[int, int] = (-1, -1)
+    trace_id: str = ''
+    # Monotonic time the HTTP request of the submission was accepted at
+    accepted_at: float = 0.0
 
 
 @dataclass(frozen=True)
@@ -28,25 +46,254 @@ class GitTask:
     clone_task: Optional[CloneTask] = None
 
 
-class GitTaskHandler:
+@dataclass
+class _Target:
+    """Validated target file, trusted without reading it until the working copy is updated."""
+
+    path: str
+    header: str
+    token: str
+    # None when the file can't be checked for foreign changes
+    version: Optional[_Version]
+    generation: int
+
+
+class GitTaskHandler:  # pylint: disable=too-many-instance-attributes
     _COMMIT_MESSAGE = "Save form submission"
+    _HEADER_SIZE = 2048
+    _MAX_REAPPLIES = 3
 
-    def __init__(self, git: LazyGit, repo: str, authentication: AuthenticationInterface) -> None:
+    def __init__(
+        self,
+        git: LazyGit,
+        repo: str,
+        authentication: AuthenticationInterface,
+        *,
+        token_cache: Optional[TokenCache] = None,
+        optimistic: bool = False,
+        stats: Optional[RepoStats] = None,
+        tracer: Optional[Tracer] = None,
+    ) -> None:
+        """In optimistic mode, writes go to the local copy without pulling first.
+
+        The remote changes are only fetched when the push is rejected.
+        With a tracer, the stages of each batch are recorded as spans of its submissions.
+        """
+        # pylint: disable=too-many-arguments
         self._git = git
         self._repo = repo
         self._authentication = authentication
+        # An empty cache is falsy, so it's compared to None
+        self._token_cache = token_cache if token_cache is not None else TokenCache()
+        self._optimistic = optimistic
+        self._stats = stats or RepoStats()
+        self._tracer = tracer
+        # Stages of the current batch, when it's traced
+        self._stages: Optional[List[Stage]] = None
+        # Index of the target files by rel_path, and the number of working copy updates
+        # after which its entries have to be checked for changes.
+        self._targets: Dict[str, _Target] = {}
+        self._generation = 0
+        # URLs the submissions to this repo were made with.
+        self._repos: Set[str] = {repo}
 
     def handle_clone(self, clone_task: CloneTask) -> None:
-        self._git.clone(clone_task.url)
+        with self._phase('clone'):
+            self._git.clone(clone_task.url)
+
+    def close(self) -> None:
+        self._git.close()
 
     def handle_write(self, write_task: WriteTask) -> None:
-        self._pull()
-        is_ok, path = self._normalize_path(write_task.rel_path)
-        if is_ok:
-            token = self._read_token(path)
-            self._validate_token(token, write_task.rel_path, secret=write_task.secret)
-            self._write(path, write_task.text)
-            self._push()
+        self.handle_writes([write_task])
+
+    def handle_writes(self, write_tasks: Sequence[WriteTask]) -> None:
+        """Append all tasks to their files with a single pull, commit and push.
+
+        Every target file is validated once. Submissions to the files that fail validation
+        are dropped, the rest is still pushed, and the first failure is raised afterwards.
+        """
+        groups = self._group(write_tasks)
+        with self._traced(write_tasks):
+            if self._optimistic:
+                written, failures = self._append(groups)
+                if written:
+                    self._commit_and_push(written)
+            else:
+                with self._phase('pull'):
+                    self._git.maybe_pull()
+                self._invalidate_targets()
+                written, failures = self._append(groups)
+                if written and self._commit(written):
+                    with self._phase('push'), self._unpushed_on_failure():
+                        self._git.push()
+        if failures:
+            raise failures[0]
+
+    def _append(self, groups: _Groups) -> Tuple[List[str], List[errors.UserFacingError]]:
+        """Append texts to valid targets, return paths of the written files and failures."""
+        appends: List[Tuple[_Target, str]] = []
+        failures: List[errors.UserFacingError] = []
+        with self._phase('validate'):
+            for (rel_path, secret, repo), texts in groups.items():
+                try:
+                    target = self._target(rel_path)
+                    if target is None:
+                        continue
+                    self._verify(target, rel_path, secret, repo)
+                except errors.UserFacingError as exc:
+                    LOG.warning("Rejected %d submission(s) to %s: %s", len(texts), rel_path, exc)
+                    failures.append(exc)
+                    continue
+                appends.append((target, "".join(texts)))
+        with self._phase('write'):
+            for target, text in appends:
+                target.version = self._write(target.path, text)
+                self._remember_append(target, text)
+        return [target.path for target, _ in appends], failures
+
+    def _commit_and_push(self, written: List[str]) -> None:
+        self._commit(written)
+        with self._unpushed_on_failure():
+            retries = self._push_reapplying()
+        if retries:
+            # Rebased onto the remote changes
+            self._invalidate_targets()
+        self._stats.push_retries += retries
+
+    def _push_reapplying(self) -> int:
+        """Push local commits, re-applying them on top of the remote ones if they conflict.
+
+        Remote changed the end of the same file. Appends don't depend on the previous contents,
+        so all unpushed commits, not only the one of this batch, are redone instead of merged.
+        """
+        for _ in range(self._MAX_REAPPLIES):
+            try:
+                return self._push_or_rebase()
+            except GitConflictError as exc:
+                self._stats.push_conflicts += 1
+                LOG.warning("Re-applying local commits on top of remote changes: %s", exc.stderr)
+            with self._phase('pull'):
+                self._git.reapply_on_upstream()
+            self._invalidate_targets()
+        return self._push_or_rebase()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _unpushed_on_failure() -> Iterator[None]:
+        """Failures of pushing committed submissions, which stay in the local commits."""
+        try:
+            yield
+        except Exception as exc:
+            raise errors.UnpushedError(str(exc)) from exc
+
+    @contextlib.contextmanager
+    def _phase(self, name: str) -> Iterator[None]:
+        """Observe the duration of a stage of git task, and trace it with its batch."""
+        start_ns = time.monotonic_ns()
+        try:
+            yield
+        finally:
+            end_ns = time.monotonic_ns()
+            getattr(self._stats, f'{name}_seconds').observe((end_ns - start_ns) / 1e9)
+            if self._stages is not None:
+                self._stages.append(Stage(name, start_ns, end_ns))
+
+    @contextlib.contextmanager
+    def _traced(self, write_tasks: Sequence[WriteTask]) -> Iterator[None]:
+        if self._tracer is None:
+            yield
+            return
+        self._stages = []
+        try:
+            yield
+        finally:
+            stages, self._stages = self._stages, None
+            self._tracer.record_batch(self._repo, write_tasks, stages, time.monotonic_ns())
+
+    def _commit(self, written: List[str]) -> bool:
+        with self._phase('commit'):
+            return self._git.commit(self._COMMIT_MESSAGE, written)
+
+    def _push_or_rebase(self) -> int:
+        with self._phase('push'):
+            return self._git.push_or_rebase()
+
+    def _group(self, write_tasks: Sequence[WriteTask]) -> _Groups:
+        """Group texts by target keeping the order of submissions to each file."""
+        groups: _Groups = {}
+        for task in write_tasks:
+            repo = task.repo or self._repo
+            self._repos.add(repo)
+            groups.setdefault((task.rel_path, task.secret, repo), []).append(task.text)
+        return groups
+
+    def _target(self, rel_path: str) -> Optional[_Target]:
+        """Indexed target file, read again only if the working copy could have changed it.
+
+        Returns None for paths outside of the repo.
+        """
+        target = self._targets.get(rel_path)
+        if target is not None and self._is_current(target):
+            return target
+        self._targets.pop(rel_path, None)
+        is_ok, path = self._normalize_path(rel_path)
+        if not is_ok:
+            return None
+        try:
+            version = self._version(path)
+            header = self._read_header(path)
+        except OSError as exc:
+            raise errors.UserFacingError(f"Couldn't read the file: {exc.strerror}") from exc
+        if target is not None and target.path == path and target.header == header:
+            target.version = version
+            target.generation = self._generation
+        else:
+            # The file is new to the index, was replaced or its token was edited (e.g. by a pull).
+            for known_repo in self._repos:
+                self._token_cache.invalidate(known_repo, rel_path)
+            target = _Target(
+                path=path,
+                header=header,
+                token=self._extract_token(header),
+                version=version,
+                generation=self._generation,
+            )
+        self._targets[rel_path] = target
+        return target
+
+    def _is_current(self, target: _Target) -> bool:
+        if target.generation == self._generation:
+            return True
+        if target.version is None:
+            return False
+        try:
+            if self._version(target.path) != target.version:
+                return False
+        except OSError:
+            return False
+        target.generation = self._generation
+        return True
+
+    def _invalidate_targets(self) -> None:
+        """Make the index check its files again after the working copy was updated by git."""
+        self._generation += 1
+
+    def _verify(self, target: _Target, rel_path: str, secret: str, repo: str) -> None:
+        """Tokens are signed for the URL of the repo as it was written in the form.
+
+        Results are only remembered by the token cache, so they expire with its TTL.
+        """
+        is_valid = self._token_cache.get(target.token, repo, rel_path, secret)
+        if is_valid is None:
+            is_valid = self._authentication.is_valid_token(target.token, repo, rel_path, secret)
+            self._token_cache.put(target.token, repo, rel_path, secret, is_valid)
+            if is_valid:
+                self._stats.tokens_valid += 1
+            else:
+                self._stats.tokens_invalid += 1
+        if not is_valid:
+            raise errors.UserFacingError("JWT token verification failed")
 
     def _normalize_path(self, path: str) -> Tuple[bool, str]:
         if os.path.isabs(path):
@@ -58,26 +305,120 @@ class GitTaskHandler:
             return False, ''
         return True, abs_path
 
-    def _read_token(self, path: str) -> str:
+    def _remember_append(self, target: _Target, text: str) -> None:
+        """Keep the indexed header in sync with own writes, so only foreign changes invalidate."""
+        if len(target.header) < self._HEADER_SIZE:
+            target.header = (target.header + text)[: self._HEADER_SIZE]
+
+    def _read_header(self, path: str) -> str:
         with open(path, mode="rt", encoding="utf-8") as fobj:
-            token = self._authentication.extract_token(fobj.read(2048))
+            return fobj.read(self._HEADER_SIZE)
+
+    def _extract_token(self, header: str) -> str:
+        token = self._authentication.extract_token(header)
         if not token:
             raise errors.UserFacingError(
-                "Couldn't find JWT token in the first 2048 bytes of the file"
+                f"Couldn't find JWT token in the first {self._HEADER_SIZE} bytes of the file"
             )
         LOG.debug("Found token: %s", token)
         return token
 
-    def _validate_token(self, token: str, path: str, secret: str) -> None:
-        if not self._authentication.is_valid_token(token, self._repo, path, secret):
-            raise errors.UserFacingError("JWT token verification failed")
+    def _version(self, path: str) -> Optional[_Version]:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
 
-    def _write(self, path: str, text: str) -> None:
+    def _write(self, path: str, text: str) -> Optional[_Version]:
+        """Append the text, return the version of the file after it."""
         with open(path, mode="a", encoding="utf-8") as fobj:
             fobj.write(text)
+            fobj.flush()
+            stat = os.fstat(fobj.fileno())
+        return stat.st_mtime_ns, stat.st_size
+
+
+class BareGitTaskHandler(GitTaskHandler):
+    """GitTaskHandler of a bare repo, files are read from the last commit and appended in memory.
+
+    Syncs apply the local commits again on top of the remote branch, so there's nothing
+    to rebase or merge, and commits left by failed pushes go out with the next batch.
+    """
+
+    def __init__(
+        self,
+        git: LazyGit,
+        repo: str,
+        authentication: AuthenticationInterface,
+        *,
+        token_cache: Optional[TokenCache] = None,
+        optimistic: bool = False,
+        stats: Optional[RepoStats] = None,
+        max_push_retries: int = 3,
+        tracer: Optional[Tracer] = None,
+    ) -> None:
+        """In optimistic mode, the remote branch is only fetched when the push is rejected."""
+        # pylint: disable=too-many-arguments
+        super().__init__(
+            git=git,
+            repo=repo,
+            authentication=authentication,
+            token_cache=token_cache,
+            optimistic=optimistic,
+            stats=stats,
+            tracer=tracer,
+        )
+        self._max_push_retries = max_push_retries
+        self._appends: Dict[str, str] = {}
+
+    def handle_writes(self, write_tasks: Sequence[WriteTask]) -> None:
+        groups = self._group(write_tasks)
+        with self._traced(write_tasks):
+            if not self._optimistic:
+                self._sync()
+            self._appends = {}
+            written, failures = self._append(groups)
+            if written and self._commit_appends():
+                with self._unpushed_on_failure():
+                    self._push_syncing()
+        if failures:
+            raise failures[0]
+
+    def _push_syncing(self) -> None:
+        """Push, moving the local commits on top of the remote branch when it's rejected."""
+        for attempt in range(self._max_push_retries + 1):
+            if attempt:
+                self._stats.push_retries += 1
+                self._sync()
+            try:
+                with self._phase('push'):
+                    self._git.push()
+                return
+            except PushRejectedError:
+                if attempt == self._max_push_retries:
+                    raise
+
+    def _sync(self) -> None:
+        with self._phase('pull'):
+            self._git.sync()
+        self._invalidate_targets()
+
+    def _commit_appends(self) -> bool:
+        with self._phase('commit'):
+            return self._git.commit_appends(self._appends, self._COMMIT_MESSAGE)
+
+    def _normalize_path(self, path: str) -> Tuple[bool, str]:
+        rel_path = normalize_path(path)
+        if rel_path is None:
+            LOG.warning("Haxor detected trying to write outside of the repo: %s", path)
+            return False, ''
+        return True, rel_path
+
+    def _read_header(self, path: str) -> str:
+        return self._git.read_header(path, self._HEADER_SIZE)
 
-    def _pull(self) -> None:
-        self._git.maybe_pull()
+    def _version(self, path: str) -> Optional[_Version]:
+        """Files only change on syncs, which make the index read them again."""
+        return None
 
-    def _push(self) -> None:
-        self._git.maybe_push(self._COMMIT_MESSAGE)
+    def _write(self, path: str, text: str) -> Optional[_Version]:
+        self._appends[path] = self._appends.get(path, '') + text
+        return self._version(path)
@@ -1,68 +1,272 @@
-import queue
+import logging
 import threading
-from typing import Iterable
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, replace
+from typing import Deque, Iterable, List, Optional
 
+from . import errors
+from .backpressure import Backlog, QueueDepth, QueueLimits
 from .git_task_handler import GitTask, WriteTask, CloneTask, GitTaskHandler
+from .metrics import RepoStats
+from .tracing import Tracer
+from .worker_pool import Job, WorkerPool
+from .write_ahead_log import WriteAheadLog
 
+LOG = logging.getLogger(__name__)
+# Seconds to wait for queued submissions to be pushed on shutdown
+SHUTDOWN_TIMEOUT = 5.0
 
-class GitThread:
-    _POLL_TIMEOUT = 1
-    _SHUTDOWN_TIMEOUT = 5
 
-    def __init__(self, git_task_handler: GitTaskHandler) -> None:
+@dataclass(frozen=True)
+class CoalescingPolicy:
+    """Limits of a single commit+push batch.
+
+    The batch is flushed when the oldest queued submission waited ``max_latency`` seconds,
+    or when ``max_tasks`` submissions or ``max_bytes`` of text are queued, whichever comes first.
+    By default submissions aren't held, those arriving while a batch is pushed form the next one.
+    """
+
+    max_latency: float = 0.0
+    max_tasks: int = 1000
+    max_bytes: int = 1 << 20
+
+
+class GitThread(Job):  # pylint: disable=too-many-instance-attributes
+    """Queue of git tasks of a single repo, handled by a worker pool.
+
+    Without a pool, the repo gets a private single-worker one.
+    """
+
+    def __init__(
+        self,
+        git_task_handler: GitTaskHandler,
+        coalescing: CoalescingPolicy = CoalescingPolicy(),
+        *,
+        stats: Optional[RepoStats] = None,
+        backlog: Optional[Backlog] = None,
+        wal: Optional[WriteAheadLog] = None,
+        pool: Optional[WorkerPool] = None,
+        tracer: Optional[Tracer] = None,
+    ) -> None:
+        # pylint: disable=too-many-arguments
         self._handler = git_task_handler
-        self._queue: queue.Queue[GitTask] = queue.Queue()
-        self._thread = threading.Thread(target=self._run_thread)
+        self._coalescing = coalescing
+        self._stats = stats or RepoStats()
+        self._backlog = backlog or Backlog(QueueLimits.max_tasks, QueueLimits.max_bytes)
+        self._wal = wal
+        self._tracer = tracer
+        self._own_pool = pool is None
+        self._pool = pool or WorkerPool(size=1)
+        self._lock = threading.Condition()
+        self._tasks: Deque[GitTask] = deque()
+        self._oldest_queued_at: Optional[float] = None
+        self._in_flight = False
         self._running = True
-        self._thread.start()
+        self._failed = False
+        self._last_active = time.monotonic()
 
-    def push_soon(self, rel_path: str, text: str) -> None:
-        # TODO: Add check that thread is running
-        self._queue.put(GitTask(write_task=WriteTask(rel_path=rel_path, text=text)))
+    def push_soon(
+        self, rel_path: str, text: str, repo: str = '', accepted_at: float = 0.0
+    ) -> Optional[Future]:
+        """Queue the submission or raise QueueFullError if the backlog is over the limits.
+
+        Repo is the URL the submission was made to, if it differs from the URL of the queue.
+        Accepted_at is the monotonic time its request was accepted, for tracing.
+        With a write-ahead log, returns a future resolved once the submission is on disk.
+        """
+        if not self.is_running:
+            raise errors.QueueFullError("Repository is unavailable", is_global=True)
+        task = WriteTask(
+            rel_path=rel_path,
+            text=text,
+            repo=repo,
+            queued_at=time.monotonic(),
+            trace_id=self._tracer.new_trace_id() if self._tracer is not None else '',
+            accepted_at=accepted_at,
+        )
+        self._backlog.reserve(_size(text))
+        durable = None
+        if self._wal is not None:
+            try:
+                record, durable = self._wal.append(task)
+            except OSError:
+                self._backlog.release(_size(text))
+                raise
+            task = replace(task, wal_record=record)
+        self._enqueue(GitTask(write_task=task))
+        return durable
 
     def clone_soon(self, url: str) -> None:
-        self._queue.put(GitTask(clone_task=CloneTask(url=url)))
+        self._enqueue(GitTask(clone_task=CloneTask(url=url)))
 
-    def stop(self, block: bool = True) -> None:
-        self._running = False
-        if not self._thread.is_alive():
-            return
+    def recover(self) -> int:
+        """Queue submissions left in the write-ahead log by a previous process."""
+        if self._wal is None:
+            return 0
+        recovered = self._wal.replay()
+        for record, task in recovered:
+            # Recovered submissions were accepted already, so they bypass the limits.
+            self._backlog.reserve(_size(task.text), force=True)
+            task = replace(task, queued_at=time.monotonic(), wal_record=record)
+            self._enqueue(GitTask(write_task=task))
+        if recovered:
+            LOG.info("Recovered %d queued submission(s) from the write-ahead log", len(recovered))
+        return len(recovered)
+
+    def stop(self, block: bool = True, timeout: float = SHUTDOWN_TIMEOUT) -> None:
+        """Flush queued tasks regardless of the coalescing window.
+
+        Waits up to timeout seconds, submissions that weren't pushed by then
+        are left to the write-ahead log.
+        """
+        with self._lock:
+            self._running = False
+        self._pool.wake(self)
+        deadline = time.monotonic() + timeout
         if block:
-            self._queue.join()
-            self._thread.join(timeout=self._SHUTDOWN_TIMEOUT)
+            with self._lock:
+                while (self._tasks or self._in_flight) and not self._failed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        LOG.warning(
+                            "Stopped with %d submission(s) not pushed", self._backlog.tasks
+                        )
+                        break
+                    self._lock.wait(remaining)
+        if self._own_pool:
+            self._pool.stop(block=block, timeout=max(deadline - time.monotonic(), 0))
+
+    def close(self) -> None:
+        """Stop and release the resources of an idle repo."""
+        self.stop()
+        self._handler.close()
+        if self._wal is not None:
+            self._wal.close()
 
     @property
     def is_running(self) -> bool:
-        return self._running and self._thread.is_alive()
+        return self._running and not self._failed
 
-    def _run_thread(self) -> None:
-        while self._running:
-            try:
-                with self._queue.not_empty:
-                    self._queue.not_empty.wait(timeout=self._POLL_TIMEOUT)
-            except queue.Empty:
-                continue
-            # TODO: Stop _running on error
-            for task in self._batch(self._flush()):
-                self._handler.handle_write(task)
-
-    def _batch(self, tasks: Iterable[WriteTask]) -> Iterable[WriteTask]:
-        rel_path, parts = '', []
+    @property
+    def idle_since(self) -> Optional[float]:
+        """Monotonic time of the last handled batch, None if there are tasks to handle."""
+        with self._lock:
+            if self._tasks or self._in_flight:
+                return None
+            return self._last_active
+
+    @property
+    def stats(self) -> RepoStats:
+        return self._stats
+
+    @property
+    def depth(self) -> QueueDepth:
+        oldest_queued_at = self._oldest_queued_at
+        return QueueDepth(
+            tasks=self._backlog.tasks,
+            bytes=self._backlog.bytes,
+            age=time.monotonic() - oldest_queued_at if oldest_queued_at is not None else 0.0,
+        )
+
+    def next_run(self) -> Optional[float]:
+        """Run when the coalescing window closes, or right away if the batch is full."""
+        with self._lock:
+            if self._failed or not self._tasks:
+                return None
+            if self._tasks[0].clone_task or not self._running or self._is_batch_full():
+                return 0.0
+            if self._oldest_queued_at is None:
+                return 0.0
+            return self._oldest_queued_at + self._coalescing.max_latency
+
+    def run_once(self) -> None:
+        with self._lock:
+            self._in_flight = True
+        try:
+            self._handle_batch(list(self._flush()))
+        except Exception as exc:  # pylint: disable=broad-except
+            LOG.exception("Git task failed, dropping the queue")
+            self._stats.count_error(exc)
+            self._fail()
+        finally:
+            with self._lock:
+                self._in_flight = False
+                self._last_active = time.monotonic()
+                self._lock.notify_all()
+
+    def _enqueue(self, task: GitTask) -> None:
+        with self._lock:
+            if task.write_task and self._oldest_queued_at is None:
+                self._oldest_queued_at = task.write_task.queued_at
+            self._tasks.append(task)
+        when = self.next_run()
+        if when is not None:
+            self._pool.wake(self, when)
+
+    def _fail(self) -> None:
+        with self._lock:
+            self._failed = True
+            for task in self._tasks:
+                if task.write_task:
+                    self._backlog.release(_size(task.write_task.text))
+            self._tasks.clear()
+            self._oldest_queued_at = None
+
+    def _is_batch_full(self) -> bool:
+        return (
+            self._backlog.tasks >= self._coalescing.max_tasks
+            or self._backlog.bytes >= self._coalescing.max_bytes
+        )
+
+    def _handle_batch(self, tasks: List[WriteTask]) -> None:
+        if not tasks:
+            return
+        now = time.monotonic()
+        self._stats.batch_size.observe(len(tasks))
         for task in tasks:
-            if task.rel_path == rel_path:
-                parts.append(task.text)
-            else:
-                if rel_path and parts:
-                    yield WriteTask(rel_path, "".join(parts))
-                rel_path, parts = task.rel_path, [task.text]
-        if rel_path and parts:
-            yield WriteTask(rel_path, "".join(parts))
+            self._stats.wait_seconds.observe(now - task.queued_at)
+        try:
+            self._handler.handle_writes(tasks)
+        except errors.UserFacingError as exc:
+            LOG.warning("Batch of %d submission(s) partially rejected: %s", len(tasks), exc)
+        except errors.UnpushedError:
+            # Replaying them would commit them twice.
+            self._complete(tasks)
+            raise
+        self._complete(tasks)
+
+    def _complete(self, tasks: List[WriteTask]) -> None:
+        if self._wal is not None:
+            self._wal.complete(task.wal_record for task in tasks)
 
     def _flush(self) -> Iterable[WriteTask]:
-        while not self._queue.empty():
-            task = self._queue.get()
-            self._queue.task_done()
+        tasks, size = 0, 0
+        while tasks < self._coalescing.max_tasks and size < self._coalescing.max_bytes:
+            task = self._take()
+            if task is None:
+                break
             if task.clone_task:
                 self._handler.handle_clone(task.clone_task)
             if task.write_task:
+                tasks += 1
+                size += _size(task.write_task.text)
                 yield task.write_task
+
+    def _take(self) -> Optional[GitTask]:
+        with self._lock:
+            if not self._tasks:
+                return None
+            task = self._tasks.popleft()
+            if task.write_task:
+                self._backlog.release(_size(task.write_task.text))
+                self._oldest_queued_at = next(
+                    (queued.write_task.queued_at for queued in self._tasks if queued.write_task),
+                    None,
+                )
+            return task
+
+
+def _size(text: str) -> int:
+    return len(text.encode('utf-8'))
@@ -1,61 +1,230 @@
-import os
+import asyncio
+import logging
 import time
 from dataclasses import dataclass
-from typing import Dict
+from typing import Callable, Dict, List, Optional, Union
 
+from .async_git import AsyncGitOps, AsyncLazyGit
+from .async_git_thread import AsyncGitTaskHandler, AsyncGitThread
 from .authentication_interface import AuthenticationInterface
+from .backpressure import Backlog, QueueDepth
 from .git_ops import GitOps
-from .git_task_handler import GitTaskHandler
-from .git_thread import GitThread
-from .git_url_parse import parse_git_url
+from .git_task_handler import BareGitTaskHandler, GitTaskHandler
+from .git_thread import SHUTDOWN_TIMEOUT, GitThread
 from .lazy_git import LazyGit
+from .metrics import RepoStats
+from .repo_key import repo_key
+from .settings import Settings
+from .token_cache import TokenCache
+from .tracing import Tracer, make_tracer
+from .worker_pool import WorkerPool
+from .write_ahead_log import GroupCommitter, WriteAheadLog, find_logs, log_directory
+
+LOG = logging.getLogger(__name__)
+AnyGitThread = Union[GitThread, AsyncGitThread]
 
 
 @dataclass(frozen=True)
 class ThreadInfo:
     started_at: float
-    git_thread: GitThread
+    git_thread: AnyGitThread
+
+
+class GitThreadManager:  # pylint: disable=too-many-instance-attributes
+    """Creates repo queues on demand and retires the idle ones.
 
+    Repos are keyed by repo_key(), so all URLs of a repo share one queue and working copy,
+    cloned from the first URL seen. Not thread-safe, meant to be called from the event loop.
+    """
 
-class GitThreadManager:
-    def __init__(self, git_ops: GitOps, authentication: AuthenticationInterface) -> None:
+    def __init__(
+        self,
+        git_ops: Union[GitOps, AsyncGitOps],
+        authentication: AuthenticationInterface,
+        settings: Settings = Settings(),
+        token_cache: Optional[TokenCache] = None,
+        tracer: Optional[Tracer] = None,
+    ) -> None:
         self._threads: Dict[str, ThreadInfo] = {}
         self._git_ops = git_ops
         self._authentication = authentication
+        self._settings = settings
+        self._token_cache = (
+            token_cache
+            if token_cache is not None
+            else TokenCache(max_size=settings.token_cache_size, ttl=settings.token_cache_ttl)
+        )
+        self._backlog = Backlog(
+            settings.queue_limits.global_max_tasks, settings.queue_limits.global_max_bytes
+        )
+        self._committer = GroupCommitter() if settings.wal_dir else None
+        self._tracer = tracer or make_tracer(settings.trace_file)
+        self._pool = WorkerPool(settings.git_workers)
+        self._repo_coalescing = {
+            repo_key(url) or url: policy for url, policy in settings.repo_coalescing.items()
+        }
+        self._next_eviction = time.monotonic() + settings.repo_idle_timeout
 
-    def __call__(self, repo: str) -> GitThread:
-        if repo in self._threads and not self._threads[repo].git_thread.is_running:
-            del self._threads[repo]
-        if repo not in self._threads:
-            git_thread = GitThread(
-                GitTaskHandler(
-                    git=LazyGit(self._make_repo_path(repo), self._git_ops),
-                    repo=repo,
-                    authentication=self._authentication,
-                )
-            )
+    def __call__(self, repo: str) -> AnyGitThread:
+        self._evict_idle()
+        key = repo_key(repo) or repo
+        if key in self._threads and not self._threads[key].git_thread.is_running:
+            self._threads.pop(key).git_thread.close()
+        if key not in self._threads:
+            git_thread = self._make_git_thread(repo)
             git_thread.clone_soon(repo)
-            self._threads[repo] = ThreadInfo(started_at=time.time(), git_thread=git_thread)
-        return self._threads[repo].git_thread
+            git_thread.recover()
+            self._threads[key] = ThreadInfo(started_at=time.time(), git_thread=git_thread)
+        return self._threads[key].git_thread
+
+    async def drain(self) -> None:
+        """Wait until stopped repos of the asyncio engine flush their queues.
+
+        Gives up after SHUTDOWN_TIMEOUT, leaving the rest to the write-ahead log.
+        """
+        drains = [
+            thread_info.git_thread.drain()
+            for thread_info in self._threads.values()
+            if isinstance(thread_info.git_thread, AsyncGitThread)
+        ]
+        if not drains:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*drains), SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            LOG.warning("Stopped with submissions not pushed to %d repo(s)", len(drains))
+
+    def recover(self, owns: Optional[Callable[[str], bool]] = None) -> None:
+        """Start threads for repos with submissions left in write-ahead logs.
+
+        Only the repos accepted by owns, if given, when other processes own the rest.
+        """
+        if self._settings.wal_dir:
+            for repo, directory in find_logs(self._settings.wal_dir).items():
+                if owns is not None and not owns(repo):
+                    continue
+                if (repo_key(repo) or repo) in self._threads:
+                    LOG.warning("Skipping write-ahead log %s of another URL of %s", directory, repo)
+                    continue
+                self(repo)
+
+    def repos(self) -> List[str]:
+        """Keys of the loaded repos."""
+        return list(self._threads)
+
+    def unload(self, key: str) -> bool:
+        """Close the repo unless it has submissions to handle, return whether it's unloaded."""
+        thread_info = self._threads.get(key)
+        if thread_info is not None:
+            if thread_info.git_thread.idle_since is None:
+                return False
+            del self._threads[key]
+            thread_info.git_thread.close()
+        return True
+
+    @property
+    def token_cache(self) -> TokenCache:
+        return self._token_cache
+
+    def stats(self) -> Dict[str, RepoStats]:
+        return {repo: info.git_thread.stats for repo, info in self._threads.items()}
+
+    @property
+    def depth(self) -> QueueDepth:
+        """Total number and size of submissions queued across all repos."""
+        return self._backlog.depth
+
+    def queue_depths(self) -> Dict[str, QueueDepth]:
+        return {repo: info.git_thread.depth for repo, info in self._threads.items()}
 
     def stop(self) -> None:
+        """Flush the queues, waiting for them up to SHUTDOWN_TIMEOUT in total."""
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
         for thread_info in self._threads.values():
             thread_info.git_thread.stop(block=False)
         for thread_info in self._threads.values():
-            thread_info.git_thread.stop(block=True)
-
-    def _make_repo_path(self, repo: str) -> str:
-        # pylint: disable=consider-using-f-string
-        parts = parse_git_url(repo)
-        if not parts.resource:
-            # No host
-            return ''
-        if set(parts.protocols) - {'ssh', 'git'}:
-            # Unsupported URL schema
-            return ''
-        path = '{}/{}'.format(parts.resource, parts.pathname.lstrip('/'))
-        canonical_path = os.path.relpath(f'/{path}', '/')
-        prefix = os.path.commonprefix((path, canonical_path))
-        if prefix == path:
-            return path
-        return ''
+            thread_info.git_thread.stop(timeout=max(deadline - time.monotonic(), 0))
+        self._pool.stop(timeout=max(deadline - time.monotonic(), 0))
+        self._git_ops.close()
+        if self._committer is not None:
+            self._committer.stop()
+        if self._tracer is not None:
+            self._tracer.close()
+
+    def _make_git_thread(self, repo: str) -> AnyGitThread:
+        stats = RepoStats()
+        path = repo_key(repo)
+        coalescing = self._repo_coalescing.get(path or repo, self._settings.coalescing)
+        backlog = Backlog(
+            self._settings.queue_limits.max_tasks,
+            self._settings.queue_limits.max_bytes,
+            parent=self._backlog,
+        )
+        if isinstance(self._git_ops, AsyncGitOps):
+            return AsyncGitThread(
+                AsyncGitTaskHandler(
+                    git=AsyncLazyGit(path, self._git_ops),
+                    repo=repo,
+                    authentication=self._authentication,
+                    token_cache=self._token_cache,
+                    optimistic=self._settings.optimistic_push,
+                    stats=stats,
+                    tracer=self._tracer,
+                ),
+                coalescing=coalescing,
+                stats=stats,
+                backlog=backlog,
+                wal=self._make_wal(repo),
+                tracer=self._tracer,
+            )
+        handler: GitTaskHandler
+        if self._settings.bare_storage:
+            handler = BareGitTaskHandler(
+                git=LazyGit(path, self._git_ops),
+                repo=repo,
+                authentication=self._authentication,
+                token_cache=self._token_cache,
+                optimistic=self._settings.optimistic_push,
+                stats=stats,
+                max_push_retries=self._settings.max_push_retries,
+                tracer=self._tracer,
+            )
+        else:
+            handler = GitTaskHandler(
+                git=LazyGit(path, self._git_ops),
+                repo=repo,
+                authentication=self._authentication,
+                token_cache=self._token_cache,
+                optimistic=self._settings.optimistic_push,
+                stats=stats,
+                tracer=self._tracer,
+            )
+        return GitThread(
+            handler,
+            coalescing=coalescing,
+            stats=stats,
+            backlog=backlog,
+            wal=self._make_wal(repo),
+            pool=self._pool,
+            tracer=self._tracer,
+        )
+
+    def _evict_idle(self) -> None:
+        """Close repos which had nothing to do for the idle timeout."""
+        now = time.monotonic()
+        if now < self._next_eviction:
+            return
+        self._next_eviction = now + self._settings.repo_idle_timeout / 2
+        for repo, thread_info in list(self._threads.items()):
+            idle_since = thread_info.git_thread.idle_since
+            if idle_since is not None and now - idle_since >= self._settings.repo_idle_timeout:
+                del self._threads[repo]
+                thread_info.git_thread.close()
+
+    def _make_wal(self, repo: str) -> Optional[WriteAheadLog]:
+        directory = log_directory(self._settings.wal_dir, repo)
+        if directory is None or self._committer is None:
+            return None
+        return WriteAheadLog(
+            directory, repo, self._committer, segment_bytes=self._settings.wal_segment_bytes
+        )
@@ -1,24 +1,181 @@
+import concurrent.futures
+import multiprocessing
+from typing import Mapping, Optional, Sequence, Union
+
 from aiohttp import web
 
+from .async_git import AsyncGitOps
 from .formatters_loader import load_formatters
 from .git_ops import GitOps
 from .git_thread_manager import GitThreadManager
+from .cluster import ClusterGitThreadManager, ClusterService
+from .leases import LeaseBackendInterface, SqliteLeaseBackend
+from .reference_store import ReferenceStore
 from .authentication import Authentication
 from .form_saver_service import GitFormSaverService
 from .authentication_service import AuthenticationService
+from .metrics_service import MetricsService
+from .settings import Settings
+from .sharding import HashRing, OwnerService, ShardedGitThreadManager
+from .ssh_pool import SshConnectionPool
+from .token_signer import SignBatch, TokenSigner, init_worker, sign_in_worker
+from .signing_backends import load_backends
+
+
+def make_authentication(settings: Settings) -> Authentication:
+    return Authentication(
+        backends=load_backends(
+            settings.signing_algorithms,
+            private_key_path=settings.private_key_path,
+            ed25519_key_path=settings.ed25519_key_path,
+            secret=settings.signing_secret,
+        )
+    )
+
+
+def make_connections(settings: Settings) -> Optional[SshConnectionPool]:
+    if not settings.ssh_control_dir:
+        return None
+    return SshConnectionPool(
+        settings.ssh_control_dir,
+        persist=settings.ssh_control_persist,
+        check_interval=settings.ssh_check_interval,
+    )
+
+
+def make_git_ops(settings: Settings) -> Union[GitOps, AsyncGitOps]:
+    if settings.git_engine == 'asyncio':
+        if settings.bare_storage or settings.reference_dir:
+            raise ValueError(
+                "Bare storage and reference store aren't supported by the asyncio git engine"
+            )
+        return AsyncGitOps(
+            private_key_path=settings.private_key_path,
+            shallow=settings.shallow_clone,
+            max_push_retries=settings.max_push_retries,
+            network_concurrency=settings.git_network_concurrency,
+            connections=make_connections(settings),
+        )
+    if settings.git_engine != 'threads':
+        raise ValueError(f"Unknown git engine: {settings.git_engine}")
+    return GitOps(
+        private_key_path=settings.private_key_path,
+        shallow=settings.shallow_clone,
+        max_push_retries=settings.max_push_retries,
+        bare=settings.bare_storage,
+        reference_store=ReferenceStore(settings.reference_dir) if settings.reference_dir else None,
+        connections=make_connections(settings),
+    )
+
+
+def make_git_thread_manager(
+    settings: Settings, authentication: Authentication
+) -> GitThreadManager:
+    return GitThreadManager(
+        git_ops=make_git_ops(settings),
+        authentication=authentication,
+        settings=settings,
+    )
+
+
+def make_token_signer(settings: Settings, authentication: Authentication) -> TokenSigner:
+    executor: Optional[concurrent.futures.Executor] = None
+    sign_batch: Optional[SignBatch] = None
+    if settings.signing_executor == 'process':
+        # Workers load the keys themselves, key objects can't be pickled.
+        executor = concurrent.futures.ProcessPoolExecutor(
+            settings.signing_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=(make_authentication, settings),
+        )
+        sign_batch = sign_in_worker
+    elif settings.signing_executor == 'thread':
+        executor = concurrent.futures.ThreadPoolExecutor(
+            settings.signing_workers, thread_name_prefix='signer'
+        )
+    elif settings.signing_executor:
+        raise ValueError(f"Unknown signing executor: {settings.signing_executor}")
+    return TokenSigner(
+        authentication,
+        executor=executor,
+        sign_batch=sign_batch,
+        max_batch=settings.signing_batch_size,
+        cache_ttl=settings.issued_token_ttl,
+    )
 
 
-def setup_app(app: web.Application) -> web.Application:
-    private_key_path = ""
-    authentication = Authentication(private_key_path=private_key_path)
+def make_lease_backend(settings: Settings) -> LeaseBackendInterface:
+    return SqliteLeaseBackend(settings.cluster_db)
+
+
+def setup_app(app: web.Application, settings: Settings = Settings()) -> web.Application:
+    authentication = make_authentication(settings)
+    git_thread_manager = make_git_thread_manager(settings, authentication)
+    cluster: Optional[ClusterGitThreadManager] = None
+    if settings.cluster_db:
+        if not settings.cluster_address:
+            raise ValueError("Cluster address is required to join a cluster")
+        if not settings.cluster_secret:
+            raise ValueError("Cluster secret is required to join a cluster")
+        secret = settings.cluster_secret.encode('utf-8')
+        cluster = ClusterGitThreadManager(
+            git_thread_manager=git_thread_manager,
+            backend=make_lease_backend(settings),
+            node=settings.cluster_address,
+            lease_ttl=settings.lease_ttl,
+            secret=secret,
+        )
+        ClusterService(cluster=cluster, secret=secret).setup(app)
+    form_saver_service = GitFormSaverService(
+        git_thread_manager=cluster or git_thread_manager,
+        formatters=load_formatters(),
+        retry_after=settings.retry_after,
+        block_timeout=settings.queue_block_timeout,
+        form_limits=settings.form_limits,
+    )
+    authentication_service = AuthenticationService(
+        authentication=authentication, signer=make_token_signer(settings, authentication)
+    )
+    metrics_service = MetricsService(git_thread_manager=git_thread_manager)
+    form_saver_service.setup(app)
+    authentication_service.setup(app)
+    metrics_service.setup(app)
+    return app
+
+
+def setup_front_end_app(
+    app: web.Application, sockets: Mapping[str, str], settings: Settings = Settings()
+) -> web.Application:
+    """Serve forms and tokens, forwarding submissions to git owners listening on sockets."""
+    git_thread_manager = ShardedGitThreadManager(sockets)
     form_saver_service = GitFormSaverService(
-        git_thread_manager=GitThreadManager(
-            git_ops=GitOps(private_key_path=private_key_path),
-            authentication=authentication,
-        ),
+        git_thread_manager=git_thread_manager,
         formatters=load_formatters(),
+        retry_after=settings.retry_after,
+        block_timeout=settings.queue_block_timeout,
+        form_limits=settings.form_limits,
+    )
+    authentication = make_authentication(settings)
+    authentication_service = AuthenticationService(
+        authentication=authentication, signer=make_token_signer(settings, authentication)
     )
-    authentication_service = AuthenticationService(authentication=authentication)
+    metrics_service = MetricsService(git_thread_manager=git_thread_manager)
     form_saver_service.setup(app)
     authentication_service.setup(app)
+    metrics_service.setup(app)
+    return app
+
+
+def setup_owner_app(
+    app: web.Application, name: str, owners: Sequence[str], settings: Settings = Settings()
+) -> web.Application:
+    """Queue submissions forwarded by front ends for the repos owned by name."""
+    git_thread_manager = make_git_thread_manager(settings, make_authentication(settings))
+    owner_service = OwnerService(
+        git_thread_manager=git_thread_manager, ring=HashRing(owners), name=name
+    )
+    metrics_service = MetricsService(git_thread_manager=git_thread_manager)
+    owner_service.setup(app)
+    metrics_service.setup(app)
     return app
@@ -1,7 +1,7 @@
 import os
-from typing import Optional
+from typing import Mapping, Optional, Sequence
 
-from .git_client import GitInterface, Git
+from .git_client import GitInterface
 from .git_ops import GitOps
 
 
@@ -10,7 +10,7 @@ class LazyGit(GitInterface):
         # pylint: disable=super-init-not-called
         self._path = path
         self._git_ops = git_ops
-        self._actual_git: Optional[Git] = None
+        self._actual_git: Optional[GitInterface] = None
 
     def clone(self, url: str) -> None:
         self._actual_git = self._git_ops.clone(url=url, to_path=self._path)
@@ -22,16 +22,44 @@ class LazyGit(GitInterface):
         """Download remote changes if copy is clean."""
         self._git.maybe_pull()
 
-    def maybe_push(self, commit_message: str) -> None:
+    def maybe_push(self, commit_message: str, paths: Optional[Sequence[str]] = None) -> None:
         """Add-commit-push changes."""
-        self._git.maybe_push(commit_message)
+        self._git.maybe_push(commit_message, paths)
+
+    def commit(self, commit_message: str, paths: Optional[Sequence[str]] = None) -> bool:
+        """Commit all changes, or only the paths, return False if there was nothing to commit."""
+        return self._git.commit(commit_message, paths)
+
+    def push_or_rebase(self) -> int:
+        """Push local commits, rebasing them onto remote ones if the push is rejected."""
+        return self._git.push_or_rebase()
+
+    def reapply_on_upstream(self) -> None:
+        """Replace local commits by ones appending the same texts to the upstream files."""
+        self._git.reapply_on_upstream()
+
+    def sync(self) -> None:
+        """Move the local branch of a bare repo to the remote one."""
+        self._git.sync()
+
+    def read_header(self, rel_path: str, size: int) -> str:
+        return self._git.read_header(rel_path, size)
+
+    def commit_appends(self, appends: Mapping[str, str], commit_message: str) -> bool:
+        """Commit the texts appended to the files of a bare repo."""
+        return self._git.commit_appends(appends, commit_message)
+
+    def close(self) -> None:
+        if self._actual_git is not None:
+            self._actual_git.close()
+            self._actual_git = None
 
     @property
     def root(self) -> str:
         return os.path.abspath(self._path)
 
     @property
-    def _git(self) -> Git:
+    def _git(self) -> GitInterface:
         if self._actual_git is None:
             self._actual_git = self._git_ops.existing(self._path)
         return self._actual_git
@@ -0,0 +1,142 @@
+"""Time-bounded leases of repos for nodes of a cluster.
+
+Nodes are named by the URL the others reach them at. A node heartbeats to stay in the
+cluster, and holds a lease on every repo it writes to, renewing it before it expires.
+Expiry is in wall clock seconds, so the clocks of the nodes should be kept in sync.
+"""
+import contextlib
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+
+@dataclass(frozen=True)
+class Lease:
+    key: str
+    node: str
+    expires_at: float
+
+
+class LeaseBackendInterface:
+    def heartbeat(self, node: str, ttl: float) -> None:
+        """Add the node to the cluster or keep it there for another ttl seconds."""
+        raise NotImplementedError()
+
+    def leave(self, node: str) -> None:
+        """Remove the node from the cluster and release its leases."""
+        raise NotImplementedError()
+
+    def nodes(self) -> List[str]:
+        """Nodes which heartbeated within their ttl."""
+        raise NotImplementedError()
+
+    def acquire(self, key: str, node: str, ttl: float) -> Lease:
+        """Lease the key to node, unless another node holds it. Return the current lease."""
+        raise NotImplementedError()
+
+    def lookup(self, key: str) -> Optional[Lease]:
+        """Current lease of the key, None if it's free."""
+        raise NotImplementedError()
+
+    def renew(self, node: str, keys: Sequence[str], ttl: float) -> Dict[str, float]:
+        """Extend the leases of node on the keys, return the new expiry of those still held."""
+        raise NotImplementedError()
+
+    def release(self, key: str, node: str) -> None:
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        raise NotImplementedError()
+
+
+class SqliteLeaseBackend(LeaseBackendInterface):
+    """Leases in a SQLite database shared by the nodes, for tests and nodes on a single host.
+
+    SQLite file locks aren't reliable on network disks, so nodes on several hosts need a
+    backend with a server. Calls block for up to 10 seconds while another node writes.
+    """
+
+    def __init__(self, path: str, clock: Callable[[], float] = time.time) -> None:
+        self._clock = clock
+        # Used from the lease thread of ClusterGitThreadManager, one call at a time.
+        self._db = sqlite3.connect(
+            path, timeout=10.0, isolation_level=None, check_same_thread=False
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS nodes (node TEXT PRIMARY KEY, expires_at REAL NOT NULL)'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS leases '
+            '(key TEXT PRIMARY KEY, node TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    def heartbeat(self, node: str, ttl: float) -> None:
+        self._db.execute(
+            'INSERT OR REPLACE INTO nodes (node, expires_at) VALUES (?, ?)',
+            (node, self._clock() + ttl),
+        )
+
+    def leave(self, node: str) -> None:
+        with self._transaction():
+            self._db.execute('DELETE FROM nodes WHERE node = ?', (node,))
+            self._db.execute('DELETE FROM leases WHERE node = ?', (node,))
+
+    def nodes(self) -> List[str]:
+        rows = self._db.execute(
+            'SELECT node FROM nodes WHERE expires_at > ? ORDER BY node', (self._clock(),)
+        )
+        return [node for (node,) in rows]
+
+    def acquire(self, key: str, node: str, ttl: float) -> Lease:
+        with self._transaction():
+            now = self._clock()
+            current = self._lookup(key, now)
+            if current is not None and current.node != node:
+                return current
+            lease = Lease(key=key, node=node, expires_at=now + ttl)
+            self._db.execute(
+                'INSERT OR REPLACE INTO leases (key, node, expires_at) VALUES (?, ?, ?)',
+                (lease.key, lease.node, lease.expires_at),
+            )
+            return lease
+
+    def lookup(self, key: str) -> Optional[Lease]:
+        return self._lookup(key, self._clock())
+
+    def renew(self, node: str, keys: Sequence[str], ttl: float) -> Dict[str, float]:
+        renewed = {}
+        with self._transaction():
+            now = self._clock()
+            for key in keys:
+                cursor = self._db.execute(
+                    'UPDATE leases SET expires_at = ? '
+                    'WHERE key = ? AND node = ? AND expires_at > ?',
+                    (now + ttl, key, node, now),
+                )
+                if cursor.rowcount:
+                    renewed[key] = now + ttl
+        return renewed
+
+    def release(self, key: str, node: str) -> None:
+        self._db.execute('DELETE FROM leases WHERE key = ? AND node = ?', (key, node))
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _lookup(self, key: str, now: float) -> Optional[Lease]:
+        row = self._db.execute(
+            'SELECT node, expires_at FROM leases WHERE key = ? AND expires_at > ?', (key, now)
+        ).fetchone()
+        return Lease(key=key, node=row[0], expires_at=row[1]) if row else None
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """Write transaction taking the database lock upfront, so that reads in it stay valid."""
+        self._db.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._db.execute('ROLLBACK')
+            raise
+        self._db.execute('COMMIT')
@@ -0,0 +1,99 @@
+import bisect
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Tuple
+
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+GIT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# First stderr pattern found gives the class of a git error.
+GIT_ERROR_CLASSES = (
+    ('rejected', ('[rejected]', 'non-fast-forward', 'fetch first')),
+    ('conflict', ('CONFLICT', 'could not apply', 'Merge conflict')),
+    ('auth', ('Permission denied', 'Authentication failed', 'Host key verification failed')),
+    ('not_found', ('not found', 'does not appear to be a git repository', "couldn't find remote")),
+    (
+        'network',
+        ('Could not resolve host', 'Connection refused', 'timed out', 'Connection reset'),
+    ),
+    ('lock', ('.lock', 'Unable to create')),
+)
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds, last bucket is +Inf."""
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self._bounds = tuple(sorted(buckets))
+        self._counts = [0] * (len(self._bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @property
+    def bounds(self) -> Sequence[float]:
+        return self._bounds
+
+    @property
+    def cumulative_counts(self) -> List[int]:
+        result, total = [], 0
+        for count in self._counts:
+            total += count
+            result.append(total)
+        return result
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+def _git_histogram() -> Histogram:
+    return Histogram(GIT_BUCKETS)
+
+
+@dataclass
+class RepoStats:  # pylint: disable=too-many-instance-attributes
+    batch_size: Histogram = field(default_factory=lambda: Histogram(BATCH_SIZE_BUCKETS))
+    wait_seconds: Histogram = field(default_factory=lambda: Histogram(LATENCY_BUCKETS))
+    push_retries: int = 0
+    push_conflicts: int = 0
+    pull_seconds: Histogram = field(default_factory=_git_histogram)
+    validate_seconds: Histogram = field(default_factory=_git_histogram)
+    write_seconds: Histogram = field(default_factory=_git_histogram)
+    commit_seconds: Histogram = field(default_factory=_git_histogram)
+    push_seconds: Histogram = field(default_factory=_git_histogram)
+    clone_seconds: Histogram = field(default_factory=_git_histogram)
+    tokens_valid: int = 0
+    tokens_invalid: int = 0
+    # Failed git tasks by git_error_class()
+    git_errors: Dict[str, int] = field(default_factory=dict)
+
+    def count_error(self, exc: BaseException) -> None:
+        error_class = git_error_class(str(getattr(exc, 'stderr', '') or exc))
+        self.git_errors[error_class] = self.git_errors.get(error_class, 0) + 1
+
+
+def git_error_class(stderr: str) -> str:
+    for error_class, patterns in GIT_ERROR_CLASSES:
+        if any(pattern in stderr for pattern in patterns):
+            return error_class
+    return 'other'
+
+
+@dataclass
+class HttpStats:
+    # By (method, route)
+    latency: Dict[Tuple[str, str], Histogram] = field(default_factory=dict)
+    # By (method, route, status)
+    responses: Dict[Tuple[str, str, int], int] = field(default_factory=dict)
+
+    def observe(self, method: str, route: str, status: int, seconds: float) -> None:
+        histogram = self.latency.get((method, route))
+        if histogram is None:
+            histogram = self.latency[method, route] = Histogram(LATENCY_BUCKETS)
+        histogram.observe(seconds)
+        key = (method, route, status)
+        self.responses[key] = self.responses.get(key, 0) + 1
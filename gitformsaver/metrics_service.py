@@ -0,0 +1,247 @@
+"""Prometheus text exposition of the submission pipeline at ``GET /metrics``.
+
+Requests only update counters and histograms in memory, the text is built on scrape.
+``GET /stages`` gives the mean time spent in each stage by repo as JSON.
+"""
+import time
+from typing import Awaitable, Callable, Iterable, List, Mapping, Tuple, Union
+
+import aiohttp
+from aiohttp import web
+
+from .git_thread_manager import GitThreadManager
+from .metrics import Histogram, HttpStats, RepoStats
+from .sharding import ShardedGitThreadManager
+
+_Handler = Callable[[web.Request], Awaitable[web.StreamResponse]]
+_Labels = Mapping[str, str]
+_PREFIX = 'gitformsaver'
+_GIT_PHASES = ('pull', 'validate', 'write', 'commit', 'push', 'clone')
+
+
+class MetricsService:
+    _CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(
+        self, git_thread_manager: Union[GitThreadManager, ShardedGitThreadManager]
+    ) -> None:
+        self._git_thread_manager = git_thread_manager
+        self._http = HttpStats()
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler: _Handler) -> web.StreamResponse:
+        """Observe the latency of every request by route."""
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as exc:
+            status = exc.status
+            raise
+        finally:
+            resource = request.match_info.route.resource
+            route = resource.canonical if resource is not None else 'unmatched'
+            self._http.observe(request.method, route, status, time.perf_counter() - start)
+
+    async def handle(self, request: aiohttp.web.Request) -> web.Response:
+        del request
+        return web.Response(
+            body=self.render().encode(), headers={'Content-Type': self._CONTENT_TYPE}
+        )
+
+    async def handle_stages(self, request: aiohttp.web.Request) -> web.Response:
+        del request
+        return web.json_response(
+            {
+                repo: {
+                    stage: {'count': histogram.count, 'mean_seconds': histogram.mean}
+                    for stage, histogram in _stages(repo_stats)
+                }
+                for repo, repo_stats in self._git_thread_manager.stats().items()
+            }
+        )
+
+    def render(self) -> str:
+        lines: List[str] = []
+        self._render_http(lines)
+        self._render_queues(lines)
+        self._render_repos(lines, self._git_thread_manager.stats())
+        self._render_token_cache(lines)
+        return ''.join(f'{line}\n' for line in lines)
+
+    def setup(self, app: web.Application) -> None:
+        app.router.add_get("/metrics", self.handle)
+        app.router.add_get("/stages", self.handle_stages)
+        app.middlewares.append(self.middleware)
+
+    def _render_http(self, lines: List[str]) -> None:
+        _histograms(
+            lines,
+            'http_request_duration_seconds',
+            "Latency of HTTP requests by route.",
+            (
+                ({'method': method, 'route': route}, histogram)
+                for (method, route), histogram in self._http.latency.items()
+            ),
+        )
+        _samples(
+            lines,
+            'http_responses_total',
+            'counter',
+            "HTTP responses by route and status.",
+            (
+                ({'method': method, 'route': route, 'status': str(status)}, count)
+                for (method, route, status), count in self._http.responses.items()
+            ),
+        )
+
+    def _render_queues(self, lines: List[str]) -> None:
+        depths = self._git_thread_manager.queue_depths()
+        for name, attribute, help_text in (
+            ('queue_tasks', 'tasks', "Submissions queued for a repo."),
+            ('queue_bytes', 'bytes', "Size of the submissions queued for a repo."),
+            ('queue_age_seconds', 'age', "Time the oldest queued submission of a repo waits."),
+        ):
+            _samples(
+                lines,
+                name,
+                'gauge',
+                help_text,
+                (({'repo': repo}, getattr(depth, attribute)) for repo, depth in depths.items()),
+            )
+
+    def _render_repos(self, lines: List[str], stats: Mapping[str, RepoStats]) -> None:
+        _histograms(
+            lines,
+            'batch_size',
+            "Submissions committed and pushed together.",
+            (({'repo': repo}, repo_stats.batch_size) for repo, repo_stats in stats.items()),
+        )
+        _histograms(
+            lines,
+            'queue_wait_seconds',
+            "Time submissions spent in the queue.",
+            (({'repo': repo}, repo_stats.wait_seconds) for repo, repo_stats in stats.items()),
+        )
+        _histograms(
+            lines,
+            'git_duration_seconds',
+            "Time spent in each phase of git batches and clones.",
+            (
+                ({'repo': repo, 'phase': phase}, getattr(repo_stats, f'{phase}_seconds'))
+                for repo, repo_stats in stats.items()
+                for phase in _GIT_PHASES
+            ),
+        )
+        _samples(
+            lines,
+            'push_retries_total',
+            'counter',
+            "Pushes rejected by the remote and retried.",
+            (({'repo': repo}, repo_stats.push_retries) for repo, repo_stats in stats.items()),
+        )
+        _samples(
+            lines,
+            'push_conflicts_total',
+            'counter',
+            "Batches re-applied on top of conflicting remote changes.",
+            (({'repo': repo}, repo_stats.push_conflicts) for repo, repo_stats in stats.items()),
+        )
+        _samples(
+            lines,
+            'token_verifications_total',
+            'counter',
+            "Token signatures verified, cache hits excluded.",
+            (
+                ({'repo': repo, 'result': result}, count)
+                for repo, repo_stats in stats.items()
+                for result, count in (
+                    ('valid', repo_stats.tokens_valid),
+                    ('invalid', repo_stats.tokens_invalid),
+                )
+            ),
+        )
+        _samples(
+            lines,
+            'git_errors_total',
+            'counter',
+            "Failed git tasks by the class of the error.",
+            (
+                ({'repo': repo, 'class': error_class}, count)
+                for repo, repo_stats in stats.items()
+                for error_class, count in sorted(repo_stats.git_errors.items())
+            ),
+        )
+
+
+    def _render_token_cache(self, lines: List[str]) -> None:
+        """Front ends don't verify tokens, so they have no cache."""
+        if not isinstance(self._git_thread_manager, GitThreadManager):
+            return
+        token_cache = self._git_thread_manager.token_cache
+        _samples(
+            lines,
+            'token_cache_hits_total',
+            'counter',
+            "Token verifications answered by the cache.",
+            [({}, token_cache.hits)],
+        )
+        _samples(
+            lines,
+            'token_cache_misses_total',
+            'counter',
+            "Token verifications missing from the cache or expired in it.",
+            [({}, token_cache.misses)],
+        )
+
+
+def _stages(repo_stats: RepoStats) -> Iterable[Tuple[str, Histogram]]:
+    yield 'queue', repo_stats.wait_seconds
+    for phase in _GIT_PHASES:
+        yield phase, getattr(repo_stats, f'{phase}_seconds')
+
+
+def _samples(
+    lines: List[str],
+    name: str,
+    metric_type: str,
+    help_text: str,
+    samples: Iterable[Tuple[_Labels, float]],
+) -> None:
+    # pylint: disable=too-many-arguments
+    name = f'{_PREFIX}_{name}'
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {metric_type}')
+    for labels, value in samples:
+        lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+
+def _histograms(
+    lines: List[str], name: str, help_text: str, samples: Iterable[Tuple[_Labels, Histogram]]
+) -> None:
+    name = f'{_PREFIX}_{name}'
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for labels, histogram in samples:
+        bounds = [_format_value(bound) for bound in histogram.bounds] + ['+Inf']
+        for bound, count in zip(bounds, histogram.cumulative_counts):
+            lines.append(f'{name}_bucket{_format_labels({**labels, "le": bound})} {count}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}')
+        lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+
+
+def _format_labels(labels: _Labels) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return f'{{{pairs}}}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    return str(value) if isinstance(value, int) else repr(float(value))
@@ -0,0 +1,100 @@
+"""Server split into HTTP front end processes sharing the port and git owner processes.
+
+Form parsing, formatting and token signing run in settings.http_workers processes
+listening with SO_REUSEPORT. Submissions are forwarded to settings.git_owners processes,
+each the only writer of its share of the repos.
+"""
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import tempfile
+import time
+from typing import Dict, Mapping, NoReturn, Sequence
+
+from aiohttp import web
+
+from .http_server import setup_front_end_app, setup_owner_app
+from .settings import Settings
+from .sharding import owner_names
+
+LOG = logging.getLogger(__name__)
+
+
+def serve(settings: Settings, host: str = '0.0.0.0', port: int = 8080) -> None:
+    """Run the processes until one of them exits or the server is stopped."""
+    if settings.cluster_db:
+        raise ValueError("Clustering isn't supported with multiple HTTP workers")
+    context = multiprocessing.get_context('spawn')
+    signal.signal(signal.SIGTERM, _exit)
+    with tempfile.TemporaryDirectory(prefix='gfs-ipc-') as ipc_dir:
+        sockets = {
+            name: os.path.join(ipc_dir, f'{name}.sock')
+            for name in owner_names(max(settings.git_owners, 1))
+        }
+        owners = [
+            context.Process(target=_run_owner, args=(name, sockets, settings), name=name)
+            for name in sockets
+        ]
+        front_ends = [
+            context.Process(
+                target=_run_front_end, args=(sockets, settings, host, port), name=f'http-{index}'
+            )
+            for index in range(settings.http_workers)
+        ]
+        try:
+            for process in owners:
+                process.start()
+            _wait_for_sockets(sockets)
+            for process in front_ends:
+                process.start()
+            LOG.info(
+                "Serving on http://%s:%d with %d front ends and %d git owners listening in %s",
+                host,
+                port,
+                len(front_ends),
+                len(owners),
+                ipc_dir,
+            )
+            multiprocessing.connection.wait([process.sentinel for process in owners + front_ends])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # Front ends stop first, so that submissions they accepted reach the owners.
+            _stop(front_ends)
+            _stop(owners)
+
+
+def _run_owner(name: str, sockets: Mapping[str, str], settings: Settings) -> None:
+    logging.basicConfig(level=logging.INFO)
+    app = setup_owner_app(web.Application(), name, list(sockets), settings)
+    web.run_app(app, path=sockets[name], print=None)
+
+
+def _run_front_end(sockets: Mapping[str, str], settings: Settings, host: str, port: int) -> None:
+    logging.basicConfig(level=logging.INFO)
+    app = setup_front_end_app(web.Application(), sockets, settings)
+    web.run_app(app, host=host, port=port, reuse_port=True, print=None)
+
+
+def _wait_for_sockets(sockets: Dict[str, str], timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not all(os.path.exists(path) for path in sockets.values()):
+        if time.monotonic() > deadline:
+            raise RuntimeError("Git owners didn't start listening in time")
+        time.sleep(0.05)
+
+
+def _stop(processes: Sequence[multiprocessing.process.BaseProcess]) -> None:
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        if process.pid is not None:
+            process.join()
+
+
+def _exit(signum: int, frame: object) -> NoReturn:
+    del signum, frame
+    raise KeyboardInterrupt()
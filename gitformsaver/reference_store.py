@@ -0,0 +1,75 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from typing import Dict
+
+import git
+
+from .git_url_parse import ParserError, parse_git_url
+
+LOG = logging.getLogger(__name__)
+
+
+class ReferenceStore:
+    """Bare repo per git host holding the objects of every repo cloned from that host.
+
+    Clones borrow objects through alternates, so forks and near-identical repos share
+    a single copy of their history. Branches of each repo are fetched under its own
+    namespace and are never deleted, and unreachable objects are never pruned,
+    so garbage collection can't drop an object a clone depends on.
+    """
+
+    def __init__(self, root: str) -> None:
+        self._root = root
+        self._lock = threading.Lock()
+        self._host_locks: Dict[str, threading.Lock] = {}
+
+    def update(self, url: str, env: Dict[str, str]) -> str:
+        """Fetch branches of the url into the store of its host and return the store path."""
+        path = self.path_for(url)
+        with self._host_lock(path):
+            if os.path.isdir(path):
+                repo = git.Repo(path)
+            else:
+                repo = _init(path)
+            LOG.info("Fetching %s into reference store %s", url, path)
+            try:
+                with repo.git.custom_environment(**env):
+                    repo.git.fetch(
+                        '--quiet', '--no-tags', url, f'+refs/heads/*:{tenant_ref(url)}/heads/*'
+                    )
+            except git.GitCommandError as exc:
+                raise git.GitError(exc.stderr.strip()) from exc
+            finally:
+                repo.close()
+        return path
+
+    def path_for(self, url: str) -> str:
+        return os.path.join(self._root, f'{_host_key(url)}.git')
+
+    def _host_lock(self, path: str) -> threading.Lock:
+        with self._lock:
+            return self._host_locks.setdefault(path, threading.Lock())
+
+
+def tenant_ref(url: str) -> str:
+    """Namespace of the refs fetched from the url."""
+    return f'refs/tenants/{hashlib.sha1(url.encode()).hexdigest()[:16]}'
+
+
+def _host_key(url: str) -> str:
+    try:
+        host = parse_git_url(url).resource
+    except ParserError:
+        host = None
+    return re.sub(r'[^\w.-]', '_', host or 'local')
+
+
+def _init(path: str) -> git.Repo:
+    repo = git.Repo.init(path, bare=True, mkdir=True)
+    with repo.config_writer() as config:
+        # Objects unreachable after a force-push may still be used by older clones.
+        config.set_value('gc', 'pruneExpire', 'never')
+    return repo
@@ -0,0 +1,37 @@
+import functools
+import os
+
+from .git_url_parse import ParserError, parse_git_url
+
+_DEFAULT_PORTS = {'ssh': '22', 'git': '9418'}
+
+
+@functools.lru_cache(maxsize=10000)
+def repo_key(url: str) -> str:
+    """Canonical ``host[:port]/path.git`` of a git URL, also the relative path of its working copy.
+
+    Different ways to write the same repo give the same key: user names, default ports,
+    leading and trailing slashes and the ``.git`` suffix don't matter.
+    Returns '' for URLs of other protocols, or pointing outside of the host directory.
+    """
+    try:
+        parts = parse_git_url(url)
+    except ParserError:
+        return ''
+    if not parts.resource or not parts.pathname:
+        return ''
+    if set(parts.protocols) - {'ssh', 'git'}:
+        # Unsupported URL schema
+        return ''
+    # scp-like URLs have no protocols, git+ssh:// and ssh+git:// both run over SSH.
+    transport = 'ssh' if 'ssh' in parts.protocols or not parts.protocols else 'git'
+    host = parts.resource.lower()
+    if parts.port and parts.port != _DEFAULT_PORTS[transport]:
+        host = f'{host}:{parts.port}'
+    pathname = parts.pathname.strip('/')
+    if not pathname.endswith('.git'):
+        pathname += '.git'
+    path = f'{host}/{pathname}'
+    if os.path.relpath(f'/{path}', '/') != path:
+        return ''
+    return path
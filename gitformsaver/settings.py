@@ -0,0 +1,146 @@
+import os
+from dataclasses import dataclass, field, replace
+from typing import Dict, Mapping, Tuple
+
+from .backpressure import QueueLimits
+from .form_parser import FormLimits
+from .git_thread import CoalescingPolicy
+
+
+@dataclass(frozen=True)
+class Settings:  # pylint: disable=too-many-instance-attributes
+    private_key_path: str = ''
+    signing_algorithms: Tuple[str, ...] = ('RS256',)
+    ed25519_key_path: str = ''
+    signing_secret: str = ''
+    shallow_clone: bool = True
+    max_push_retries: int = 3
+    optimistic_push: bool = False
+    queue_limits: QueueLimits = field(default_factory=QueueLimits)
+    form_limits: FormLimits = field(default_factory=FormLimits)
+    queue_block_timeout: float = 0.0
+    retry_after: int = 5
+    coalescing: CoalescingPolicy = field(default_factory=CoalescingPolicy)
+    repo_coalescing: Dict[str, CoalescingPolicy] = field(default_factory=dict)
+    token_cache_size: int = 10000
+    token_cache_ttl: float = 3600.0
+    wal_dir: str = ''
+    wal_segment_bytes: int = 4 << 20
+    git_workers: int = 8
+    git_engine: str = 'threads'
+    git_network_concurrency: int = 16
+    bare_storage: bool = False
+    reference_dir: str = ''
+    ssh_control_dir: str = ''
+    ssh_control_persist: float = 300.0
+    ssh_check_interval: float = 5.0
+    repo_idle_timeout: float = 600.0
+    trace_file: str = ''
+    http_workers: int = 0
+    git_owners: int = 1
+    cluster_db: str = ''
+    cluster_address: str = ''
+    cluster_secret: str = ''
+    lease_ttl: float = 30.0
+    signing_executor: str = ''
+    signing_workers: int = 2
+    signing_batch_size: int = 32
+    issued_token_ttl: float = 60.0
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> 'Settings':
+        default = CoalescingPolicy()
+        coalescing = CoalescingPolicy(
+            max_latency=float(environ.get('GFS_COALESCE_MAX_LATENCY', default.max_latency)),
+            max_tasks=int(environ.get('GFS_COALESCE_MAX_SUBMISSIONS', default.max_tasks)),
+            max_bytes=int(environ.get('GFS_COALESCE_MAX_BYTES', default.max_bytes)),
+        )
+        limits = QueueLimits()
+        form_limits = FormLimits()
+        return cls(
+            private_key_path=environ.get('GFS_PRIVATE_KEY_PATH', ''),
+            signing_algorithms=tuple(
+                algorithm.strip()
+                for algorithm in environ.get('GFS_SIGNING_ALGORITHMS', 'RS256').split(',')
+                if algorithm.strip()
+            ),
+            ed25519_key_path=environ.get('GFS_ED25519_KEY_PATH', ''),
+            signing_secret=environ.get('GFS_SIGNING_SECRET', ''),
+            shallow_clone=_flag(environ.get('GFS_SHALLOW_CLONE', '1')),
+            max_push_retries=int(environ.get('GFS_MAX_PUSH_RETRIES', cls.max_push_retries)),
+            optimistic_push=_flag(environ.get('GFS_OPTIMISTIC_PUSH', '0')),
+            queue_limits=QueueLimits(
+                max_tasks=int(environ.get('GFS_QUEUE_MAX_SUBMISSIONS', limits.max_tasks)),
+                max_bytes=int(environ.get('GFS_QUEUE_MAX_BYTES', limits.max_bytes)),
+                global_max_tasks=int(
+                    environ.get('GFS_GLOBAL_QUEUE_MAX_SUBMISSIONS', limits.global_max_tasks)
+                ),
+                global_max_bytes=int(
+                    environ.get('GFS_GLOBAL_QUEUE_MAX_BYTES', limits.global_max_bytes)
+                ),
+            ),
+            form_limits=FormLimits(
+                max_field_bytes=int(
+                    environ.get('GFS_FORM_MAX_FIELD_BYTES', form_limits.max_field_bytes)
+                ),
+                max_form_bytes=int(environ.get('GFS_FORM_MAX_BYTES', form_limits.max_form_bytes)),
+                max_fields=int(environ.get('GFS_FORM_MAX_FIELDS', form_limits.max_fields)),
+            ),
+            queue_block_timeout=float(
+                environ.get('GFS_QUEUE_BLOCK_TIMEOUT', cls.queue_block_timeout)
+            ),
+            retry_after=int(environ.get('GFS_RETRY_AFTER', cls.retry_after)),
+            coalescing=coalescing,
+            repo_coalescing=_repo_latencies(
+                environ.get('GFS_REPO_COALESCE_MAX_LATENCY', ''), coalescing
+            ),
+            token_cache_size=int(environ.get('GFS_TOKEN_CACHE_SIZE', cls.token_cache_size)),
+            token_cache_ttl=float(environ.get('GFS_TOKEN_CACHE_TTL', cls.token_cache_ttl)),
+            wal_dir=environ.get('GFS_WAL_DIR', ''),
+            wal_segment_bytes=int(environ.get('GFS_WAL_SEGMENT_BYTES', cls.wal_segment_bytes)),
+            git_workers=int(environ.get('GFS_GIT_WORKERS', cls.git_workers)),
+            git_engine=environ.get('GFS_GIT_ENGINE', cls.git_engine),
+            git_network_concurrency=int(
+                environ.get('GFS_GIT_NETWORK_CONCURRENCY', cls.git_network_concurrency)
+            ),
+            bare_storage=_flag(environ.get('GFS_BARE_STORAGE', '0')),
+            reference_dir=environ.get('GFS_REFERENCE_DIR', ''),
+            ssh_control_dir=environ.get('GFS_SSH_CONTROL_DIR', ''),
+            ssh_control_persist=float(
+                environ.get('GFS_SSH_CONTROL_PERSIST', cls.ssh_control_persist)
+            ),
+            ssh_check_interval=float(
+                environ.get('GFS_SSH_CHECK_INTERVAL', cls.ssh_check_interval)
+            ),
+            repo_idle_timeout=float(
+                environ.get('GFS_REPO_IDLE_TIMEOUT', cls.repo_idle_timeout)
+            ),
+            trace_file=environ.get('GFS_TRACE_FILE', ''),
+            http_workers=int(environ.get('GFS_HTTP_WORKERS', cls.http_workers)),
+            git_owners=int(environ.get('GFS_GIT_OWNERS', cls.git_owners)),
+            cluster_db=environ.get('GFS_CLUSTER_DB', ''),
+            cluster_address=environ.get('GFS_CLUSTER_ADDRESS', ''),
+            cluster_secret=environ.get('GFS_CLUSTER_SECRET', ''),
+            lease_ttl=float(environ.get('GFS_LEASE_TTL', cls.lease_ttl)),
+            signing_executor=environ.get('GFS_SIGNING_EXECUTOR', ''),
+            signing_workers=int(environ.get('GFS_SIGNING_WORKERS', cls.signing_workers)),
+            signing_batch_size=int(
+                environ.get('GFS_SIGNING_BATCH_SIZE', cls.signing_batch_size)
+            ),
+            issued_token_ttl=float(environ.get('GFS_ISSUED_TOKEN_TTL', cls.issued_token_ttl)),
+        )
+
+
+def _flag(value: str) -> bool:
+    return value.lower() not in ('', '0', 'false', 'no', 'off')
+
+
+def _repo_latencies(value: str, coalescing: CoalescingPolicy) -> Dict[str, CoalescingPolicy]:
+    """Parse whitespace-separated ``url=seconds`` pairs."""
+    policies = {}
+    for pair in value.split():
+        url, _, latency = pair.rpartition('=')
+        if not url:
+            raise ValueError(f"Expected url=seconds, got {pair!r}")
+        policies[url] = replace(coalescing, max_latency=float(latency))
+    return policies
@@ -0,0 +1,283 @@
+"""Forwarding of submissions from HTTP front end processes to git owner processes.
+
+Repos are sharded between owners by a consistent hash of their repo_key(), so every repo
+still has exactly one writer, whichever front end process accepted the submission.
+Owners listen on Unix sockets and answer 429 with the error if the queue is full.
+"""
+import asyncio
+import bisect
+import hashlib
+import hmac
+import json
+import logging
+from dataclasses import asdict
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import aiohttp
+from aiohttp import web
+
+from . import errors
+from .backpressure import QueueDepth
+from .git_thread_manager import AnyGitThread, GitThreadManager
+from .metrics import RepoStats
+from .repo_key import repo_key
+
+LOG = logging.getLogger(__name__)
+SIGNATURE_HEADER = 'X-GFS-Signature'
+
+
+class HashRing:
+    """Consistent hash of repos to owner names, the same in every process."""
+
+    def __init__(self, owners: Sequence[str], replicas: int = 64) -> None:
+        if not owners:
+            raise ValueError("Hash ring needs at least one owner")
+        points = sorted(
+            (_hash(f'{owner}#{replica}'), owner) for owner in owners for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [owner for _, owner in points]
+
+    def owner(self, repo: str) -> str:
+        return self.key_owner(repo_key(repo) or repo)
+
+    def key_owner(self, key: str) -> str:
+        """Owner of a repo given by its key, which repo_key() can't be applied to again."""
+        index = bisect.bisect(self._hashes, _hash(key))
+        return self._owners[index % len(self._owners)]
+
+
+class OwnerService:
+    """Queues submissions forwarded by front end processes for the repos of this owner."""
+
+    def __init__(self, git_thread_manager: GitThreadManager, ring: HashRing, name: str) -> None:
+        self._git_thread_manager = git_thread_manager
+        self._ring = ring
+        self._name = name
+
+    async def handle_submit(self, request: web.Request) -> web.Response:
+        return await accept_forwarded(request, self._git_thread_manager)
+
+    async def handle_queues(self, request: web.Request) -> web.Response:
+        del request
+        return web.json_response(
+            {
+                'total': asdict(self._git_thread_manager.depth),
+                'repos': {
+                    repo: asdict(depth)
+                    for repo, depth in self._git_thread_manager.queue_depths().items()
+                },
+            }
+        )
+
+    def setup(self, app: web.Application) -> None:
+        app.router.add_post('/submit', self.handle_submit)
+        app.router.add_get('/queues', self.handle_queues)
+        app.on_startup.append(self.on_startup)
+        app.on_shutdown.append(self.on_shutdown)
+
+    async def on_startup(self, app: web.Application) -> None:
+        del app
+        self._git_thread_manager.recover(owns=self._owns)
+
+    async def on_shutdown(self, app: web.Application) -> None:
+        del app
+        self._git_thread_manager.stop()
+        await self._git_thread_manager.drain()
+
+    def _owns(self, repo: str) -> bool:
+        return self._ring.owner(repo) == self._name
+
+
+class RemoteGitThread:
+    """Forwards submissions to the process owning the repo, posting them to url.
+
+    With a secret, submissions are signed for accept_forwarded() of the receiver.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        repo: str,
+        url: str = 'http://owner/submit',
+        *,
+        secret: bytes = b'',
+    ) -> None:
+        self._session = session
+        self._repo = repo
+        self._url = url
+        self._secret = secret
+
+    def push_soon(
+        self, rel_path: str, text: str, repo: str = '', accepted_at: float = 0.0
+    ) -> 'asyncio.Future[None]':
+        """Returns a future resolved once the owner queued the submission.
+
+        It fails with QueueFullError if the owner is over the limits or unavailable.
+        """
+        return asyncio.ensure_future(self._push(rel_path, text, repo or self._repo, accepted_at))
+
+    async def _push(self, rel_path: str, text: str, repo: str, accepted_at: float) -> None:
+        body = json.dumps(
+            {'repo': repo, 'file': rel_path, 'text': text, 'accepted_at': accepted_at}
+        ).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if self._secret:
+            headers[SIGNATURE_HEADER] = sign_forwarded(self._secret, body)
+        try:
+            async with self._session.post(self._url, data=body, headers=headers) as response:
+                if response.status == 429:
+                    data = await response.json()
+                    raise errors.QueueFullError(data['error'], is_global=data['is_global'])
+                response.raise_for_status()
+        except aiohttp.ClientError as exc:
+            LOG.warning("Forwarding submission to %s failed: %s", repo, exc)
+            raise errors.QueueFullError("Git owner is unavailable", is_global=True) from exc
+
+
+class DeferredGitThread:
+    """Stands in for the git thread of a repo until resolve() finds it, on the first push."""
+
+    def __init__(
+        self, resolve: Callable[[str], Awaitable[Union[AnyGitThread, RemoteGitThread]]], repo: str
+    ) -> None:
+        self._resolve = resolve
+        self._repo = repo
+
+    def push_soon(
+        self, rel_path: str, text: str, repo: str = '', accepted_at: float = 0.0
+    ) -> 'asyncio.Future[None]':
+        """Returns a future resolved once the submission is queued, see RemoteGitThread."""
+        return asyncio.ensure_future(self._push(rel_path, text, repo or self._repo, accepted_at))
+
+    async def _push(self, rel_path: str, text: str, repo: str, accepted_at: float) -> None:
+        git_thread = await self._resolve(repo)
+        durable = git_thread.push_soon(rel_path, text, repo=repo, accepted_at=accepted_at)
+        if durable is not None:
+            await asyncio.wrap_future(durable)
+
+
+class ShardedGitThreadManager:
+    """Stands in for GitThreadManager in front end processes.
+
+    Owners are given by name and Unix socket path. Queue depths are polled from the owners
+    every refresh_interval seconds while running.
+    """
+
+    def __init__(self, sockets: Mapping[str, str], refresh_interval: float = 1.0) -> None:
+        self._sockets = dict(sockets)
+        self._ring = HashRing(list(sockets))
+        self._refresh_interval = refresh_interval
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._totals: Dict[str, QueueDepth] = {}
+        self._depths: Dict[str, QueueDepth] = {}
+        self._refresher: Optional['asyncio.Task[None]'] = None
+
+    def __call__(self, repo: str) -> RemoteGitThread:
+        return RemoteGitThread(self._session(self._ring.owner(repo)), repo)
+
+    @property
+    def depth(self) -> QueueDepth:
+        """Total number and size of submissions queued across all owners, as last polled."""
+        return QueueDepth(
+            tasks=sum(depth.tasks for depth in self._totals.values()),
+            bytes=sum(depth.bytes for depth in self._totals.values()),
+            age=max((depth.age for depth in self._totals.values()), default=0.0),
+        )
+
+    def queue_depths(self) -> Dict[str, QueueDepth]:
+        return dict(self._depths)
+
+    def stats(self) -> Dict[str, RepoStats]:
+        """Git stats are kept by the owners, which serve them on their sockets."""
+        return {}
+
+    def recover(self) -> None:
+        """Owners recover their write-ahead logs, here the polling of queue depths starts."""
+        self._refresher = asyncio.ensure_future(self._refresh())
+
+    def stop(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+
+    async def drain(self) -> None:
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+
+    def _session(self, owner: str) -> aiohttp.ClientSession:
+        if owner not in self._sessions:
+            self._sessions[owner] = aiohttp.ClientSession(
+                connector=aiohttp.UnixConnector(path=self._sockets[owner])
+            )
+        return self._sessions[owner]
+
+    async def _refresh(self) -> None:
+        while True:
+            depths: Dict[str, QueueDepth] = {}
+            for owner in self._sockets:
+                try:
+                    async with self._session(owner).get('http://owner/queues') as response:
+                        data = await response.json()
+                except aiohttp.ClientError as exc:
+                    LOG.debug("Polling queues of %s failed: %s", owner, exc)
+                    continue
+                self._totals[owner] = QueueDepth(**data['total'])
+                depths.update(
+                    (repo, QueueDepth(**depth)) for repo, depth in data['repos'].items()
+                )
+            self._depths = depths
+            await asyncio.sleep(self._refresh_interval)
+
+
+async def accept_forwarded(
+    request: web.Request,
+    git_threads: Callable[[str], Union[AnyGitThread, DeferredGitThread]],
+    secret: bytes = b'',
+) -> web.Response:
+    """Queue the submission posted by RemoteGitThread to the git thread of its repo.
+
+    With a secret, submissions not signed with it are rejected with 403.
+    """
+    if secret:
+        signature = request.headers.get(SIGNATURE_HEADER, '').encode('utf-8', 'replace')
+        expected = sign_forwarded(secret, await request.read()).encode('ascii')
+        if not hmac.compare_digest(signature, expected):
+            return web.Response(status=403, text="Invalid signature")
+    try:
+        repo, rel_path, text, accepted_at = _parse_forwarded(await request.json())
+    except ValueError as exc:
+        return web.Response(status=400, text=str(exc))
+    try:
+        durable = git_threads(repo).push_soon(rel_path, text, repo=repo, accepted_at=accepted_at)
+        if durable is not None:
+            await asyncio.wrap_future(durable)
+    except errors.QueueFullError as exc:
+        return web.json_response({'error': str(exc), 'is_global': exc.is_global}, status=429)
+    return web.Response(status=204)
+
+
+def sign_forwarded(secret: bytes, body: bytes) -> str:
+    """HMAC-SHA256 of a forwarded submission, sent in SIGNATURE_HEADER."""
+    return hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+
+def _parse_forwarded(data: Any) -> Tuple[str, str, str, float]:
+    """Repo, file, text and acceptance time of a forwarded submission, ValueError if malformed."""
+    if not isinstance(data, dict):
+        raise ValueError("Submission isn't a JSON object")
+    for name in ('repo', 'file', 'text'):
+        if not isinstance(data.get(name), str):
+            raise ValueError(f"Submission has no {name} string")
+    accepted_at = data.get('accepted_at', 0.0)
+    if isinstance(accepted_at, bool) or not isinstance(accepted_at, (int, float)):
+        raise ValueError("Submission accepted_at isn't a number")
+    return data['repo'], data['file'], data['text'], float(accepted_at)
+
+
+def owner_names(count: int) -> List[str]:
+    return [f'git-{index}' for index in range(count)]
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
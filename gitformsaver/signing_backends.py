@@ -0,0 +1,98 @@
+import os
+from functools import cached_property
+from typing import Any, List, Sequence, cast
+
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from cryptography.hazmat.primitives.serialization.ssh import load_ssh_private_key
+
+
+class SigningBackend:
+    """Key material for one JWT algorithm."""
+
+    algorithm = ''
+
+    @property
+    def signing_key(self) -> Any:
+        raise NotImplementedError()
+
+    @property
+    def verifying_key(self) -> Any:
+        raise NotImplementedError()
+
+
+class RSABackend(SigningBackend):
+    """RS256 over an SSH RSA key. Slow, kept for the tokens issued before other backends."""
+
+    algorithm = 'RS256'
+
+    def __init__(self, private_key_path: str = '') -> None:
+        self._private_key_path = private_key_path or os.path.expanduser("~/.ssh/id_rsa")
+
+    @cached_property
+    def signing_key(self) -> rsa.RSAPrivateKey:
+        return cast(rsa.RSAPrivateKey, _load_ssh_private_key(self._private_key_path))
+
+    @cached_property
+    def verifying_key(self) -> rsa.RSAPublicKey:
+        return self.signing_key.public_key()
+
+
+class Ed25519Backend(SigningBackend):
+    """EdDSA over an SSH Ed25519 key."""
+
+    algorithm = 'EdDSA'
+
+    def __init__(self, private_key_path: str = '') -> None:
+        self._private_key_path = private_key_path or os.path.expanduser("~/.ssh/id_ed25519")
+
+    @cached_property
+    def signing_key(self) -> ed25519.Ed25519PrivateKey:
+        return cast(ed25519.Ed25519PrivateKey, _load_ssh_private_key(self._private_key_path))
+
+    @cached_property
+    def verifying_key(self) -> ed25519.Ed25519PublicKey:
+        return self.signing_key.public_key()
+
+
+class HMACBackend(SigningBackend):
+    """HS256 with a server secret that never leaves the server."""
+
+    algorithm = 'HS256'
+
+    def __init__(self, secret: str) -> None:
+        if not secret:
+            raise ValueError("HS256 requires a non-empty server secret")
+        self._secret = secret.encode('utf-8')
+
+    @property
+    def signing_key(self) -> bytes:
+        return self._secret
+
+    @property
+    def verifying_key(self) -> bytes:
+        return self._secret
+
+
+def load_backends(
+    algorithms: Sequence[str],
+    private_key_path: str = '',
+    ed25519_key_path: str = '',
+    secret: str = '',
+) -> List[SigningBackend]:
+    """Instantiate backends for the algorithms, the first one is used for signing."""
+    factories = {
+        RSABackend.algorithm: lambda: RSABackend(private_key_path),
+        Ed25519Backend.algorithm: lambda: Ed25519Backend(ed25519_key_path),
+        HMACBackend.algorithm: lambda: HMACBackend(secret),
+    }
+    backends = []
+    for algorithm in algorithms:
+        if algorithm not in factories:
+            raise ValueError(f"Unsupported signing algorithm {algorithm!r}")
+        backends.append(factories[algorithm]())
+    return backends
+
+
+def _load_ssh_private_key(path: str) -> Any:
+    with open(path, "rb") as fobj:
+        return load_ssh_private_key(fobj.read(), password=None)
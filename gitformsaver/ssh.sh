@@ -1,2 +1,11 @@
 #!/bin/sh
-exec /usr/bin/ssh -o StrictHostKeyChecking=no -i "${DIARY_ID_RSA}" "$@"
+# Git runs it as GIT_SSH, the options come from the environment set by GitOps.
+set -- -o StrictHostKeyChecking=no "$@"
+if [ -n "${DIARY_ID_RSA}" ]; then
+    set -- -i "${DIARY_ID_RSA}" "$@"
+fi
+if [ -n "${GFS_SSH_CONTROL_PATH}" ]; then
+    set -- -o ControlMaster=auto -o "ControlPath=${GFS_SSH_CONTROL_PATH}" \
+        -o "ControlPersist=${GFS_SSH_CONTROL_PERSIST:-300}" "$@"
+fi
+exec "${GFS_SSH:-/usr/bin/ssh}" "$@"
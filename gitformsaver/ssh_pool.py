@@ -0,0 +1,160 @@
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+LOG = logging.getLogger(__name__)
+# Expanded by ssh after applying ~/.ssh/config, see ssh.sh
+_CONTROL_NAME = '%r@%h:%p'
+_SCP_LIKE = re.compile(r'^(?:(?P<user>[^@/]+)@)?(?P<host>[^:/]+):(?!//)')
+
+
+@dataclass
+class SshStats:
+    opened: int = 0
+    reused: int = 0
+    stale: int = 0
+
+
+class SshConnectionPool:  # pylint: disable=too-many-instance-attributes
+    """Persistent multiplexed SSH connection per git host.
+
+    The first session to a host becomes the ControlMaster, the following ones run through
+    its socket in the control directory, skipping the TCP and key exchange handshakes.
+    Masters exit on their own after ``persist`` seconds without sessions.
+    """
+
+    def __init__(
+        self,
+        control_dir: str,
+        persist: float = 300.0,
+        ssh: str = '/usr/bin/ssh',
+        check_interval: float = 5.0,
+    ) -> None:
+        self._control_dir = control_dir
+        self._control_path = os.path.join(control_dir, _CONTROL_NAME)
+        self._persist = persist
+        self._ssh = ssh
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+        self._stats = SshStats()
+        # Control socket paths by the monotonic time they were last found alive.
+        self._alive_at: Dict[str, float] = {}
+        # Control socket paths resolved by ssh -G, by the ssh arguments of the destination.
+        self._paths: Dict[Tuple[str, ...], str] = {}
+        os.makedirs(control_dir, mode=0o700, exist_ok=True)
+
+    def env(self) -> Dict[str, str]:
+        """Environment making ssh.sh use the pool."""
+        return {
+            'GFS_SSH': self._ssh,
+            'GFS_SSH_CONTROL_PATH': self._control_path,
+            'GFS_SSH_CONTROL_PERSIST': str(int(self._persist)),
+        }
+
+    def check(self, url: str) -> None:
+        """Health check of the master connection to the host of the url before using it.
+
+        Live masters aren't checked again for ``check_interval`` seconds, so that bursts of
+        pulls and pushes don't fork ``ssh -O check`` each. Sockets left behind by dead masters
+        are removed, so the next session opens a new one.
+        """
+        destination = _destination(url)
+        if destination is None:
+            return
+        path = self._resolve(destination)
+        if path is None:
+            return
+        with self._lock:
+            alive_at = self._alive_at.get(path)
+            if alive_at is not None and time.monotonic() - alive_at < self._check_interval:
+                self._stats.reused += 1
+                return
+        alive = os.path.exists(path) and self._control(path, 'check', destination)
+        with self._lock:
+            if alive:
+                self._stats.reused += 1
+                self._alive_at[path] = time.monotonic()
+                return
+            self._alive_at.pop(path, None)
+            self._stats.opened += 1
+            if os.path.exists(path):
+                self._stats.stale += 1
+                LOG.warning("Removing stale SSH control socket %s", path)
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def close(self) -> None:
+        """Stop all master connections."""
+        with self._lock:
+            self._alive_at.clear()
+        for name in os.listdir(self._control_dir):
+            user_host = name.rsplit(':', 1)[0]
+            self._control(os.path.join(self._control_dir, name), 'exit', [user_host])
+
+    @property
+    def stats(self) -> SshStats:
+        return self._stats
+
+    def _resolve(self, destination: List[str]) -> Optional[str]:
+        """Control socket path the sessions of git use, with Host, HostName and Port from config."""
+        key = tuple(destination)
+        with self._lock:
+            path = self._paths.get(key)
+        if path is not None:
+            return path
+        try:
+            result = subprocess.run(
+                [self._ssh, '-G', '-o', f'ControlPath={self._control_path}', *destination],
+                check=False,
+                capture_output=True,
+                text=True,
+                timeout=10,
+            )
+        except (OSError, subprocess.TimeoutExpired) as exc:
+            LOG.warning("Failed to resolve SSH control path of %s: %s", destination[-1], exc)
+            return None
+        for line in result.stdout.splitlines():
+            option, _, value = line.partition(' ')
+            if option == 'controlpath' and value:
+                with self._lock:
+                    self._paths[key] = value
+                return value
+        LOG.warning("SSH didn't resolve control path of %s: %s", destination[-1], result.stderr)
+        return None
+
+    def _control(self, path: str, command: str, destination: List[str]) -> bool:
+        try:
+            result = subprocess.run(
+                [self._ssh, '-O', command, '-o', f'ControlPath={path}', *destination],
+                check=False,
+                capture_output=True,
+                timeout=10,
+            )
+        except (OSError, subprocess.TimeoutExpired) as exc:
+            LOG.warning("SSH control command %s failed for %s: %s", command, path, exc)
+            return False
+        return result.returncode == 0
+
+
+def _destination(url: str) -> Optional[List[str]]:
+    """Arguments git passes to ssh.sh for an SSH url: [-p port] [user@]host."""
+    if '://' in url:
+        parts = urlsplit(url)
+        if parts.scheme not in ('ssh', 'git+ssh', 'ssh+git') or not parts.hostname:
+            return None
+        user, host, port = parts.username, parts.hostname, parts.port
+    else:
+        match = _SCP_LIKE.match(url)
+        if match is None:
+            return None
+        user, host, port = match.group('user'), match.group('host'), None
+    destination = f'{user}@{host}' if user else host
+    return ['-p', str(port), destination] if port else [destination]
@@ -0,0 +1,73 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Set, Tuple
+
+_Key = Tuple[str, str, str, bytes]
+_Target = Tuple[str, str]
+
+
+class TokenCache:  # pylint: disable=too-many-instance-attributes
+    """Bounded LRU cache of token verification results with expiration.
+
+    Results are keyed by (token, repo, path, secret hash), so the secret itself is never stored.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl: float = 3600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._max_size = max_size
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[_Key, Tuple[float, bool]]' = OrderedDict()
+        self._by_target: Dict[_Target, Set[_Key]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str, repo: str, path: str, secret: str) -> Optional[bool]:
+        key = self._key(token, repo, path, secret)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < self._clock():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token: str, repo: str, path: str, secret: str, is_valid: bool) -> None:
+        key = self._key(token, repo, path, secret)
+        with self._lock:
+            self._entries[key] = (self._clock() + self._ttl, is_valid)
+            self._entries.move_to_end(key)
+            self._by_target.setdefault((repo, path), set()).add(key)
+            while len(self._entries) > self._max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, repo: str, path: str) -> None:
+        """Forget all results for the file."""
+        with self._lock:
+            for key in self._by_target.pop((repo, path), set()):
+                self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: _Key) -> None:
+        del self._entries[key]
+        target = (key[1], key[2])
+        keys = self._by_target.get(target)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_target[target]
+
+    def _key(self, token: str, repo: str, path: str, secret: str) -> _Key:
+        return token, repo, path, hashlib.sha256(secret.encode('utf-8')).digest()
@@ -0,0 +1,136 @@
+"""Issuing tokens without signing them on the event loop.
+
+Requests arriving in the same iteration of the loop are signed as one batch on an executor,
+identical requests share one signature, and issued tokens are cached for a short while.
+With a process pool, workers sign with their own Authentication made by init_worker().
+"""
+import asyncio
+import concurrent.futures
+import functools
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .authentication_interface import AuthenticationInterface
+
+TokenRequest = Tuple[str, str, str]
+SignBatch = Callable[[Sequence[TokenRequest]], List[str]]
+_Key = Tuple[str, str, bytes]
+
+_WORKER_AUTHENTICATION: Optional[AuthenticationInterface] = None
+
+
+class TokenSigner:  # pylint: disable=too-many-instance-attributes
+    """Signs tokens inline, or on the executor if given, which is shut down by close()."""
+
+    def __init__(
+        self,
+        authentication: AuthenticationInterface,
+        executor: Optional[concurrent.futures.Executor] = None,
+        sign_batch: Optional[SignBatch] = None,
+        *,
+        max_batch: int = 32,
+        cache_size: int = 10000,
+        cache_ttl: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Sign_batch signs requests on the executor, by default with authentication."""
+        # pylint: disable=too-many-arguments
+        self._authentication = authentication
+        self._executor = executor
+        self._sign_batch = sign_batch or functools.partial(sign_tokens, authentication)
+        self._max_batch = max_batch
+        self._cache_size = cache_size
+        self._cache_ttl = cache_ttl
+        self._clock = clock
+        self._cache: 'OrderedDict[_Key, Tuple[float, str]]' = OrderedDict()
+        self._in_flight: Dict[_Key, 'asyncio.Future[str]'] = {}
+        self._pending: List[Tuple[_Key, TokenRequest]] = []
+        self._flush_handle: Optional[asyncio.Handle] = None
+        self.batches = 0
+
+    async def create_token(self, repo: str, path: str, secret: str = '') -> str:
+        key = (repo, path, hashlib.sha256(secret.encode('utf-8')).digest())
+        token = self._cached(key)
+        if token is not None:
+            return token
+        if self._executor is None:
+            token = self._authentication.create_token(repo=repo, path=path, secret=secret)
+            self._remember(key, token)
+            return token
+        future = self._in_flight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._in_flight[key] = loop.create_future()
+            self._pending.append((key, (repo, path, secret)))
+            if len(self._pending) >= self._max_batch:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_soon(self._flush)
+        # A cancelled request doesn't cancel the signature shared with identical ones
+        return await asyncio.shield(future)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        self.batches += 1
+        job = asyncio.get_running_loop().run_in_executor(
+            self._executor, self._sign_batch, [request for _, request in batch]
+        )
+        job.add_done_callback(functools.partial(self._resolve, [key for key, _ in batch]))
+
+    def _resolve(self, keys: List[_Key], job: 'asyncio.Future[List[str]]') -> None:
+        futures = [self._in_flight.pop(key) for key in keys]
+        try:
+            tokens = job.result()
+        except (Exception, asyncio.CancelledError) as exc:  # pylint: disable=broad-except
+            for future in futures:
+                future.set_exception(exc)
+            return
+        for key, future, token in zip(keys, futures, tokens):
+            self._remember(key, token)
+            future.set_result(token)
+
+    def _cached(self, key: _Key) -> Optional[str]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < self._clock():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return entry[1]
+
+    def _remember(self, key: _Key, token: str) -> None:
+        self._cache[key] = (self._clock() + self._cache_ttl, token)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+
+def sign_tokens(
+    authentication: AuthenticationInterface, requests: Sequence[TokenRequest]
+) -> List[str]:
+    return [
+        authentication.create_token(repo=repo, path=path, secret=secret)
+        for repo, path, secret in requests
+    ]
+
+
+def init_worker(factory: Callable[..., AuthenticationInterface], *args) -> None:
+    """Initializer of process pool workers, making their Authentication with factory(*args)."""
+    global _WORKER_AUTHENTICATION  # pylint: disable=global-statement
+    _WORKER_AUTHENTICATION = factory(*args)
+
+
+def sign_in_worker(requests: Sequence[TokenRequest]) -> List[str]:
+    """Sign_batch of TokenSigner for a process pool initialized by init_worker()."""
+    assert _WORKER_AUTHENTICATION is not None, "Worker isn't initialized"
+    return sign_tokens(_WORKER_AUTHENTICATION, requests)
@@ -0,0 +1,192 @@
+"""Optional per-submission tracing, from the HTTP accept to the push of its batch.
+
+Every submission is a trace. Its root span covers the whole way to the remote, and the
+children are the stages: accept, queue, and the pull, validate, write, commit and push
+of the batch it went with. Spans are exported as OTLP/JSON, one export request per line,
+the format of the OpenTelemetry collector file exporter.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import IO, TYPE_CHECKING, Any, Dict, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    from .git_task_handler import WriteTask
+
+
+@dataclass(frozen=True)
+class Stage:
+    """Stage of a batch, in time.monotonic_ns() units."""
+
+    name: str
+    start_ns: int
+    end_ns: int
+
+
+@dataclass(frozen=True)
+class Span:  # pylint: disable=too-many-instance-attributes
+    trace_id: str
+    span_id: str
+    parent_span_id: str
+    name: str
+    start_unix_ns: int
+    end_unix_ns: int
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+
+class SpanExporter:
+    def export(self, spans: Sequence[Span]) -> None:
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        raise NotImplementedError()
+
+
+class OtlpJsonExporter(SpanExporter):
+    """Writes spans to a file, or to stdout if the path is '-'."""
+
+    def __init__(self, path: str, service_name: str = 'gitformsaver') -> None:
+        self._lock = threading.Lock()
+        self._stream: IO[str]
+        if path == '-':
+            self._stream = sys.stdout
+            self._own_stream = False
+        else:
+            self._stream = open(path, 'a', encoding='utf-8')  # pylint: disable=consider-using-with
+            self._own_stream = True
+        self._resource = {'attributes': _attributes({'service.name': service_name})}
+
+    def export(self, spans: Sequence[Span]) -> None:
+        line = json.dumps(
+            {
+                'resourceSpans': [
+                    {
+                        'resource': self._resource,
+                        'scopeSpans': [
+                            {
+                                'scope': {'name': 'gitformsaver'},
+                                'spans': [_otlp_span(span) for span in spans],
+                            }
+                        ],
+                    }
+                ]
+            },
+            separators=(',', ':'),
+        )
+        with self._lock:
+            self._stream.write(line + '\n')
+            self._stream.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._own_stream:
+                self._stream.close()
+
+
+class Tracer:
+    """Turns the stages of batches into spans of their submissions."""
+
+    def __init__(self, exporter: SpanExporter) -> None:
+        self._exporter = exporter
+        # Spans carry wall clock time, while stages are timed with the monotonic clock.
+        self._offset_ns = time.time_ns() - time.monotonic_ns()
+
+    def new_trace_id(self) -> str:
+        return os.urandom(16).hex()
+
+    def record_batch(
+        self, repo: str, tasks: Sequence['WriteTask'], stages: Sequence[Stage], end_ns: int
+    ) -> None:
+        """Export the spans of the submissions handled by a batch.
+
+        The batch started with its first stage, or at end_ns if there were none.
+        """
+        started_ns = stages[0].start_ns if stages else end_ns
+        spans: List[Span] = []
+        for task in tasks:
+            if not task.trace_id:
+                continue
+            queued_ns = int(task.queued_at * 1e9)
+            accepted_ns = int(task.accepted_at * 1e9) if task.accepted_at else queued_ns
+            # Root span id is derived from the trace id, the stages are its children.
+            root_id = task.trace_id[:16]
+            spans.append(
+                self._span(
+                    task.trace_id,
+                    'submission',
+                    accepted_ns,
+                    end_ns,
+                    span_id=root_id,
+                    attributes={'repo': repo, 'file': task.rel_path, 'batch.size': len(tasks)},
+                )
+            )
+            if accepted_ns < queued_ns:
+                spans.append(self._span(task.trace_id, 'accept', accepted_ns, queued_ns, root_id))
+            spans.append(self._span(task.trace_id, 'queue', queued_ns, started_ns, root_id))
+            for stage in stages:
+                spans.append(
+                    self._span(task.trace_id, stage.name, stage.start_ns, stage.end_ns, root_id)
+                )
+        if spans:
+            self._exporter.export(spans)
+
+    def close(self) -> None:
+        self._exporter.close()
+
+    def _span(
+        self,
+        trace_id: str,
+        name: str,
+        start_ns: int,
+        end_ns: int,
+        parent_id: str = '',
+        *,
+        span_id: str = '',
+        attributes: Optional[Dict[str, Any]] = None,
+    ) -> Span:
+        # pylint: disable=too-many-arguments
+        return Span(
+            trace_id=trace_id,
+            span_id=span_id or os.urandom(8).hex(),
+            parent_span_id=parent_id,
+            name=name,
+            start_unix_ns=start_ns + self._offset_ns,
+            end_unix_ns=end_ns + self._offset_ns,
+            attributes=attributes or {},
+        )
+
+
+def make_tracer(trace_file: str) -> Optional[Tracer]:
+    return Tracer(OtlpJsonExporter(trace_file)) if trace_file else None
+
+
+def _otlp_span(span: Span) -> Dict[str, Any]:
+    result: Dict[str, Any] = {
+        'traceId': span.trace_id,
+        'spanId': span.span_id,
+        'name': span.name,
+        'kind': 1,  # SPAN_KIND_INTERNAL
+        'startTimeUnixNano': str(span.start_unix_ns),
+        'endTimeUnixNano': str(span.end_unix_ns),
+        'attributes': _attributes(span.attributes),
+    }
+    if span.parent_span_id:
+        result['parentSpanId'] = span.parent_span_id
+    return result
+
+
+def _attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{'key': key, 'value': _any_value(value)} for key, value in attributes.items()]
+
+
+def _any_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
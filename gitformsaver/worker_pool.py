@@ -0,0 +1,119 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+LOG = logging.getLogger(__name__)
+
+
+class Job:
+    """Unit of work the pool schedules, e.g. the queue of a single repo."""
+
+    def next_run(self) -> Optional[float]:
+        """Monotonic time when the job wants to run, or None if it has nothing to do."""
+        raise NotImplementedError()
+
+    def run_once(self) -> None:
+        """Do one turn of work, the pool calls it again if next_run() says so."""
+        raise NotImplementedError()
+
+
+class WorkerPool:  # pylint: disable=too-many-instance-attributes
+    """Fixed number of threads taking turns on jobs that are due.
+
+    A job is run by at most one worker at a time. Due jobs are served round-robin,
+    one turn each, so a job with a large backlog can't starve the others.
+
+    Workers sleep until a job is woken up or its time comes, idle jobs cost nothing.
+    """
+
+    def __init__(self, size: int = 8) -> None:
+        self._condition = threading.Condition()
+        self._ready: Deque[Job] = deque()
+        self._due: List[Tuple[float, int, Job]] = []
+        self._scheduled: Dict[Job, float] = {}
+        self._active: Set[Job] = set()
+        self._counter = itertools.count()
+        self._running = True
+        self.wakeups = 0
+        self._threads = [
+            threading.Thread(target=self._run_thread, name=f'git-worker-{i}', daemon=True)
+            for i in range(size)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def wake(self, job: Job, when: float = 0.0) -> None:
+        """Run the job once the monotonic clock reaches ``when``."""
+        with self._condition:
+            self._schedule(job, when)
+
+    def stop(self, block: bool = True, timeout: Optional[float] = None) -> None:
+        """Let workers finish the jobs that are due and exit.
+
+        Waits for them up to timeout seconds if given, the workers are daemon threads.
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if block:
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            for thread in self._threads:
+                thread.join(max(deadline - time.monotonic(), 0) if deadline is not None else None)
+
+    @property
+    def size(self) -> int:
+        return len(self._threads)
+
+    def _schedule(self, job: Job, when: float) -> None:
+        if job in self._active:
+            # The worker running it asks for the next run when it's done.
+            return
+        scheduled = self._scheduled.get(job)
+        if scheduled is not None and scheduled <= when:
+            return
+        self._scheduled[job] = when
+        heapq.heappush(self._due, (when, next(self._counter), job))
+        self._condition.notify()
+
+    def _run_thread(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                job.run_once()
+            except Exception:  # pylint: disable=broad-except
+                LOG.exception("Job %r failed", job)
+            with self._condition:
+                self._active.discard(job)
+                when = job.next_run()
+                if when is not None:
+                    self._schedule(job, when)
+
+    def _next_job(self) -> Optional[Job]:
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._promote(now)
+                if self._ready:
+                    return self._ready.popleft()
+                if not self._running:
+                    return None
+                timeout = self._due[0][0] - now if self._due else None
+                self._condition.wait(timeout=timeout)
+                self.wakeups += 1
+
+    def _promote(self, now: float) -> None:
+        """Move jobs which are due to the end of the ready queue."""
+        while self._due and self._due[0][0] <= now:
+            when, _, job = heapq.heappop(self._due)
+            if self._scheduled.get(job) != when:
+                # Superseded by an earlier wake-up.
+                continue
+            del self._scheduled[job]
+            self._active.add(job)
+            self._ready.append(job)
@@ -0,0 +1,290 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .git_task_handler import WriteTask
+
+LOG = logging.getLogger(__name__)
+# Segment and number of a record within it
+WalRecord = Tuple[int, int]
+
+
+class GroupCommitter:
+    """Background thread that fsyncs all logs with new records in one go.
+
+    Submissions that arrive while a round of fsyncs is running share the next round,
+    so the per-submission cost is a single write() and waiting for the nearest fsync.
+    """
+
+    def __init__(self) -> None:
+        self._dirty: Set['WriteAheadLog'] = set()
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run_thread, daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self, wal: 'WriteAheadLog') -> None:
+        with self._condition:
+            self._dirty.add(wal)
+            self._condition.notify()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+
+    def _run_thread(self) -> None:
+        while True:
+            with self._condition:
+                while self._running and not self._dirty:
+                    self._condition.wait()
+                if not self._dirty:
+                    return
+                dirty, self._dirty = self._dirty, set()
+            for wal in dirty:
+                wal.sync()
+
+
+class WriteAheadLog:  # pylint: disable=too-many-instance-attributes
+    """Append-only log of the submissions accepted for a single repo.
+
+    Records are appended to numbered segment files. Pushed records are noted in a marker
+    file next to their segment, and the segment is deleted once all of its records were pushed.
+    Replay skips the noted records, so only unpushed submissions are replayed
+    (or pushed ones, if the machine crashed before their markers reached the disk).
+    """
+
+    _SUFFIX = '.wal'
+    _DONE_SUFFIX = '.done'
+    _REPO_FILE = 'repo'
+
+    def __init__(
+        self, directory: str, repo: str, committer: GroupCommitter, segment_bytes: int = 4 << 20
+    ) -> None:
+        self._directory = directory
+        self._committer = committer
+        self._segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._pending: Dict[int, int] = {}
+        self._records = 0
+        self._waiters: List[Future] = []
+        self._unsynced: List[int] = []
+        # Set when a segment was created, its directory entry is synced with the records.
+        self._new_segment = False
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+            _fsync_directory(os.path.dirname(os.path.abspath(directory)))
+        self._write_repo(repo)
+        existing = self._segments()
+        self._segment = existing[-1] + 1 if existing else 0
+        self._fd = self._open(self._segment)
+        self._size = 0
+
+    @classmethod
+    def read_repo(cls, directory: str) -> str:
+        with open(os.path.join(directory, cls._REPO_FILE), encoding='utf-8') as fobj:
+            return fobj.read()
+
+    def append(self, task: WriteTask) -> Tuple[WalRecord, Future]:
+        """Log the task, return its record and a future resolved once it's on disk."""
+        fields = [task.rel_path, task.text, task.secret, task.repo]
+        record = json.dumps(fields).encode('utf-8') + b'\n'
+        durable: Future = Future()
+        with self._lock:
+            os.write(self._fd, record)
+            self._size += len(record)
+            segment, number = self._segment, self._records
+            self._records += 1
+            self._pending[segment] = self._pending.get(segment, 0) + 1
+            self._waiters.append(durable)
+            if self._size >= self._segment_bytes:
+                self._rotate()
+        self._committer.mark_dirty(self)
+        return (segment, number), durable
+
+    def replay(self) -> List[Tuple[WalRecord, WriteTask]]:
+        """Return unpushed submissions from the segments left by a previous log."""
+        result: List[Tuple[WalRecord, WriteTask]] = []
+        with self._lock:
+            segments = self._segments()
+            for segment in segments:
+                if segment >= self._segment:
+                    break
+                done = self._read_done(segment)
+                records = [
+                    ((segment, number), task)
+                    for number, task in self._read(segment)
+                    if number not in done
+                ]
+                if records:
+                    self._pending[segment] = len(records)
+                    result.extend(records)
+                else:
+                    self._delete(segment)
+            self._delete_orphan_markers(set(segments))
+        return result
+
+    def complete(self, records: Iterable[WalRecord]) -> None:
+        """Mark the records as pushed."""
+        by_segment: Dict[int, List[int]] = {}
+        for segment, number in records:
+            by_segment.setdefault(segment, []).append(number)
+        with self._lock:
+            for segment, numbers in by_segment.items():
+                self._pending[segment] -= len(numbers)
+                if self._pending[segment]:
+                    self._write_done(segment, numbers)
+                    continue
+                del self._pending[segment]
+                if segment == self._segment:
+                    self._rotate()
+                self._delete(segment)
+
+    def sync(self) -> None:
+        with self._lock:
+            if self._fd < 0:
+                # Closed, everything was synced then.
+                return
+            waiters, self._waiters = self._waiters, []
+            unsynced, self._unsynced = self._unsynced, []
+            new_segment, self._new_segment = self._new_segment, False
+            fd = os.dup(self._fd)
+        try:
+            for old_fd in unsynced:
+                os.fsync(old_fd)
+                os.close(old_fd)
+            os.fsync(fd)
+            if new_segment:
+                _fsync_directory(self._directory)
+        except OSError as exc:
+            LOG.exception("Failed to sync write-ahead log %s", self._directory)
+            for waiter in waiters:
+                waiter.set_exception(exc)
+            return
+        finally:
+            os.close(fd)
+        for waiter in waiters:
+            waiter.set_result(None)
+
+    def close(self) -> None:
+        self.sync()
+        with self._lock:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _rotate(self) -> None:
+        self._unsynced.append(self._fd)
+        self._segment += 1
+        self._fd = self._open(self._segment)
+        self._size = 0
+        self._records = 0
+
+    def _open(self, segment: int) -> int:
+        self._new_segment = True
+        return os.open(self._path(segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+
+    def _write_repo(self, repo: str) -> None:
+        """Atomically, so that a crash can't leave the logs without their repo."""
+        try:
+            if self.read_repo(self._directory) == repo:
+                return
+        except FileNotFoundError:
+            pass
+        path = os.path.join(self._directory, self._REPO_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as fobj:
+            fobj.write(repo)
+            fobj.flush()
+            os.fsync(fobj.fileno())
+        os.replace(path + '.tmp', path)
+        _fsync_directory(self._directory)
+
+    def _read(self, segment: int) -> Iterable[Tuple[int, WriteTask]]:
+        with open(self._path(segment), 'rb') as fobj:
+            for number, line in enumerate(fobj):
+                if not line.endswith(b'\n'):
+                    LOG.warning("Skipping torn record at the end of %s", self._path(segment))
+                    break
+                try:
+                    rel_path, text, secret, repo = json.loads(line)
+                except (ValueError, TypeError):
+                    LOG.error("Skipping corrupt record %d of %s", number, self._path(segment))
+                    continue
+                yield number, WriteTask(rel_path=rel_path, text=text, secret=secret, repo=repo)
+
+    def _write_done(self, segment: int, numbers: List[int]) -> None:
+        """Not synced, the page cache keeps the markers for logs reopened by this process."""
+        markers = ''.join(f'{number}\n' for number in numbers).encode('ascii')
+        fd = os.open(self._done_path(segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        try:
+            os.write(fd, markers)
+        finally:
+            os.close(fd)
+
+    def _read_done(self, segment: int) -> Set[int]:
+        try:
+            with open(self._done_path(segment), 'rb') as fobj:
+                # A torn last marker leaves its record to be replayed.
+                return {int(line) for line in fobj if line.endswith(b'\n')}
+        except FileNotFoundError:
+            return set()
+
+    def _delete(self, segment: int) -> None:
+        # The segment goes first, a marker file without it is harmless.
+        for path in (self._path(segment), self._done_path(segment)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _delete_orphan_markers(self, segments: Set[int]) -> None:
+        for name in os.listdir(self._directory):
+            if name.endswith(self._DONE_SUFFIX):
+                if int(name[: -len(self._DONE_SUFFIX)]) not in segments:
+                    os.unlink(os.path.join(self._directory, name))
+
+    def _segments(self) -> List[int]:
+        return sorted(
+            int(name[: -len(self._SUFFIX)])
+            for name in os.listdir(self._directory)
+            if name.endswith(self._SUFFIX)
+        )
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self._directory, f'{segment:012d}{self._SUFFIX}')
+
+    def _done_path(self, segment: int) -> str:
+        return os.path.join(self._directory, f'{segment:012d}{self._DONE_SUFFIX}')
+
+
+def _fsync_directory(directory: str) -> None:
+    """Make the files created in the directory survive a crash."""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def find_logs(root: str) -> Dict[str, str]:
+    """Map repos to directories of their write-ahead logs under the root."""
+    result: Dict[str, str] = {}
+    if not os.path.isdir(root):
+        return result
+    for name in os.listdir(root):
+        directory = os.path.join(root, name)
+        try:
+            result[WriteAheadLog.read_repo(directory)] = directory
+        except OSError:
+            continue
+    return result
+
+
+def log_directory(root: str, repo: str) -> Optional[str]:
+    if not root:
+        return None
+    return os.path.join(root, hashlib.sha256(repo.encode('utf-8')).hexdigest()[:32])
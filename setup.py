@@ -37,6 +37,7 @@ setup(
         'console_scripts': [
             'git-form-saver=gitformsaver.cli:run_http_server',
             'git-form-saver-jwt-token=gitformsaver.cli:generate_token',
+            'git-form-saver-bench=gitformsaver.cli:run_benchmark',
         ]
     },
     include_package_data=True,
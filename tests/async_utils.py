@@ -1,14 +1,37 @@
 import asyncio
+from typing import AsyncIterator
+from urllib.parse import urlencode
+
 from multidict import MultiDict
 
 
 def run(future):
-    return asyncio.new_event_loop().run_until_complete(future)
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(future)
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+class FakeContent:
+    def __init__(self, body: bytes) -> None:
+        self._body = body
+
+    async def iter_chunked(self, size: int) -> AsyncIterator[bytes]:
+        for start in range(0, len(self._body), size):
+            yield self._body[start : start + size]
 
 
 class FakeRequest:
+    """Request with urlencoded form body."""
+
+    content_type = 'application/x-www-form-urlencoded'
+    charset = None
+
     def __init__(self, result: dict, headers: dict = None) -> None:
         self._result = MultiDict(result)
+        self.content = FakeContent(urlencode(list(self._result.items())).encode())
         self.headers = headers or {'Referer': 'Referer'}
 
     async def post(self) -> MultiDict:
@@ -0,0 +1,41 @@
+import pathlib
+import subprocess
+
+GIT_IDENTITY = {
+    'GIT_AUTHOR_NAME': 'Test',
+    'GIT_AUTHOR_EMAIL': 'test@example.com',
+    'GIT_COMMITTER_NAME': 'Test',
+    'GIT_COMMITTER_EMAIL': 'test@example.com',
+}
+
+
+def git(cwd: pathlib.Path, *args: str) -> str:
+    return subprocess.run(
+        ['git', *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def make_remote(root: pathlib.Path, files: dict) -> str:
+    """Create bare repo with a single commit of the files."""
+    remote = root / 'remote.git'
+    git(root, 'init', '--quiet', '--bare', '--initial-branch=main', str(remote))
+    seed = root / 'seed'
+    git(root, 'clone', '--quiet', str(remote), str(seed))
+    for name, content in files.items():
+        (seed / name).write_text(content, encoding='utf-8')
+    git(seed, 'add', '-A')
+    git(seed, 'commit', '--quiet', '-m', 'Initial commit')
+    git(seed, 'push', '--quiet', 'origin', 'HEAD:main')
+    return str(remote)
+
+
+def commit_to_remote(remote: str, workdir: pathlib.Path, name: str, text: str = 'text\n') -> None:
+    """Append text to a file in the remote through a separate working copy."""
+    if not workdir.exists():
+        git(workdir.parent, 'clone', '--quiet', remote, str(workdir))
+    git(workdir, 'pull', '--quiet')
+    with open(workdir / name, 'a', encoding='utf-8') as fobj:
+        fobj.write(text)
+    git(workdir, 'add', name)
+    git(workdir, 'commit', '--quiet', '-m', f'Update {name}')
+    git(workdir, 'push', '--quiet')
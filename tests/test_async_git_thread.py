@@ -0,0 +1,143 @@
+import pathlib
+import threading
+from unittest import mock
+
+import pytest
+
+from gitformsaver.async_git import AsyncGitOps, AsyncLazyGit
+from gitformsaver.async_git_thread import AsyncGitTaskHandler, AsyncGitThread
+from gitformsaver.authentication_interface import AuthenticationInterface
+from gitformsaver.git_client import GitConflictError, GitError, PushRejectedError
+from gitformsaver.git_thread import CoalescingPolicy
+
+from .async_utils import run
+from .git_utils import GIT_IDENTITY, commit_to_remote, git, make_remote
+
+
+def test_submissions_are_pushed_in_one_commit(
+    remote: str, tmp_path: pathlib.Path, mock_authentication: AuthenticationInterface
+) -> None:
+    async def scenario() -> None:
+        git_thread = _make_git_thread(str(tmp_path / 'copy'), mock_authentication)
+        git_thread.clone_soon(remote)
+        git_thread.push_soon('README.md', 'a\n')
+        git_thread.push_soon('README.md', 'b\n')
+        git_thread.stop()
+        await git_thread.drain()
+        assert git_thread.stats.batch_size.sum == 2
+
+    run(scenario())
+    assert git(pathlib.Path(remote), 'show', 'main:README.md') == 'GFS-JWT:token\na\nb'
+    assert git(pathlib.Path(remote), 'rev-list', '--count', 'main') == '2'
+
+
+def test_tokens_are_verified_off_the_event_loop(
+    remote: str, tmp_path: pathlib.Path, mock_authentication: AuthenticationInterface
+) -> None:
+    threads = []
+
+    def is_valid_token(*args) -> bool:
+        del args
+        threads.append(threading.current_thread())
+        return True
+
+    mock_authentication.is_valid_token.side_effect = is_valid_token
+
+    async def scenario() -> None:
+        git_thread = _make_git_thread(str(tmp_path / 'copy'), mock_authentication)
+        git_thread.clone_soon(remote)
+        git_thread.push_soon('README.md', 'a\n')
+        git_thread.stop()
+        await git_thread.drain()
+
+    run(scenario())
+    assert threads and threading.main_thread() not in threads
+
+
+def test_rejected_push_is_rebased(remote: str, tmp_path: pathlib.Path) -> None:
+    async def scenario() -> None:
+        local = await AsyncGitOps().clone(remote, str(tmp_path / 'copy'))
+        commit_to_remote(remote, tmp_path / 'upstream', 'OTHER.md')
+        with open(tmp_path / 'copy' / 'README.md', 'a', encoding='utf-8') as fobj:
+            fobj.write('local\n')
+        assert await local.commit('Local change')
+        with pytest.raises(PushRejectedError):
+            await local.push()
+        assert await local.push_or_rebase() == 1
+
+    run(scenario())
+    assert git(pathlib.Path(remote), 'show', 'main:OTHER.md') == 'text'
+
+
+def test_conflicting_commits_are_reapplied_on_upstream(
+    remote: str, tmp_path: pathlib.Path
+) -> None:
+    async def scenario() -> None:
+        copy = tmp_path / 'copy'
+        local = await AsyncGitOps().clone(remote, str(copy))
+        commit_to_remote(remote, tmp_path / 'upstream', 'README.md', 'remote\n')
+        for text in ('first\n', 'second\n'):
+            with open(copy / 'README.md', 'a', encoding='utf-8') as fobj:
+                fobj.write(text)
+            assert await local.commit(f'Local {text.strip()}', [str(copy / 'README.md')])
+        with pytest.raises(GitConflictError):
+            await local.push_or_rebase()
+        await local.reapply_on_upstream()
+        assert await local.push_or_rebase() == 0
+
+    run(scenario())
+    assert git(pathlib.Path(remote), 'show', 'main:README.md') == (
+        'GFS-JWT:token\nremote\nfirst\nsecond'
+    )
+
+
+def test_existing_working_copy_is_reused(remote: str, tmp_path: pathlib.Path) -> None:
+    copy = tmp_path / 'copy'
+    run(AsyncGitOps().clone(remote, str(copy)))
+    (copy / 'marker').write_text('', encoding='utf-8')
+    commit_to_remote(remote, tmp_path / 'upstream', 'OTHER.md')
+    run(AsyncGitOps().clone(remote, str(copy)))
+    assert (copy / 'marker').exists()
+    assert (copy / 'OTHER.md').exists()
+
+
+@pytest.mark.parametrize('name, conflicts', [('LOCAL.md', False), ('README.md', True)])
+def test_unpushed_commits_of_existing_copy_are_kept(
+    remote: str, tmp_path: pathlib.Path, name: str, conflicts: bool
+) -> None:
+    copy = tmp_path / 'copy'
+    run(AsyncGitOps().clone(remote, str(copy)))
+    with open(copy / name, 'a', encoding='utf-8') as fobj:
+        fobj.write('local\n')
+    git(copy, 'add', name)
+    git(copy, 'commit', '--quiet', '-m', 'Local change')
+    commit_to_remote(remote, tmp_path / 'upstream', 'README.md')
+    if conflicts:
+        with pytest.raises(GitError):
+            run(AsyncGitOps().clone(remote, str(copy)))
+    else:
+        run(AsyncGitOps().clone(remote, str(copy)))
+        assert git(copy, 'log', '--format=%s', '-2', 'HEAD~') == 'Update README.md\nInitial commit'
+    assert git(copy, 'log', '--format=%s', '-1') == 'Local change'
+
+
+def _make_git_thread(path: str, authentication: AuthenticationInterface) -> AsyncGitThread:
+    handler = AsyncGitTaskHandler(
+        git=AsyncLazyGit(path, AsyncGitOps()), repo='repo', authentication=authentication
+    )
+    return AsyncGitThread(handler, CoalescingPolicy(max_latency=60))
+
+
+@pytest.fixture(name='remote')
+def _remote(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> str:
+    for name, value in GIT_IDENTITY.items():
+        monkeypatch.setenv(name, value)
+    return make_remote(tmp_path, {'README.md': 'GFS-JWT:token\n'})
+
+
+@pytest.fixture(name='mock_authentication')
+def _mock_authentication() -> AuthenticationInterface:
+    obj = mock.Mock(spec_set=AuthenticationInterface)
+    obj.extract_token.return_value = 'token'
+    obj.is_valid_token.return_value = True
+    return obj
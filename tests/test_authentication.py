@@ -3,10 +3,13 @@ import os
 import pytest
 
 from gitformsaver.authentication import Authentication
+from gitformsaver.signing_backends import Ed25519Backend, HMACBackend, RSABackend
 
 HERE = os.path.abspath(os.path.dirname(__file__))
 KEYS_PATH = os.path.join(HERE, "keys")
 PRIVATE_KEY_PATH = os.path.join(KEYS_PATH, "id_rsa")
+ED25519_KEY_PATH = os.path.join(KEYS_PATH, "id_ed25519")
+HMAC_SECRET = "server-secret-of-at-least-32-bytes"
 
 
 @pytest.mark.parametrize('secret', ['', '***', 'very-long-secret-' * 10])
@@ -20,6 +23,37 @@ def test_new_token_is_valid(authentication: Authentication, secret: str) -> None
     assert 650 < len(token) < 1000
 
 
+@pytest.mark.parametrize(
+    'backend',
+    [Ed25519Backend(ED25519_KEY_PATH), HMACBackend(HMAC_SECRET)],
+    ids=['EdDSA', 'HS256'],
+)
+def test_fast_backend_token_is_valid(backend) -> None:
+    authentication = Authentication(backends=[backend])
+    token = authentication.extract_token(authentication.create_token('repo', 'path', 'secret'))
+    assert authentication.is_valid_token(token, 'repo', 'path', 'secret')
+    assert not authentication.is_valid_token(token, 'repo', 'other-path', 'secret')
+
+
+def test_rs256_tokens_stay_valid_after_switching_algorithm(
+    authentication: Authentication,
+) -> None:
+    token = authentication.extract_token(authentication.create_token('repo', 'path'))
+    switched = Authentication(
+        backends=[Ed25519Backend(ED25519_KEY_PATH), RSABackend(PRIVATE_KEY_PATH)]
+    )
+    assert switched.is_valid_token(token, 'repo', 'path')
+    new_token = switched.extract_token(switched.create_token('repo', 'path'))
+    assert len(new_token) < len(token)
+    assert switched.is_valid_token(new_token, 'repo', 'path')
+
+
+def test_token_of_disabled_algorithm_is_invalid(authentication: Authentication) -> None:
+    hmac_authentication = Authentication(backends=[HMACBackend(HMAC_SECRET)])
+    token = hmac_authentication.extract_token(hmac_authentication.create_token('repo', 'path'))
+    assert not authentication.is_valid_token(token, 'repo', 'path')
+
+
 @pytest.fixture(name='authentication')
 def _authentication() -> Authentication:
     return Authentication(private_key_path=PRIVATE_KEY_PATH)
@@ -0,0 +1,44 @@
+import pytest
+
+from gitformsaver.backpressure import Backlog
+from gitformsaver.errors import QueueFullError
+
+
+def test_repo_limit_is_reported_as_local(server: Backlog) -> None:
+    repo = Backlog(max_tasks=1, max_bytes=100, parent=server)
+    repo.reserve(10)
+    with pytest.raises(QueueFullError) as exc_info:
+        repo.reserve(10)
+    assert not exc_info.value.is_global
+    assert server.tasks == 1
+
+
+def test_server_limit_is_reported_as_global(server: Backlog) -> None:
+    first = Backlog(max_tasks=10, max_bytes=100, parent=server)
+    second = Backlog(max_tasks=10, max_bytes=100, parent=server)
+    first.reserve(30)
+    first.reserve(30)
+    with pytest.raises(QueueFullError) as exc_info:
+        second.reserve(1)
+    assert exc_info.value.is_global
+    assert (second.tasks, second.bytes) == (0, 0)
+
+
+def test_release_frees_room(server: Backlog) -> None:
+    repo = Backlog(max_tasks=1, max_bytes=100, parent=server)
+    repo.reserve(10)
+    repo.release(10)
+    repo.reserve(10)
+    assert (server.tasks, server.bytes) == (1, 10)
+
+
+def test_oversized_submission_fits_into_empty_queue(server: Backlog) -> None:
+    repo = Backlog(max_tasks=10, max_bytes=5, parent=server)
+    repo.reserve(50)
+    with pytest.raises(QueueFullError):
+        repo.reserve(1)
+
+
+@pytest.fixture(name='server')
+def _server() -> Backlog:
+    return Backlog(max_tasks=2, max_bytes=60)
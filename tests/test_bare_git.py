@@ -0,0 +1,99 @@
+import pathlib
+from unittest import mock
+
+import pytest
+
+from gitformsaver import errors
+from gitformsaver.authentication_interface import AuthenticationInterface
+from gitformsaver.bare_git import normalize_path
+from gitformsaver.git_ops import GitOps
+from gitformsaver.git_task_handler import BareGitTaskHandler, CloneTask, WriteTask
+from gitformsaver.lazy_git import LazyGit
+
+from .git_utils import GIT_IDENTITY, commit_to_remote, git, make_remote
+
+
+def test_submissions_are_committed_without_working_copy(
+    remote: str, tmp_path: pathlib.Path, handler: BareGitTaskHandler
+) -> None:
+    handler.handle_clone(CloneTask(url=remote))
+    with pytest.raises(errors.UserFacingError, match='No such file'):
+        handler.handle_writes(
+            [
+                WriteTask('README.md', 'a\n'),
+                WriteTask('/README.md', 'b\n'),
+                WriteTask('new.md', 'c\n'),
+            ]
+        )
+    assert git(pathlib.Path(remote), 'show', 'main:README.md') == 'GFS-JWT:token\na\nb'
+    assert not (tmp_path / 'copy' / 'README.md').exists()
+
+
+def test_rejected_push_is_rebuilt_on_top_of_remote(
+    remote: str, tmp_path: pathlib.Path, handler: BareGitTaskHandler
+) -> None:
+    handler.handle_clone(CloneTask(url=remote))
+    commit_to_remote(remote, tmp_path / 'upstream', 'README.md', 'remote\n')
+    handler.handle_writes([WriteTask('README.md', 'local\n')])
+    assert git(pathlib.Path(remote), 'show', 'main:README.md') == 'GFS-JWT:token\nremote\nlocal'
+    assert handler._stats.push_retries == 1  # pylint: disable=protected-access
+
+
+def test_commits_of_failed_pushes_are_kept(
+    remote: str, tmp_path: pathlib.Path, handler: BareGitTaskHandler
+) -> None:
+    handler.handle_clone(CloneTask(url=remote))
+    hook = pathlib.Path(remote) / 'hooks' / 'pre-receive'
+    hook.write_text('#!/bin/sh\nexit 1\n', encoding='utf-8')
+    hook.chmod(0o755)
+    with pytest.raises(errors.UnpushedError):
+        handler.handle_writes([WriteTask('README.md', 'first\n')])
+    hook.unlink()
+    commit_to_remote(remote, tmp_path / 'upstream', 'README.md', 'remote\n')
+    handler.handle_writes([WriteTask('README.md', 'second\n')])
+    assert (
+        git(pathlib.Path(remote), 'show', 'main:README.md')
+        == 'GFS-JWT:token\nremote\nfirst\nsecond'
+    )
+
+
+def test_nested_files_keep_siblings(remote: str, tmp_path: pathlib.Path) -> None:
+    commit_to_remote(remote, tmp_path / 'upstream', 'GFS.md', 'GFS-JWT:token\n')
+    upstream = tmp_path / 'upstream'
+    (upstream / 'forms').mkdir()
+    (upstream / 'forms' / 'a.md').write_text('GFS-JWT:token\n', encoding='utf-8')
+    (upstream / 'forms' / 'b.md').write_text('b\n', encoding='utf-8')
+    git(upstream, 'add', '-A')
+    git(upstream, 'commit', '--quiet', '-m', 'Add forms')
+    git(upstream, 'push', '--quiet')
+    local = GitOps(bare=True).clone(remote, str(tmp_path / 'copy'))
+    assert local.commit_appends({'forms/a.md': 'a\n'}, 'Append')
+    local.push()
+    assert git(pathlib.Path(remote), 'show', 'main:forms/a.md') == 'GFS-JWT:token\na'
+    assert git(pathlib.Path(remote), 'show', 'main:forms/b.md') == 'b'
+    git(pathlib.Path(remote), 'fsck', '--strict')
+
+
+@pytest.mark.parametrize('rel_path', ['..', '../x', '/../x', 'a/../../x'])
+def test_paths_outside_of_repo_are_rejected(rel_path: str) -> None:
+    assert normalize_path(rel_path) is None
+
+
+@pytest.fixture(name='handler')
+def _handler(tmp_path: pathlib.Path) -> BareGitTaskHandler:
+    authentication = mock.Mock(spec_set=AuthenticationInterface)
+    authentication.extract_token.return_value = 'token'
+    authentication.is_valid_token.return_value = True
+    return BareGitTaskHandler(
+        git=LazyGit(str(tmp_path / 'copy'), GitOps(bare=True)),
+        repo='repo',
+        authentication=authentication,
+        optimistic=True,
+    )
+
+
+@pytest.fixture(name='remote')
+def _remote(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> str:
+    for name, value in GIT_IDENTITY.items():
+        monkeypatch.setenv(name, value)
+    return make_remote(tmp_path, {'README.md': 'GFS-JWT:token\n'})
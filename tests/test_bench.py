@@ -0,0 +1,20 @@
+import pathlib
+
+from gitformsaver.bench import BenchConfig, run_benchmark
+from gitformsaver.git_thread import CoalescingPolicy
+from gitformsaver.settings import Settings
+
+from .async_utils import run
+
+
+def test_submissions_reach_local_remotes(tmp_path: pathlib.Path) -> None:
+    config = BenchConfig(repos=2, requests=20, concurrency=4, visibility_timeout=30)
+    settings = Settings(coalescing=CoalescingPolicy(max_latency=0.05))
+    result = run(run_benchmark(config, str(tmp_path), settings))
+    assert result.routes['/'].requests == 18
+    assert result.routes['/token'].requests == 2
+    assert not any(route.errors for route in result.routes.values())
+    assert result.invisible == 0
+    assert result.commits >= 2
+    assert result.pushes >= 2
+    assert result.visibility_lag_max_ms > 0
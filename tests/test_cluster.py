@@ -0,0 +1,219 @@
+import pathlib
+import threading
+from dataclasses import dataclass
+from typing import Callable
+from unittest import mock
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer, unused_port
+
+from gitformsaver.cluster import ClusterGitThreadManager, ClusterService
+from gitformsaver.errors import QueueFullError
+from gitformsaver.git_thread import GitThread
+from gitformsaver.git_thread_manager import GitThreadManager
+from gitformsaver.leases import Lease, SqliteLeaseBackend
+from gitformsaver.sharding import DeferredGitThread, HashRing
+
+from .async_utils import run
+
+TTL = 30.0
+SECRET = b'cluster secret'
+REPOS = [f'git@host:repo{index}.git' for index in range(20)]
+RING = HashRing(['http://a', 'http://b'])
+PREFERS_A = sorted(
+    f'host/repo{index}.git' for index, repo in enumerate(REPOS) if RING.owner(repo) == 'http://a'
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@dataclass
+class Node:
+    cluster: ClusterGitThreadManager
+    git_thread_manager: mock.Mock
+
+    @property
+    def git_thread(self) -> GitThread:
+        return self.git_thread_manager.return_value
+
+
+MakeNode = Callable[..., Node]
+
+
+def test_single_node_leases_repos_it_writes_to(make_node: MakeNode) -> None:
+    node = make_node('http://a')
+    node.cluster.maintain()
+    run(_push(node.cluster('git@host:repo.git')))
+    node.git_thread.push_soon.assert_called_once_with(
+        'file.md', 'text', repo='git@host:repo.git', accepted_at=0.0
+    )
+    assert node.cluster.held == ['host/repo.git']
+    assert node.cluster('git@host:repo.git') is node.git_thread
+
+
+def test_leases_are_taken_off_the_event_loop(make_node: MakeNode) -> None:
+    node = make_node('http://a')
+    node.cluster.maintain()
+    threads = []
+    acquire = SqliteLeaseBackend.acquire
+
+    def record_thread(backend: SqliteLeaseBackend, key: str, name: str, ttl: float) -> Lease:
+        threads.append(threading.current_thread().name)
+        return acquire(backend, key, name, ttl)
+
+    with mock.patch.object(SqliteLeaseBackend, 'acquire', record_thread):
+        run(_push(node.cluster('git@host:repo.git')))
+    assert threads and all(name.startswith('leases') for name in threads)
+
+
+def test_free_repos_go_to_preferred_nodes(make_node: MakeNode) -> None:
+    first, second = make_node('http://a'), make_node('http://b')
+    second.cluster.maintain()
+    first.cluster.maintain()
+    assert [first.cluster.owner(repo) for repo in REPOS] == [RING.owner(repo) for repo in REPOS]
+    assert first.cluster.held == PREFERS_A
+
+
+def test_lease_holder_gets_repos_regardless_of_preference(make_node: MakeNode) -> None:
+    first, second = make_node('http://a'), make_node('http://b')
+    first.cluster.maintain()
+    for repo in REPOS:
+        first.cluster.owner(repo)
+    second.cluster.maintain()
+    assert all(second.cluster.owner(repo) == 'http://a' for repo in REPOS)
+    assert not second.cluster.held
+
+
+def test_idle_repos_are_handed_over_to_joining_node(make_node: MakeNode) -> None:
+    first, second = make_node('http://a'), make_node('http://b')
+    first.cluster.maintain()
+    for repo in REPOS:
+        first.cluster.owner(repo)
+    second.cluster.maintain()
+    first.cluster.maintain()
+    assert first.cluster.held == PREFERS_A
+    for repo in REPOS:
+        if RING.owner(repo) == 'http://b':
+            assert second.cluster.owner(repo) == 'http://b'
+            assert second.cluster(repo) is second.git_thread
+
+
+def test_busy_repos_stay_with_their_holder(make_node: MakeNode) -> None:
+    first, second = make_node('http://a'), make_node('http://b')
+    first.cluster.maintain()
+    for repo in REPOS:
+        first.cluster.owner(repo)
+    first.git_thread_manager.unload.return_value = False
+    second.cluster.maintain()
+    first.cluster.maintain()
+    assert len(first.cluster.held) == len(REPOS)
+
+
+def test_leases_of_dead_node_expire(make_node: MakeNode, clock: FakeClock) -> None:
+    first, second = make_node('http://a'), make_node('http://b')
+    first.cluster.maintain()
+    first.cluster.owner('git@host:repo.git')
+    clock.now += TTL
+    second.cluster.maintain()
+    assert second.cluster.owner('git@host:repo.git') == 'http://b'
+
+
+def test_leaving_node_releases_its_leases(make_node: MakeNode) -> None:
+    first, second = make_node('http://a'), make_node('http://b')
+    first.cluster.maintain()
+    first.cluster.owner('git@host:repo.git')
+    first.cluster.stop()
+    run(first.cluster.drain())
+    second.cluster.maintain()
+    assert second.cluster.owner('git@host:repo.git') == 'http://b'
+
+
+def test_lost_lease_unloads_repo_once_idle(make_node: MakeNode, clock: FakeClock) -> None:
+    node = make_node('http://a')
+    node.cluster.maintain()
+    node.cluster.owner('git@host:repo.git')
+    node.git_thread_manager.repos.return_value = ['host/repo.git']
+    clock.now += TTL
+    node.cluster.maintain()
+    node.git_thread_manager.unload.assert_called_once_with('host/repo.git')
+
+
+def test_forwarded_repo_leased_elsewhere_is_rejected(make_node: MakeNode) -> None:
+    first, second = make_node('http://a'), make_node('http://b')
+    first.cluster.maintain()
+    first.cluster.owner('git@host:repo.git')
+    with pytest.raises(QueueFullError) as exc_info:
+        run(_push(second.cluster.local('git@host:repo.git')))
+    assert exc_info.value.is_global
+    second.git_thread.push_soon.assert_not_called()
+
+
+def test_submission_is_forwarded_to_lease_holder(make_node: MakeNode) -> None:
+    port = unused_port()
+    holder = make_node(f'http://127.0.0.1:{port}')
+    run(_forward(port, holder, make_node('http://other')))
+    holder.git_thread.push_soon.assert_called_once_with(
+        'file.md', 'text', repo='git@host:repo.git', accepted_at=1.5
+    )
+
+
+def test_submission_signed_with_other_secret_is_rejected(make_node: MakeNode) -> None:
+    port = unused_port()
+    holder = make_node(f'http://127.0.0.1:{port}')
+    with pytest.raises(QueueFullError):
+        run(_forward(port, holder, make_node('http://other', secret=b'other secret')))
+    holder.git_thread.push_soon.assert_not_called()
+
+
+async def _push(git_thread: DeferredGitThread) -> None:
+    assert isinstance(git_thread, DeferredGitThread)
+    await git_thread.push_soon('file.md', 'text')
+
+
+async def _forward(port: int, holder: Node, other: Node) -> None:
+    """Forward a submission from other to the holder of the repo serving on the port."""
+    app = web.Application()
+    ClusterService(cluster=holder.cluster, secret=SECRET).setup(app)
+    server = TestServer(app, host='127.0.0.1', port=port)
+    await server.start_server()
+    try:
+        holder.cluster.maintain()
+        holder.cluster.owner('git@host:repo.git')
+        other.cluster.maintain()
+        await other.cluster('git@host:repo.git').push_soon('file.md', 'text', accepted_at=1.5)
+    finally:
+        await other.cluster.drain()
+        await server.close()
+
+
+@pytest.fixture(name='clock')
+def _clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture(name='make_node')
+def _make_node(tmp_path: pathlib.Path, clock: FakeClock) -> MakeNode:
+    def make_node(name: str, secret: bytes = SECRET) -> Node:
+        git_thread_manager = mock.Mock(spec_set=GitThreadManager)
+        git_thread_manager.return_value = mock.Mock(spec_set=GitThread)
+        git_thread_manager.return_value.push_soon.return_value = None
+        git_thread_manager.repos.return_value = []
+        git_thread_manager.unload.return_value = True
+        cluster = ClusterGitThreadManager(
+            git_thread_manager=git_thread_manager,
+            backend=SqliteLeaseBackend(str(tmp_path / 'cluster.db'), clock=clock),
+            node=name,
+            lease_ttl=TTL,
+            clock=clock,
+            secret=secret,
+        )
+        return Node(cluster=cluster, git_thread_manager=git_thread_manager)
+
+    return make_node
@@ -0,0 +1,97 @@
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from gitformsaver import errors
+from gitformsaver.form_parser import Form, FormLimits, parse_form
+
+from .async_utils import run
+
+CONTROL_FIELDS = ('repo', 'file')
+LIMITS = FormLimits(max_field_bytes=100, max_form_bytes=1000, max_fields=10)
+
+
+def test_urlencoded_fields_are_split_in_one_pass() -> None:
+    form = _post('repo=r&key=a+b%21&repo=other&key=%D0%B6&empty=&flag')
+    assert form.controls == {'repo': 'r'}
+    assert form.pairs == [('key', 'a b!'), ('key', 'ж'), ('empty', ''), ('flag', '')]
+
+
+def test_multipart_fields_are_split_in_one_pass() -> None:
+    data = aiohttp.FormData()
+    data.add_field('file', 'README.md')
+    data.add_field('key', 'value')
+    data.add_field('upload', b'binary', filename='upload.bin')
+    data.add_field('key', 'ж')
+    form = _post(data)
+    assert form.controls == {'file': 'README.md'}
+    assert form.pairs == [('key', 'value'), ('key', 'ж')]
+
+
+@pytest.mark.parametrize(
+    'body, message',
+    [
+        ('key=' + 'x' * 200, 'Form field is larger than 100 bytes'),
+        ('&'.join(['key=' + 'x' * 90] * 11), 'Form is larger than 1000 bytes'),
+        ('&'.join(['key=x'] * 11), 'Form has more than 10 fields'),
+    ],
+)
+def test_urlencoded_limits(body: str, message: str) -> None:
+    with pytest.raises(errors.FormTooLargeError, match=message):
+        _post(body)
+
+
+def test_multipart_field_limit() -> None:
+    data = aiohttp.FormData()
+    data.add_field('key', 'x' * 200)
+    with pytest.raises(errors.FormTooLargeError, match='Form field is larger than 100 bytes'):
+        _post(data)
+
+
+def test_multipart_fields_are_decoded() -> None:
+    body = (
+        b'--b\r\n'
+        b'Content-Disposition: form-data; name="key"\r\n'
+        b'Content-Transfer-Encoding: base64\r\n'
+        b'\r\n'
+        b'0LbQttC2\r\n'
+        b'--b--\r\n'
+    )
+    assert _post(body).pairs == [('key', 'жжж')]
+
+
+def test_multipart_files_count_towards_form_limit() -> None:
+    data = aiohttp.FormData()
+    data.add_field('upload', b'x' * 2000, filename='upload.bin')
+    with pytest.raises(errors.FormTooLargeError, match='Form is larger than 1000 bytes'):
+        _post(data)
+
+
+def _post(data) -> Form:
+    forms = []
+
+    async def handle(request: web.Request) -> web.Response:
+        try:
+            forms.append(await parse_form(request, CONTROL_FIELDS, LIMITS))
+        except errors.FormTooLargeError as exc:
+            forms.append(exc)
+        return web.Response()
+
+    async def scenario() -> None:
+        app = web.Application()
+        app.router.add_post('/', handle)
+        async with TestClient(TestServer(app)) as client:
+            headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+            if isinstance(data, str):
+                await client.post('/', data=data, headers=headers)
+            elif isinstance(data, bytes):
+                headers = {'Content-Type': 'multipart/form-data; boundary=b'}
+                await client.post('/', data=data, headers=headers)
+            else:
+                await client.post('/', data=data)
+
+    run(scenario())
+    if isinstance(forms[0], Exception):
+        raise forms[0]
+    return forms[0]
@@ -1,10 +1,14 @@
+import json
 from unittest import mock
 
 import pytest
 
+from gitformsaver.backpressure import QueueDepth
+from gitformsaver.errors import QueueFullError
 from gitformsaver.git_thread import GitThread
 from gitformsaver.git_thread_manager import GitThreadManager
 from gitformsaver.plain_text_formatter import PlainTextFormatter
+from gitformsaver.form_parser import FormLimits
 from gitformsaver.formatters import Formatter
 from gitformsaver.form_saver_service import GitFormSaverService
 
@@ -25,7 +29,9 @@ def test_minimal_valid_request(git_thread: GitThread, git_form_saver_service: Gi
     )
     assert result.status == 302
     assert result.location == 'Referer'
-    git_thread.push_soon.assert_called_once_with('file', 'key: value\n\n')
+    git_thread.push_soon.assert_called_once_with(
+        'file', 'key: value\n\n', repo='git@github.com:user/repo.git', accepted_at=mock.ANY
+    )
 
 
 def test_full_request(git_thread: GitThread, git_form_saver_service: GitFormSaverService):
@@ -44,7 +50,9 @@ def test_full_request(git_thread: GitThread, git_form_saver_service: GitFormSave
     )
     assert result.status == 302
     assert result.location == 'http://example.com'
-    git_thread.push_soon.assert_called_once_with('file', 'key: value\n\n')
+    git_thread.push_soon.assert_called_once_with(
+        'file', 'key: value\n\n', repo='git@github.com:user/repo.git', accepted_at=mock.ANY
+    )
 
 
 def test_empty_request(git_form_saver_service: GitFormSaverService):
@@ -64,9 +72,68 @@ def test_bad_redirect_url(git_form_saver_service: GitFormSaverService):
     assert result.text == 'redirect: Not a valid URL.'
 
 
+def test_oversized_form_is_rejected(
+    git_thread: GitThread, git_thread_manager: GitThreadManager, form_formatter: PlainTextFormatter
+):
+    service = GitFormSaverService(
+        git_thread_manager=git_thread_manager,
+        formatters={Formatter.PLAIN_TEXT: form_formatter},
+        form_limits=FormLimits(max_field_bytes=10),
+    )
+    result = run(service.handle(FakeRequest({'repo': 'repo', 'file': 'file', 'key': 'x' * 20})))
+    assert result.status == 413
+    assert result.text == 'Form field is larger than 10 bytes'
+    git_thread.push_soon.assert_not_called()
+
+
+@pytest.mark.parametrize('is_global, status', [(False, 429), (True, 503)])
+def test_full_queue_asks_to_retry(
+    git_thread: GitThread,
+    git_form_saver_service: GitFormSaverService,
+    is_global: bool,
+    status: int,
+):
+    git_thread.push_soon.side_effect = QueueFullError('Too many', is_global=is_global)
+    result = run(
+        git_form_saver_service.handle(
+            FakeRequest({'repo': 'repo', 'file': 'file', 'key': 'value'})
+        )
+    )
+    assert result.status == status
+    assert result.headers['Retry-After'] == '5'
+
+
+def test_full_queue_is_retried_for_block_timeout(
+    git_thread: GitThread, git_thread_manager: GitThreadManager, form_formatter: PlainTextFormatter
+):
+    service = GitFormSaverService(
+        git_thread_manager=git_thread_manager,
+        formatters={Formatter.PLAIN_TEXT: form_formatter},
+        block_timeout=1,
+    )
+    git_thread.push_soon.side_effect = [QueueFullError('Too many'), None]
+    result = run(service.handle(FakeRequest({'repo': 'repo', 'file': 'file', 'key': 'value'})))
+    assert result.status == 302
+    assert git_thread.push_soon.call_count == 2
+
+
+def test_queue_depths_are_exposed(
+    git_thread_manager: GitThreadManager, git_form_saver_service: GitFormSaverService
+):
+    git_thread_manager.depth = QueueDepth(tasks=3, bytes=30, age=1.5)
+    git_thread_manager.queue_depths.return_value = {'repo': QueueDepth(tasks=3, bytes=30)}
+    result = run(git_form_saver_service.handle_queues(FakeRequest({})))
+    assert json.loads(result.text) == {
+        'total': {'tasks': 3, 'bytes': 30, 'age': 1.5},
+        'repos': {'repo': {'tasks': 3, 'bytes': 30, 'age': 0.0}},
+    }
+
+
 @pytest.fixture(name='git_thread')
 def _git_thread() -> GitThread:
-    return mock.Mock(spec_set=GitThread)
+    obj = mock.Mock(spec_set=GitThread)
+    obj.push_soon.return_value = None
+    return obj
 
 
 @pytest.fixture(name='git_thread_manager')
@@ -0,0 +1,98 @@
+import pathlib
+
+import pytest
+
+from gitformsaver.git_client import Git, GitConflictError, PushRejectedError
+from gitformsaver.git_ops import GitOps
+
+from .git_utils import GIT_IDENTITY, commit_to_remote, git, make_remote
+
+
+def test_push_rejection_is_reported(remote: str, tmp_path: pathlib.Path) -> None:
+    local = GitOps().clone(url=remote, to_path=str(tmp_path / 'copy'))
+    commit_to_remote(remote, tmp_path / 'upstream', 'OTHER.md')
+    _append(tmp_path / 'copy' / 'README.md', 'local\n')
+    assert local.commit('Local change')
+    with pytest.raises(PushRejectedError):
+        local.push()
+
+
+def test_rejected_push_is_rebased_and_retried(remote: str, tmp_path: pathlib.Path) -> None:
+    local = GitOps().clone(url=remote, to_path=str(tmp_path / 'copy'))
+    commit_to_remote(remote, tmp_path / 'upstream', 'OTHER.md')
+    _append(tmp_path / 'copy' / 'README.md', 'local\n')
+    local.commit('Local change')
+    assert local.push_or_rebase() == 1
+    assert git(pathlib.Path(remote), 'show', 'main:README.md') == 'GFS-JWT:token\nlocal'
+    assert git(pathlib.Path(remote), 'show', 'main:OTHER.md') == 'text'
+
+
+def test_conflicting_rebase_is_aborted(remote: str, tmp_path: pathlib.Path) -> None:
+    local = GitOps().clone(url=remote, to_path=str(tmp_path / 'copy'))
+    commit_to_remote(remote, tmp_path / 'upstream', 'README.md', 'remote\n')
+    _append(tmp_path / 'copy' / 'README.md', 'local\n')
+    local.commit('Local change')
+    with pytest.raises(GitConflictError):
+        local.push_or_rebase()
+    assert git(tmp_path / 'copy', 'log', '-1', '--format=%s') == 'Local change'
+
+
+def test_unpushed_commits_are_reapplied_on_upstream(remote: str, tmp_path: pathlib.Path) -> None:
+    copy = tmp_path / 'copy'
+    local = GitOps().clone(url=remote, to_path=str(copy))
+    commit_to_remote(remote, tmp_path / 'upstream', 'README.md', 'remote\n')
+    _append(copy / 'README.md', 'first\n')
+    local.commit('First', paths=[str(copy / 'README.md')])
+    _append(copy / 'README.md', 'second\n')
+    local.commit('Second', paths=[str(copy / 'README.md')])
+    with pytest.raises(GitConflictError):
+        local.push_or_rebase()
+    local.reapply_on_upstream()
+    assert local.push_or_rebase() == 0
+    assert git(pathlib.Path(remote), 'show', 'main:README.md') == (
+        'GFS-JWT:token\nremote\nfirst\nsecond'
+    )
+    assert git(pathlib.Path(remote), 'log', '-2', '--format=%s', 'main') == 'Second\nFirst'
+
+
+def test_commit_rewriting_file_is_not_reapplied(remote: str, tmp_path: pathlib.Path) -> None:
+    copy = tmp_path / 'copy'
+    local = GitOps().clone(url=remote, to_path=str(copy))
+    commit_to_remote(remote, tmp_path / 'upstream', 'README.md', 'remote\n')
+    (copy / 'README.md').write_text('rewritten\n', encoding='utf-8')
+    local.commit('Rewrite')
+    with pytest.raises(GitConflictError):
+        local.push_or_rebase()
+    with pytest.raises(GitConflictError):
+        local.reapply_on_upstream()
+    assert git(copy, 'log', '-1', '--format=%s') == 'Rewrite'
+
+
+def test_commit_without_changes_is_skipped(remote: str, tmp_path: pathlib.Path) -> None:
+    local: Git = GitOps().clone(url=remote, to_path=str(tmp_path / 'copy'))
+    assert not local.commit('Nothing')
+
+
+def test_commit_of_paths_leaves_other_changes(remote: str, tmp_path: pathlib.Path) -> None:
+    copy = tmp_path / 'copy'
+    local = GitOps().clone(url=remote, to_path=str(copy))
+    _append(copy / 'README.md', 'form\n')
+    _append(copy / 'OTHER.md', 'manual\n')
+    assert local.commit('Form', paths=[str(copy / 'README.md')])
+    assert not local.commit('Nothing', paths=[str(copy / 'README.md')])
+    local.push()
+    assert git(pathlib.Path(remote), 'show', 'main:README.md') == 'GFS-JWT:token\nform'
+    assert git(copy, 'status', '--porcelain') == '?? OTHER.md'
+    assert git(copy, 'log', '-1', '--format=%s') == 'Form'
+
+
+def _append(path: pathlib.Path, text: str) -> None:
+    with open(path, 'a', encoding='utf-8') as fobj:
+        fobj.write(text)
+
+
+@pytest.fixture(name='remote')
+def _remote(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> str:
+    for name, value in GIT_IDENTITY.items():
+        monkeypatch.setenv(name, value)
+    return make_remote(tmp_path, {'README.md': 'GFS-JWT:token\n'})
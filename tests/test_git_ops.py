@@ -0,0 +1,80 @@
+import pathlib
+
+import git as gitpython
+import pytest
+
+from gitformsaver.git_ops import GitOps
+
+from .git_utils import GIT_IDENTITY, commit_to_remote, git, make_remote
+
+
+def test_clone_creates_working_copy(remote: str, tmp_path: pathlib.Path) -> None:
+    GitOps().clone(url=remote, to_path=str(tmp_path / 'copy'))
+    assert (tmp_path / 'copy' / 'README.md').read_text(encoding='utf-8') == 'GFS-JWT:token\n'
+
+
+def test_clone_fast_forwards_existing_working_copy(remote: str, tmp_path: pathlib.Path) -> None:
+    copy = tmp_path / 'copy'
+    GitOps().clone(url=remote, to_path=str(copy))
+    marker = copy / '.git' / 'marker'
+    marker.touch()
+    commit_to_remote(remote, tmp_path / 'upstream', 'NEW.md')
+    GitOps().clone(url=remote, to_path=str(copy))
+    assert marker.exists()
+    assert (copy / 'NEW.md').exists()
+
+
+def test_clone_rebases_unpushed_commits(remote: str, tmp_path: pathlib.Path) -> None:
+    copy = tmp_path / 'copy'
+    GitOps().clone(url=remote, to_path=str(copy))
+    _commit_locally(copy, 'LOCAL.md')
+    commit_to_remote(remote, tmp_path / 'upstream', 'NEW.md')
+    GitOps().clone(url=remote, to_path=str(copy))
+    assert git(copy, 'log', '--format=%s', '-2') == 'Local change\nUpdate NEW.md'
+
+
+def test_clone_keeps_working_copy_with_conflicting_commits(
+    remote: str, tmp_path: pathlib.Path
+) -> None:
+    copy = tmp_path / 'copy'
+    GitOps().clone(url=remote, to_path=str(copy))
+    _commit_locally(copy, 'README.md')
+    commit_to_remote(remote, tmp_path / 'upstream', 'README.md')
+    with pytest.raises(gitpython.GitError):
+        GitOps().clone(url=remote, to_path=str(copy))
+    assert git(copy, 'log', '--format=%s', '-1') == 'Local change'
+    assert not git(copy, 'status', '--porcelain')
+
+
+def test_clone_replaces_working_copy_of_other_remote(
+    remote: str, tmp_path: pathlib.Path
+) -> None:
+    copy = tmp_path / 'copy'
+    git(tmp_path, 'clone', '--quiet', remote, str(copy))
+    git(copy, 'remote', 'set-url', 'origin', str(tmp_path / 'elsewhere.git'))
+    marker = copy / '.git' / 'marker'
+    marker.touch()
+    GitOps().clone(url=remote, to_path=str(copy))
+    assert not marker.exists()
+    assert (copy / 'README.md').exists()
+
+
+def test_shallow_clone_fetches_single_commit(remote: str, tmp_path: pathlib.Path) -> None:
+    commit_to_remote(remote, tmp_path / 'upstream', 'NEW.md')
+    copy = tmp_path / 'copy'
+    GitOps().clone(url=f'file://{remote}', to_path=str(copy))
+    assert git(copy, 'rev-list', '--count', 'HEAD') == '1'
+
+
+def _commit_locally(copy: pathlib.Path, name: str) -> None:
+    with open(copy / name, 'a', encoding='utf-8') as fobj:
+        fobj.write('local\n')
+    git(copy, 'add', name)
+    git(copy, 'commit', '--quiet', '-m', 'Local change')
+
+
+@pytest.fixture(name='remote')
+def _remote(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> str:
+    for name, value in GIT_IDENTITY.items():
+        monkeypatch.setenv(name, value)
+    return make_remote(tmp_path, {'README.md': 'GFS-JWT:token\n'})
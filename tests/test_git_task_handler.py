@@ -5,9 +5,12 @@ from unittest import mock
 import pytest
 
 from gitformsaver.authentication_interface import AuthenticationInterface
-from gitformsaver.errors import UserFacingError
+from gitformsaver.errors import UnpushedError, UserFacingError
+from gitformsaver.git_client import GitConflictError, GitError
 from gitformsaver.git_task_handler import CloneTask, GitTaskHandler, WriteTask
 from gitformsaver.lazy_git import LazyGit
+from gitformsaver.metrics import RepoStats
+from gitformsaver.token_cache import TokenCache
 
 
 def test_task_handler_clone_delegates_to_lazy_git(
@@ -26,7 +29,7 @@ def test_task_handler_appends_text(
 ) -> None:
     git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='text'))
     mock_lazy_git.maybe_pull.assert_called_once_with()
-    mock_lazy_git.maybe_push.assert_called_once()
+    mock_lazy_git.push.assert_called_once_with()
     with open(os.path.join(temp_repo_root, 'rel-path'), encoding='ascii') as fobj:
         contents = fobj.read()
     assert contents == 'contenttext'
@@ -36,6 +39,226 @@ def test_task_handler_appends_text(
     )
 
 
+def test_task_handler_writes_all_files_in_one_push(
+    mock_lazy_git: LazyGit,
+    temp_repo_root: str,
+    git_task_handler: GitTaskHandler,
+    mock_authentication: AuthenticationInterface,
+) -> None:
+    git_task_handler.handle_writes(
+        [
+            WriteTask(rel_path='rel-path', text='1'),
+            WriteTask(rel_path='etc/hosts', text='2'),
+            WriteTask(rel_path='rel-path', text='3'),
+        ]
+    )
+    mock_lazy_git.maybe_pull.assert_called_once_with()
+    mock_lazy_git.push.assert_called_once_with()
+    assert pathlib.Path(temp_repo_root, 'rel-path').read_text(encoding='ascii') == 'content13'
+    assert pathlib.Path(temp_repo_root, 'etc', 'hosts').read_text(encoding='ascii') == '2'
+    assert mock_authentication.is_valid_token.call_count == 2
+
+
+def test_task_handler_pushes_valid_files_of_partially_rejected_batch(
+    mock_lazy_git: LazyGit,
+    temp_repo_root: str,
+    git_task_handler: GitTaskHandler,
+) -> None:
+    with pytest.raises(UserFacingError):
+        git_task_handler.handle_writes(
+            [
+                WriteTask(rel_path='missing', text='1'),
+                WriteTask(rel_path='rel-path', text='2'),
+            ]
+        )
+    mock_lazy_git.push.assert_called_once_with()
+    assert pathlib.Path(temp_repo_root, 'rel-path').read_text(encoding='ascii') == 'content2'
+    assert not pathlib.Path(temp_repo_root, 'missing').exists()
+
+
+def test_failed_push_of_committed_batch_is_reported_as_unpushed(
+    mock_lazy_git: LazyGit, git_task_handler: GitTaskHandler
+) -> None:
+    mock_lazy_git.push.side_effect = GitError('Connection refused')
+    with pytest.raises(UnpushedError):
+        git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='text'))
+    mock_lazy_git.commit.assert_called_once()
+
+
+def test_tokens_are_verified_for_url_of_submission(
+    git_task_handler: GitTaskHandler, mock_authentication: AuthenticationInterface
+) -> None:
+    git_task_handler.handle_writes(
+        [WriteTask(rel_path='rel-path', text='a'), WriteTask('rel-path', 'b', repo='alias')]
+    )
+    assert mock_authentication.is_valid_token.call_args_list == [
+        mock.call('extracted_token', 'repo', 'rel-path', ''),
+        mock.call('extracted_token', 'alias', 'rel-path', ''),
+    ]
+
+
+def test_task_handler_caches_token_verification(
+    temp_repo_root: str,
+    git_task_handler: GitTaskHandler,
+    mock_authentication: AuthenticationInterface,
+) -> None:
+    git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='text'))
+    git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='text'))
+    mock_authentication.is_valid_token.assert_called_once()
+    # Header of the file changed after the pull:
+    pathlib.Path(temp_repo_root, 'rel-path').write_text('new content', encoding='ascii')
+    git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='text'))
+    assert mock_authentication.is_valid_token.call_count == 2
+
+
+def test_token_is_verified_again_once_cached_result_expires(
+    mock_lazy_git: LazyGit, mock_authentication: AuthenticationInterface
+) -> None:
+    now = [0.0]
+    handler = GitTaskHandler(
+        git=mock_lazy_git,
+        repo='repo',
+        authentication=mock_authentication,
+        token_cache=TokenCache(ttl=60.0, clock=lambda: now[0]),
+    )
+    handler.handle_write(WriteTask(rel_path='rel-path', text='text'))
+    now[0] = 30.0
+    handler.handle_write(WriteTask(rel_path='rel-path', text='text'))
+    assert mock_authentication.is_valid_token.call_count == 1
+    mock_authentication.is_valid_token.return_value = False
+    now[0] = 61.0
+    with pytest.raises(UserFacingError, match='JWT token verification failed'):
+        handler.handle_write(WriteTask(rel_path='rel-path', text='text'))
+    assert mock_authentication.is_valid_token.call_count == 2
+
+
+def test_optimistic_handler_pushes_without_pulling(
+    mock_lazy_git: LazyGit,
+    temp_repo_root: str,
+    optimistic_git_task_handler: GitTaskHandler,
+    stats: RepoStats,
+) -> None:
+    mock_lazy_git.push_or_rebase.return_value = 2
+    optimistic_git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='text'))
+    mock_lazy_git.maybe_pull.assert_not_called()
+    mock_lazy_git.commit.assert_called_once()
+    mock_lazy_git.push_or_rebase.assert_called_once_with()
+    assert pathlib.Path(temp_repo_root, 'rel-path').read_text(encoding='ascii') == 'contenttext'
+    assert stats.push_retries == 2
+
+
+def test_optimistic_handler_reapplies_conflicting_appends(
+    mock_lazy_git: LazyGit,
+    temp_repo_root: str,
+    optimistic_git_task_handler: GitTaskHandler,
+    stats: RepoStats,
+) -> None:
+    target = pathlib.Path(temp_repo_root, 'rel-path')
+
+    def reapply_on_upstream() -> None:
+        target.write_text('content-remotetext', encoding='ascii')
+
+    mock_lazy_git.push_or_rebase.side_effect = [GitConflictError('conflict'), 0, 0]
+    mock_lazy_git.reapply_on_upstream.side_effect = reapply_on_upstream
+    optimistic_git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='text'))
+    optimistic_git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='2'))
+    mock_lazy_git.reapply_on_upstream.assert_called_once_with()
+    assert target.read_text(encoding='ascii') == 'content-remotetext2'
+    assert stats.push_conflicts == 1
+
+
+def test_optimistic_handler_gives_up_on_repeated_conflicts(
+    mock_lazy_git: LazyGit, optimistic_git_task_handler: GitTaskHandler
+) -> None:
+    mock_lazy_git.push_or_rebase.side_effect = GitConflictError('conflict')
+    with pytest.raises(UnpushedError):
+        optimistic_git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='text'))
+    assert mock_lazy_git.reapply_on_upstream.call_count == 3
+
+
+def test_optimistic_handler_writes_indexed_target_without_reading_it(
+    mock_lazy_git: LazyGit,
+    temp_repo_root: str,
+    optimistic_git_task_handler: GitTaskHandler,
+    mock_authentication: AuthenticationInterface,
+) -> None:
+    mock_lazy_git.push_or_rebase.return_value = 0
+    optimistic_git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='1'))
+    with mock.patch('os.path.realpath') as realpath, mock.patch('os.stat') as stat:
+        optimistic_git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='2'))
+    realpath.assert_not_called()
+    stat.assert_not_called()
+    mock_authentication.extract_token.assert_called_once_with('content')
+    mock_authentication.is_valid_token.assert_called_once()
+    assert pathlib.Path(temp_repo_root, 'rel-path').read_text(encoding='ascii') == 'content12'
+
+
+def test_optimistic_handler_reads_target_again_after_rebase(
+    mock_lazy_git: LazyGit,
+    temp_repo_root: str,
+    optimistic_git_task_handler: GitTaskHandler,
+    mock_authentication: AuthenticationInterface,
+) -> None:
+    target = pathlib.Path(temp_repo_root, 'rel-path')
+
+    def push_or_rebase() -> int:
+        target.write_text('remote', encoding='ascii')
+        return 1
+
+    mock_lazy_git.push_or_rebase.side_effect = push_or_rebase
+    optimistic_git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='1'))
+    mock_lazy_git.push_or_rebase.side_effect = None
+    mock_lazy_git.push_or_rebase.return_value = 0
+    optimistic_git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='2'))
+    assert mock_authentication.extract_token.call_args_list == [
+        mock.call('content'),
+        mock.call('remote'),
+    ]
+    assert target.read_text(encoding='ascii') == 'remote2'
+
+
+def test_task_handler_checks_target_after_pull_without_reading_unchanged_file(
+    git_task_handler: GitTaskHandler, mock_authentication: AuthenticationInterface
+) -> None:
+    git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='1'))
+    with mock.patch('os.path.realpath') as realpath:
+        git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='2'))
+    realpath.assert_not_called()
+    mock_authentication.extract_token.assert_called_once_with('content')
+
+
+def test_task_handler_rejects_target_removed_by_pull(
+    temp_repo_root: str, git_task_handler: GitTaskHandler
+) -> None:
+    git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='1'))
+    pathlib.Path(temp_repo_root, 'rel-path').unlink()
+    with pytest.raises(UserFacingError):
+        git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='2'))
+    assert not pathlib.Path(temp_repo_root, 'rel-path').exists()
+
+
+def test_task_handler_times_batch_phases(
+    mock_authentication: AuthenticationInterface, mock_lazy_git: LazyGit, stats: RepoStats
+) -> None:
+    handler = GitTaskHandler(
+        git=mock_lazy_git, repo='repo', authentication=mock_authentication, stats=stats
+    )
+    handler.handle_write(WriteTask(rel_path='rel-path', text='text'))
+    counts = [
+        histogram.count
+        for histogram in (
+            stats.pull_seconds,
+            stats.validate_seconds,
+            stats.write_seconds,
+            stats.commit_seconds,
+            stats.push_seconds,
+            stats.clone_seconds,
+        )
+    ]
+    assert counts == [1, 1, 1, 1, 1, 0]
+    assert (stats.tokens_valid, stats.tokens_invalid) == (1, 0)
+
+
 @pytest.mark.parametrize('rel_path', ['/etc/hosts', '///////etc/hosts', 'inside-symlink'])
 def test_task_handler_fixes_accidental_abs_path(
     mock_lazy_git: LazyGit,
@@ -45,7 +268,7 @@ def test_task_handler_fixes_accidental_abs_path(
 ) -> None:
     git_task_handler.handle_write(WriteTask(rel_path=rel_path, text='text'))
     mock_lazy_git.maybe_pull.assert_called_once_with()
-    mock_lazy_git.maybe_push.assert_called_once()
+    mock_lazy_git.push.assert_called_once_with()
     with open(pathlib.Path(temp_repo_root) / 'etc' / 'hosts', encoding='ascii') as fobj:
         contents = fobj.read()
     assert contents == 'text'
@@ -66,7 +289,7 @@ def test_task_handler_detects_out_of_repo_path(
 ) -> None:
     git_task_handler.handle_write(WriteTask(rel_path=rel_path, text='text'))
     mock_lazy_git.maybe_pull.assert_called_once_with()
-    mock_lazy_git.maybe_push.assert_not_called()
+    mock_lazy_git.push.assert_not_called()
 
 
 def test_task_handler_respects_authentication(
@@ -79,7 +302,7 @@ def test_task_handler_respects_authentication(
     with pytest.raises(UserFacingError):
         git_task_handler.handle_write(WriteTask(rel_path='rel-path', text='text'))
     mock_lazy_git.maybe_pull.assert_called_once_with()
-    mock_lazy_git.maybe_push.assert_not_called()
+    mock_lazy_git.push.assert_not_called()
     with open(os.path.join(temp_repo_root, 'rel-path'), encoding='ascii') as fobj:
         contents = fobj.read()
     assert contents == 'content'
@@ -125,3 +348,21 @@ def _git_task_handler(
         repo='repo',
         authentication=mock_authentication,
     )
+
+
+@pytest.fixture(name='stats')
+def _stats() -> RepoStats:
+    return RepoStats()
+
+
+@pytest.fixture(name='optimistic_git_task_handler')
+def _optimistic_git_task_handler(
+    mock_lazy_git: LazyGit, mock_authentication: AuthenticationInterface, stats: RepoStats
+) -> GitTaskHandler:
+    return GitTaskHandler(
+        git=mock_lazy_git,
+        repo='repo',
+        authentication=mock_authentication,
+        optimistic=True,
+        stats=stats,
+    )
@@ -1 +1,161 @@
-# TODO: Add tests
+import threading
+import time
+from typing import List, Tuple
+from unittest import mock
+
+import pytest
+
+from gitformsaver.backpressure import Backlog
+from gitformsaver.errors import QueueFullError, UserFacingError
+from gitformsaver.git_task_handler import GitTaskHandler
+from gitformsaver.git_thread import CoalescingPolicy, GitThread
+from gitformsaver.tracing import Tracer
+from gitformsaver.worker_pool import WorkerPool
+
+
+def test_submissions_within_window_share_one_write(mock_handler: GitTaskHandler) -> None:
+    git_thread = GitThread(mock_handler, CoalescingPolicy(max_latency=60))
+    git_thread.push_soon('file', 'a')
+    git_thread.push_soon('file', 'b')
+    git_thread.stop()
+    assert _written(mock_handler) == [[('file', 'a'), ('file', 'b')]]
+    assert git_thread.stats.batch_size.count == 1
+    assert git_thread.stats.batch_size.sum == 2
+    assert git_thread.stats.wait_seconds.count == 2
+
+
+def test_full_batch_is_flushed_before_deadline(mock_handler: GitTaskHandler) -> None:
+    git_thread = GitThread(mock_handler, CoalescingPolicy(max_latency=60, max_tasks=2))
+    git_thread.push_soon('file', 'a')
+    git_thread.push_soon('file', 'b')
+    try:
+        _wait_for(lambda: mock_handler.handle_writes.called)
+    finally:
+        git_thread.stop()
+    assert _written(mock_handler) == [[('file', 'a'), ('file', 'b')]]
+
+
+def test_batch_is_capped_by_size(mock_handler: GitTaskHandler) -> None:
+    git_thread = GitThread(mock_handler, CoalescingPolicy(max_latency=60, max_bytes=2))
+    for text in 'abc':
+        git_thread.push_soon('file', text)
+    git_thread.stop()
+    assert _written(mock_handler) == [[('file', 'a'), ('file', 'b')], [('file', 'c')]]
+
+
+def test_rejected_batch_keeps_thread_running(mock_handler: GitTaskHandler) -> None:
+    mock_handler.handle_writes.side_effect = UserFacingError("JWT token verification failed")
+    git_thread = GitThread(mock_handler, CoalescingPolicy(max_latency=0))
+    git_thread.push_soon('file', 'a')
+    try:
+        _wait_for(lambda: mock_handler.handle_writes.called)
+        git_thread.push_soon('file', 'b')
+        _wait_for(lambda: mock_handler.handle_writes.call_count == 2)
+    finally:
+        git_thread.stop()
+
+
+def test_push_beyond_backlog_limit_is_rejected(mock_handler: GitTaskHandler) -> None:
+    git_thread = GitThread(
+        mock_handler, CoalescingPolicy(max_latency=60), backlog=Backlog(max_tasks=1, max_bytes=10)
+    )
+    git_thread.push_soon('file', 'a')
+    with pytest.raises(QueueFullError):
+        git_thread.push_soon('file', 'b')
+    assert git_thread.depth.tasks == 1
+    git_thread.stop()
+    assert git_thread.depth.tasks == 0
+    assert _written(mock_handler) == [[('file', 'a')]]
+
+
+def test_failed_repo_drops_its_queue(mock_handler: GitTaskHandler) -> None:
+    mock_handler.handle_clone.side_effect = RuntimeError("Can't clone")
+    git_thread = GitThread(mock_handler, CoalescingPolicy(max_latency=60))
+    git_thread.clone_soon('url')
+    git_thread.push_soon('file', 'a')
+    git_thread.stop()
+    assert not mock_handler.handle_writes.called
+    assert not git_thread.is_running
+    assert git_thread.depth.tasks == 0
+
+
+def test_failed_repo_rejects_submissions(mock_handler: GitTaskHandler) -> None:
+    mock_handler.handle_clone.side_effect = RuntimeError("Can't clone")
+    git_thread = GitThread(mock_handler, CoalescingPolicy(max_latency=0))
+    git_thread.clone_soon('url')
+    _wait_for(lambda: not git_thread.is_running)
+    with pytest.raises(QueueFullError) as exc_info:
+        git_thread.push_soon('file', 'a')
+    assert exc_info.value.is_global
+    git_thread.stop()
+
+
+def test_stop_gives_up_on_hung_push(mock_handler: GitTaskHandler) -> None:
+    released = threading.Event()
+    mock_handler.handle_writes.side_effect = lambda tasks: released.wait(5)
+    git_thread = GitThread(mock_handler, CoalescingPolicy(max_latency=0))
+    git_thread.push_soon('file', 'a')
+    _wait_for(lambda: mock_handler.handle_writes.called)
+    git_thread.push_soon('file', 'b')
+    started_at = time.monotonic()
+    git_thread.stop(timeout=0.1)
+    assert time.monotonic() - started_at < 1
+    assert git_thread.depth.tasks == 1
+    released.set()
+
+
+def test_idle_repo_stops_immediately(mock_handler: GitTaskHandler) -> None:
+    git_thread = GitThread(mock_handler, CoalescingPolicy(max_latency=0))
+    git_thread.push_soon('file', 'a')
+    _wait_for(lambda: git_thread.idle_since is not None)
+    started_at = time.monotonic()
+    git_thread.stop()
+    assert time.monotonic() - started_at < 0.1
+
+
+def test_traced_submissions_get_trace_ids(mock_handler: GitTaskHandler) -> None:
+    tracer = mock.Mock(spec_set=Tracer)
+    tracer.new_trace_id.side_effect = ['t1', 't2']
+    git_thread = GitThread(mock_handler, CoalescingPolicy(max_latency=60), tracer=tracer)
+    git_thread.push_soon('file', 'a', accepted_at=1.0)
+    git_thread.push_soon('file', 'b')
+    git_thread.stop()
+    tasks = mock_handler.handle_writes.call_args.args[0]
+    assert [(task.trace_id, task.accepted_at) for task in tasks] == [('t1', 1.0), ('t2', 0.0)]
+
+
+def test_queue_age_is_of_oldest_task_left(mock_handler: GitTaskHandler) -> None:
+    clock = mock.Mock(return_value=10.0)
+    git_thread = GitThread(
+        mock_handler,
+        CoalescingPolicy(max_latency=60, max_tasks=1),
+        pool=mock.Mock(spec_set=WorkerPool),
+    )
+    with mock.patch('time.monotonic', clock):
+        git_thread.push_soon('file', 'a')
+        clock.return_value = 20.0
+        git_thread.push_soon('file', 'b')
+        git_thread.run_once()
+        clock.return_value = 25.0
+        assert git_thread.depth.age == 5.0
+        git_thread.run_once()
+        assert git_thread.depth.age == 0.0
+
+
+def _written(handler: GitTaskHandler) -> List[List[Tuple[str, str]]]:
+    return [
+        [(task.rel_path, task.text) for task in call.args[0]]
+        for call in handler.handle_writes.call_args_list
+    ]
+
+
+def _wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture(name='mock_handler')
+def _mock_handler() -> GitTaskHandler:
+    return mock.Mock(spec_set=GitTaskHandler)
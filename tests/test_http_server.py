@@ -1,6 +1,26 @@
+import pathlib
+from dataclasses import replace
+
+import pytest
 from aiohttp import web
-from gitformsaver.http_server import setup_app
+from gitformsaver.http_server import setup_app, setup_front_end_app, setup_owner_app
+from gitformsaver.settings import Settings
 
 
 def test_can_setup_app() -> None:
     setup_app(web.Application())
+
+
+def test_can_setup_multiprocess_apps() -> None:
+    front_end = setup_front_end_app(web.Application(), {'git-0': '/tmp/git-0.sock'})
+    setup_owner_app(web.Application(), 'git-0', ['git-0'])
+    assert '/metrics' in {route.resource.canonical for route in front_end.router.routes()}
+
+
+def test_cluster_node_needs_address_and_secret(tmp_path: pathlib.Path) -> None:
+    settings = Settings(cluster_db=str(tmp_path / 'cluster.db'))
+    with pytest.raises(ValueError, match='address'):
+        setup_app(web.Application(), replace(settings, cluster_secret='secret'))
+    with pytest.raises(ValueError, match='secret'):
+        setup_app(web.Application(), replace(settings, cluster_address='http://a'))
+    setup_app(web.Application(), replace(settings, cluster_address='http://a', cluster_secret='s'))
@@ -0,0 +1,78 @@
+import pathlib
+
+import pytest
+
+from gitformsaver.leases import Lease, SqliteLeaseBackend
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lease_is_held_until_it_expires(backend: SqliteLeaseBackend, clock: FakeClock) -> None:
+    assert backend.acquire('repo', 'a', ttl=10) == Lease('repo', 'a', 1010.0)
+    assert backend.acquire('repo', 'b', ttl=10) == Lease('repo', 'a', 1010.0)
+    clock.now += 10
+    assert backend.lookup('repo') is None
+    assert backend.acquire('repo', 'b', ttl=10) == Lease('repo', 'b', 1020.0)
+
+
+def test_holder_extends_its_lease(backend: SqliteLeaseBackend, clock: FakeClock) -> None:
+    backend.acquire('repo', 'a', ttl=10)
+    backend.acquire('other', 'b', ttl=10)
+    clock.now += 5
+    assert backend.renew('a', ['repo', 'other'], ttl=10) == {'repo': 1015.0}
+    assert backend.acquire('repo', 'a', ttl=10) == Lease('repo', 'a', 1015.0)
+
+
+def test_expired_lease_is_not_renewed(backend: SqliteLeaseBackend, clock: FakeClock) -> None:
+    backend.acquire('repo', 'a', ttl=10)
+    clock.now += 10
+    assert backend.renew('a', ['repo'], ttl=10) == {}
+
+
+def test_released_lease_is_free(backend: SqliteLeaseBackend) -> None:
+    backend.acquire('repo', 'a', ttl=10)
+    backend.release('repo', 'b')
+    assert backend.lookup('repo') == Lease('repo', 'a', 1010.0)
+    backend.release('repo', 'a')
+    assert backend.lookup('repo') is None
+
+
+def test_nodes_stay_while_they_heartbeat(backend: SqliteLeaseBackend, clock: FakeClock) -> None:
+    backend.heartbeat('b', ttl=10)
+    backend.heartbeat('a', ttl=20)
+    assert backend.nodes() == ['a', 'b']
+    clock.now += 10
+    assert backend.nodes() == ['a']
+
+
+def test_leaving_node_releases_its_leases(backend: SqliteLeaseBackend) -> None:
+    backend.heartbeat('a', ttl=10)
+    backend.acquire('repo', 'a', ttl=10)
+    backend.leave('a')
+    assert backend.nodes() == []
+    assert backend.lookup('repo') is None
+
+
+def test_nodes_share_the_database(tmp_path: pathlib.Path, clock: FakeClock) -> None:
+    first = SqliteLeaseBackend(str(tmp_path / 'cluster.db'), clock=clock)
+    second = SqliteLeaseBackend(str(tmp_path / 'cluster.db'), clock=clock)
+    first.acquire('repo', 'a', ttl=10)
+    assert second.acquire('repo', 'b', ttl=10).node == 'a'
+    first.close()
+    second.close()
+
+
+@pytest.fixture(name='clock')
+def _clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture(name='backend')
+def _backend(tmp_path: pathlib.Path, clock: FakeClock) -> SqliteLeaseBackend:
+    return SqliteLeaseBackend(str(tmp_path / 'cluster.db'), clock=clock)
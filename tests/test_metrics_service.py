@@ -0,0 +1,143 @@
+from typing import List
+from unittest import mock
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from gitformsaver.backpressure import QueueDepth
+from gitformsaver.git_thread_manager import GitThreadManager
+from gitformsaver.metrics import RepoStats, git_error_class
+from gitformsaver.metrics_service import MetricsService
+from gitformsaver.sharding import ShardedGitThreadManager
+from gitformsaver.token_cache import TokenCache
+
+from .async_utils import run
+
+
+def test_metrics_cover_requests_and_repos(
+    metrics_service: MetricsService, repo_stats: RepoStats
+) -> None:
+    repo_stats.batch_size.observe(3)
+    repo_stats.push_seconds.observe(0.2)
+    repo_stats.tokens_valid = 2
+    repo_stats.count_error(RuntimeError("fatal: Could not resolve host: example.com"))
+    lines = _scrape(metrics_service)
+    labels = '{method="POST",route="/",status="302"}'
+    assert f'gitformsaver_http_responses_total{labels} 1' in lines
+    assert 'gitformsaver_http_responses_total{method="GET",route="unmatched",status="404"} 1' in (
+        lines
+    )
+    assert (
+        'gitformsaver_http_request_duration_seconds_count{method="POST",route="/"} 1' in lines
+    )
+    assert 'gitformsaver_queue_tasks{repo="host/repo.git"} 4' in lines
+    assert 'gitformsaver_queue_age_seconds{repo="host/repo.git"} 1.5' in lines
+    assert 'gitformsaver_batch_size_bucket{repo="host/repo.git",le="2"} 0' in lines
+    assert 'gitformsaver_batch_size_bucket{repo="host/repo.git",le="5"} 1' in lines
+    assert 'gitformsaver_batch_size_bucket{repo="host/repo.git",le="+Inf"} 1' in lines
+    assert (
+        'gitformsaver_git_duration_seconds_count{repo="host/repo.git",phase="push"} 1' in lines
+    )
+    assert (
+        'gitformsaver_token_verifications_total{repo="host/repo.git",result="valid"} 2' in lines
+    )
+    assert 'gitformsaver_git_errors_total{repo="host/repo.git",class="network"} 1' in lines
+    assert '# TYPE gitformsaver_batch_size histogram' in lines
+
+
+def test_token_cache_counters_are_exported(
+    metrics_service: MetricsService, token_cache: TokenCache
+) -> None:
+    token_cache.put('token', 'repo', 'file', 'secret', True)
+    token_cache.get('token', 'repo', 'file', 'secret')
+    token_cache.get('token', 'repo', 'other', 'secret')
+    token_cache.get('token', 'repo', 'another', 'secret')
+    lines = _scrape(metrics_service)
+    assert 'gitformsaver_token_cache_hits_total 1' in lines
+    assert 'gitformsaver_token_cache_misses_total 2' in lines
+    assert '# TYPE gitformsaver_token_cache_misses_total counter' in lines
+
+
+def test_front_end_metrics_have_no_token_cache() -> None:
+    git_thread_manager = mock.Mock(spec_set=ShardedGitThreadManager)
+    git_thread_manager.stats.return_value = {}
+    git_thread_manager.queue_depths.return_value = {}
+    lines = MetricsService(git_thread_manager=git_thread_manager).render().splitlines()
+    assert not [line for line in lines if 'token_cache' in line]
+
+
+def test_stages_are_aggregated_by_repo(
+    metrics_service: MetricsService, repo_stats: RepoStats
+) -> None:
+    repo_stats.wait_seconds.observe(0.5)
+    repo_stats.pull_seconds.observe(1.0)
+    repo_stats.pull_seconds.observe(2.0)
+
+    async def scenario() -> dict:
+        app = web.Application()
+        metrics_service.setup(app)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get('/stages')
+            return await response.json()
+
+    stages = run(scenario())['host/repo.git']
+    assert stages['queue'] == {'count': 1, 'mean_seconds': 0.5}
+    assert stages['pull'] == {'count': 2, 'mean_seconds': 1.5}
+    assert stages['push'] == {'count': 0, 'mean_seconds': 0.0}
+
+
+@pytest.mark.parametrize(
+    'stderr, error_class',
+    [
+        ("! [rejected]        main -> main (fetch first)", 'rejected'),
+        ("CONFLICT (content): Merge conflict in README.md", 'conflict'),
+        ("git@github.com: Permission denied (publickey).", 'auth'),
+        ("fatal: repository 'https://host/repo.git/' not found", 'not_found'),
+        ("fatal: Unable to create '/repo/.git/index.lock': File exists.", 'lock'),
+        ("fatal: bad object HEAD", 'other'),
+    ],
+)
+def test_git_errors_are_classified_by_stderr(stderr: str, error_class: str) -> None:
+    assert git_error_class(stderr) == error_class
+
+
+def _scrape(metrics_service: MetricsService) -> List[str]:
+    """Submit a form and get a missing page before scraping."""
+    async def handle(request: web.Request) -> web.Response:
+        del request
+        raise web.HTTPFound('/thanks')
+
+    async def scenario() -> str:
+        app = web.Application()
+        app.router.add_post('/', handle)
+        metrics_service.setup(app)
+        async with TestClient(TestServer(app)) as client:
+            await client.post('/', allow_redirects=False)
+            await client.get('/missing')
+            response = await client.get('/metrics')
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            return await response.text()
+
+    return run(scenario()).splitlines()
+
+
+@pytest.fixture(name='repo_stats')
+def _repo_stats() -> RepoStats:
+    return RepoStats()
+
+
+@pytest.fixture(name='token_cache')
+def _token_cache() -> TokenCache:
+    return TokenCache()
+
+
+@pytest.fixture(name='metrics_service')
+def _metrics_service(repo_stats: RepoStats, token_cache: TokenCache) -> MetricsService:
+    git_thread_manager = mock.Mock(spec_set=GitThreadManager)
+    git_thread_manager.token_cache = token_cache
+    git_thread_manager.stats.return_value = {'host/repo.git': repo_stats}
+    git_thread_manager.queue_depths.return_value = {
+        'host/repo.git': QueueDepth(tasks=4, bytes=100, age=1.5)
+    }
+    return MetricsService(git_thread_manager=git_thread_manager)
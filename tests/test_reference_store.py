@@ -0,0 +1,61 @@
+import pathlib
+import shutil
+
+import pytest
+
+from gitformsaver.git_ops import GitOps
+from gitformsaver.reference_store import ReferenceStore, tenant_ref
+
+from .git_utils import GIT_IDENTITY, commit_to_remote, git, make_remote
+
+
+def test_forks_share_objects_of_host(
+    remote: str, fork: str, store: ReferenceStore, tmp_path: pathlib.Path
+) -> None:
+    git_ops = GitOps(reference_store=store)
+    for name, url in (('a', remote), ('b', fork)):
+        git_ops.clone(url=url, to_path=str(tmp_path / name))
+        assert git(tmp_path / name, 'count-objects') == '0 objects, 0 kilobytes'
+        assert (tmp_path / name / 'README.md').exists()
+    reference = pathlib.Path(store.path_for(remote))
+    assert reference == pathlib.Path(store.path_for(fork))
+    assert git(reference, 'for-each-ref', '--format=%(refname)') == '\n'.join(
+        sorted([f'{tenant_ref(remote)}/heads/main', f'{tenant_ref(fork)}/heads/main'])
+    )
+
+
+def test_gc_keeps_objects_of_force_pushed_history(
+    remote: str, store: ReferenceStore, tmp_path: pathlib.Path
+) -> None:
+    commit_to_remote(remote, tmp_path / 'upstream', 'NEW.md')
+    GitOps(reference_store=store).clone(url=remote, to_path=str(tmp_path / 'copy'))
+    git(pathlib.Path(remote[len('file://'):]), 'update-ref', 'refs/heads/main', 'main~1')
+    reference = pathlib.Path(store.update(remote, {}))
+    git(reference, 'gc', '--quiet')
+    git(tmp_path / 'copy', 'fsck', '--strict')
+    assert git(reference, 'config', 'gc.pruneExpire') == 'never'
+
+
+def test_urls_are_grouped_by_host(store: ReferenceStore) -> None:
+    assert store.path_for('git@github.com:a/b.git') == store.path_for('https://github.com/c/d')
+    assert store.path_for('git@github.com:a/b.git') != store.path_for('git@gitlab.com:a/b.git')
+
+
+@pytest.fixture(name='remote')
+def _remote(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> str:
+    for name, value in GIT_IDENTITY.items():
+        monkeypatch.setenv(name, value)
+    # Local paths are cloned by copying objects, file:// goes through the transport.
+    return 'file://' + make_remote(tmp_path, {'README.md': 'GFS-JWT:token\n'})
+
+
+@pytest.fixture(name='fork')
+def _fork(remote: str, tmp_path: pathlib.Path) -> str:
+    fork = tmp_path / 'fork.git'
+    shutil.copytree(remote[len('file://'):], fork)
+    return f'file://{fork}'
+
+
+@pytest.fixture(name='store')
+def _store(tmp_path: pathlib.Path) -> ReferenceStore:
+    return ReferenceStore(str(tmp_path / 'references'))
@@ -0,0 +1,37 @@
+import pytest
+
+from gitformsaver.repo_key import repo_key
+
+
+@pytest.mark.parametrize(
+    'url',
+    [
+        'git@github.com:owner/repo.git',
+        'git@github.com:owner/repo',
+        'ssh://git@github.com:owner/repo.git',
+        'ssh://git@github.com/owner/repo',
+        'ssh://git@github.com:22/owner/repo.git',
+        'ssh://GitHub.com/owner/repo.git/',
+        'git://github.com/owner/repo.git',
+        'git://github.com:9418/owner/repo.git',
+        'git+ssh://github.com:22/owner/repo.git',
+    ],
+)
+def test_urls_of_same_repo_have_same_key(url: str) -> None:
+    assert repo_key(url) == 'github.com/owner/repo.git'
+
+
+@pytest.mark.parametrize(
+    'url, key',
+    [
+        ('ssh://git@host:2222/owner/repo.git', 'host:2222/owner/repo.git'),
+        ('ssh://host:9418/owner/repo.git', 'host:9418/owner/repo.git'),
+        ('git://host:22/owner/repo.git', 'host:22/owner/repo.git'),
+        ('git@github.com:Owner/Repo.git', 'github.com/Owner/Repo.git'),
+        ('https://github.com/owner/repo.git', ''),
+        ('ssh://host:../../etc/hosts', ''),
+        ('/srv/repo.git', ''),
+    ],
+)
+def test_distinct_keys(url: str, key: str) -> None:
+    assert repo_key(url) == key
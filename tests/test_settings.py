@@ -0,0 +1,22 @@
+import pytest
+
+from gitformsaver.git_thread import CoalescingPolicy
+from gitformsaver.settings import Settings
+
+
+def test_repo_coalescing_is_read_from_env() -> None:
+    settings = Settings.from_env(
+        {
+            'GFS_COALESCE_MAX_SUBMISSIONS': '10',
+            'GFS_REPO_COALESCE_MAX_LATENCY': 'git@host:a.git=2 https://host/b.git=0.5',
+        }
+    )
+    assert settings.repo_coalescing == {
+        'git@host:a.git': CoalescingPolicy(max_latency=2, max_tasks=10),
+        'https://host/b.git': CoalescingPolicy(max_latency=0.5, max_tasks=10),
+    }
+
+
+def test_repo_coalescing_without_latency_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        Settings.from_env({'GFS_REPO_COALESCE_MAX_LATENCY': 'git@host:a.git'})
@@ -0,0 +1,178 @@
+import asyncio
+import collections
+import pathlib
+from typing import Awaitable, Callable
+from unittest import mock
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from gitformsaver.backpressure import QueueDepth
+from gitformsaver.errors import QueueFullError
+from gitformsaver.git_thread import GitThread
+from gitformsaver.git_thread_manager import GitThreadManager
+from gitformsaver.repo_key import repo_key
+from gitformsaver.sharding import HashRing, OwnerService, ShardedGitThreadManager, owner_names
+
+from .async_utils import run
+
+REPOS = [f'git@github.com:user/repo{index}.git' for index in range(1000)]
+
+
+def test_aliases_of_a_repo_have_one_owner() -> None:
+    ring = HashRing(owner_names(4))
+    assert ring.owner('git@github.com:user/repo.git') == ring.owner('ssh://github.com/user/repo')
+
+
+def test_repo_keys_have_the_owner_of_their_repo() -> None:
+    ring = HashRing(owner_names(4))
+    assert all(ring.key_owner(repo_key(repo)) == ring.owner(repo) for repo in REPOS)
+
+
+def test_repos_are_spread_between_owners() -> None:
+    counts = collections.Counter(HashRing(owner_names(4)).owner(repo) for repo in REPOS)
+    assert set(counts) == set(owner_names(4))
+    assert min(counts.values()) > len(REPOS) / 8
+
+
+def test_new_owner_takes_repos_only_from_others() -> None:
+    before = HashRing(owner_names(4))
+    after = HashRing(owner_names(5))
+    moved = [repo for repo in REPOS if before.owner(repo) != after.owner(repo)]
+    assert all(after.owner(repo) == 'git-4' for repo in moved)
+    assert len(moved) < len(REPOS) / 3
+
+
+def test_submission_is_forwarded_to_owner(
+    git_thread: GitThread, with_owner: Callable[..., Awaitable[None]]
+) -> None:
+    async def scenario(manager: ShardedGitThreadManager) -> None:
+        await manager('git@host:repo.git').push_soon('file.md', 'text', accepted_at=1.5)
+
+    run(with_owner(scenario))
+    git_thread.push_soon.assert_called_once_with(
+        'file.md', 'text', repo='git@host:repo.git', accepted_at=1.5
+    )
+
+
+@pytest.mark.parametrize('is_global', [False, True])
+def test_full_owner_queue_is_reported(
+    git_thread: GitThread, with_owner: Callable[..., Awaitable[None]], is_global: bool
+) -> None:
+    git_thread.push_soon.side_effect = QueueFullError('Too many', is_global=is_global)
+
+    async def scenario(manager: ShardedGitThreadManager) -> None:
+        with pytest.raises(QueueFullError) as exc_info:
+            await manager('git@host:repo.git').push_soon('file.md', 'text')
+        assert exc_info.value.is_global is is_global
+        assert str(exc_info.value) == 'Too many'
+
+    run(with_owner(scenario))
+
+
+@pytest.mark.parametrize(
+    'body',
+    [
+        'not json',
+        '[]',
+        '{"file": "file.md", "text": "text"}',
+        '{"repo": "git@host:repo.git", "file": 1, "text": "text"}',
+        '{"repo": "git@host:repo.git", "file": "file.md", "text": "text", "accepted_at": "1"}',
+    ],
+)
+def test_malformed_forwarded_submission_is_rejected(
+    git_thread: GitThread,
+    with_owner: Callable[..., Awaitable[None]],
+    tmp_path: pathlib.Path,
+    body: str,
+) -> None:
+    async def scenario(manager: ShardedGitThreadManager) -> None:
+        del manager
+        connector = aiohttp.UnixConnector(path=str(tmp_path / 'git-0.sock'))
+        async with aiohttp.ClientSession(connector=connector) as session:
+            async with session.post('http://owner/submit', data=body) as response:
+                assert response.status == 400
+
+    run(with_owner(scenario))
+    git_thread.push_soon.assert_not_called()
+
+
+def test_unavailable_owner_is_reported_as_global_overload(tmp_path: pathlib.Path) -> None:
+    async def scenario() -> None:
+        manager = ShardedGitThreadManager({'git-0': str(tmp_path / 'missing.sock')})
+        try:
+            with pytest.raises(QueueFullError) as exc_info:
+                await manager('git@host:repo.git').push_soon('file.md', 'text')
+            assert exc_info.value.is_global
+        finally:
+            await manager.drain()
+
+    run(scenario())
+
+
+def test_queue_depths_are_polled_from_owners(
+    git_thread_manager: GitThreadManager, with_owner: Callable[..., Awaitable[None]]
+) -> None:
+    git_thread_manager.depth = QueueDepth(tasks=3, bytes=30, age=1.5)
+    git_thread_manager.queue_depths.return_value = {'host/repo.git': QueueDepth(3, 30, 1.5)}
+
+    async def scenario(manager: ShardedGitThreadManager) -> None:
+        manager.recover()
+        while not manager.queue_depths():
+            await asyncio.sleep(0.01)
+        manager.stop()
+        assert manager.depth == QueueDepth(tasks=3, bytes=30, age=1.5)
+        assert manager.queue_depths() == {'host/repo.git': QueueDepth(3, 30, 1.5)}
+
+    run(with_owner(scenario))
+
+
+def test_owner_recovers_only_its_repos(git_thread_manager: GitThreadManager) -> None:
+    ring = HashRing(owner_names(2))
+    run(OwnerService(git_thread_manager, ring, 'git-0').on_startup(web.Application()))
+    owns = git_thread_manager.recover.call_args.kwargs['owns']
+    assert [owns(repo) for repo in REPOS[:20]] == [
+        ring.owner(repo) == 'git-0' for repo in REPOS[:20]
+    ]
+
+
+@pytest.fixture(name='with_owner')
+def _with_owner(
+    tmp_path: pathlib.Path, git_thread_manager: GitThreadManager
+) -> Callable[..., Awaitable[None]]:
+    """Run scenario with a manager forwarding to an owner on a Unix socket."""
+
+    async def with_owner(scenario: Callable[[ShardedGitThreadManager], Awaitable[None]]) -> None:
+        owner_service = OwnerService(git_thread_manager, HashRing(['git-0']), 'git-0')
+        app = web.Application()
+        app.router.add_post('/submit', owner_service.handle_submit)
+        app.router.add_get('/queues', owner_service.handle_queues)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        path = str(tmp_path / 'git-0.sock')
+        await web.UnixSite(runner, path).start()
+        manager = ShardedGitThreadManager({'git-0': path}, refresh_interval=0.01)
+        try:
+            await scenario(manager)
+        finally:
+            await manager.drain()
+            await runner.cleanup()
+
+    return with_owner
+
+
+@pytest.fixture(name='git_thread')
+def _git_thread() -> GitThread:
+    obj = mock.Mock(spec_set=GitThread)
+    obj.push_soon.return_value = None
+    return obj
+
+
+@pytest.fixture(name='git_thread_manager')
+def _git_thread_manager(git_thread: GitThread) -> GitThreadManager:
+    obj = mock.Mock(spec_set=GitThreadManager)
+    obj.return_value = git_thread
+    obj.depth = QueueDepth(tasks=0, bytes=0)
+    obj.queue_depths.return_value = {}
+    return obj
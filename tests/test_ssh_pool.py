@@ -0,0 +1,159 @@
+import asyncio
+import getpass
+import pathlib
+import sys
+
+import pytest
+
+from gitformsaver.async_git import AsyncGitOps
+from gitformsaver.git_ops import GitOps
+from gitformsaver.ssh_pool import SshConnectionPool
+
+from .git_utils import GIT_IDENTITY, make_remote
+
+# Stand-in for ssh: runs remote commands locally and keeps a "master" socket file,
+# which -O check reports alive while it holds 'alive'. Its config has the host alias
+# 'gitserver' of localhost:2222.
+FAKE_SSH = f'''#!{sys.executable}
+import getpass, os, subprocess, sys
+
+args, options, positional, control = sys.argv[1:], {{}}, [], None
+with open(os.environ['FAKE_SSH_LOG'], 'a') as fobj:
+    fobj.write(' '.join(args) + '\\n')
+while args:
+    arg = args.pop(0)
+    if arg == '-o':
+        key, value = args.pop(0).split('=', 1)
+        options.setdefault(key, value)
+    elif arg == '-O':
+        control = args.pop(0)
+    elif arg in ('-i', '-p'):
+        options[arg] = args.pop(0)
+    elif arg != '-G':
+        positional.append(arg)
+user, _, host = positional[0].rpartition('@')
+host, port = {{'gitserver': ('localhost', '2222')}}.get(host, (host, '22'))
+path = options.get('ControlPath', '')
+path = path.replace('%r', user or getpass.getuser()).replace('%h', host)
+path = path.replace('%p', options.get('-p', port))
+if '-G' in sys.argv:
+    print('controlpath', path)
+    sys.exit(0)
+if control == 'check':
+    alive = os.path.exists(path) and open(path).read() == 'alive'
+    sys.exit(0 if alive else 255)
+if control == 'exit':
+    os.unlink(path)
+    sys.exit(0)
+if path and not os.path.exists(path):
+    with open(path, 'w') as fobj:
+        fobj.write('alive')
+sys.exit(subprocess.call(['sh', '-c', ' '.join(positional[1:])]))
+'''
+
+
+def test_sessions_reuse_master_connection(
+    url: str, connections: SshConnectionPool, tmp_path: pathlib.Path
+) -> None:
+    local = GitOps(connections=connections).clone(url=url, to_path=str(tmp_path / 'copy'))
+    (tmp_path / 'copy' / 'README.md').write_text('GFS-JWT:token\ntext\n', encoding='utf-8')
+    local.maybe_push('Save form submission')
+    assert (connections.stats.opened, connections.stats.reused) == (1, 1)
+    assert (tmp_path / 'control' / f'{getpass.getuser()}@localhost:22').exists()
+    assert 'ControlPersist=60' in (tmp_path / 'ssh.log').read_text(encoding='utf-8')
+
+
+def test_live_master_is_not_checked_again_right_away(
+    url: str, connections: SshConnectionPool, tmp_path: pathlib.Path
+) -> None:
+    GitOps(connections=connections).clone(url=url, to_path=str(tmp_path / 'copy'))
+    connections.check(url)
+    connections.check(url)
+    log = (tmp_path / 'ssh.log').read_text(encoding='utf-8')
+    assert log.count('-O check') == 1
+    assert connections.stats.reused == 2
+
+
+def test_asyncio_engine_checks_connections(
+    url: str, connections: SshConnectionPool, tmp_path: pathlib.Path
+) -> None:
+    async def scenario() -> None:
+        local = await AsyncGitOps(connections=connections).clone(url, str(tmp_path / 'copy'))
+        (tmp_path / 'copy' / 'README.md').write_text('GFS-JWT:token\ntext\n', encoding='utf-8')
+        await local.maybe_push('Save form submission')
+
+    asyncio.run(scenario())
+    assert (connections.stats.opened, connections.stats.reused) == (1, 1)
+    assert 'ControlPersist=60' in (tmp_path / 'ssh.log').read_text(encoding='utf-8')
+
+
+def test_stale_socket_is_removed(
+    url: str, connections: SshConnectionPool, tmp_path: pathlib.Path
+) -> None:
+    connections.check(url)
+    socket = tmp_path / 'control' / 'git@localhost:2222'
+    socket.write_text('dead', encoding='utf-8')
+    connections.check('ssh://git@localhost:2222/repo.git')
+    assert not socket.exists()
+    assert (connections.stats.opened, connections.stats.stale) == (2, 1)
+
+
+def test_host_alias_uses_socket_of_sessions(
+    connections: SshConnectionPool, tmp_path: pathlib.Path
+) -> None:
+    (tmp_path / 'control' / 'git@localhost:2222').write_text('alive', encoding='utf-8')
+    connections.check('git@gitserver:repo.git')
+    assert (connections.stats.opened, connections.stats.reused) == (0, 1)
+
+
+def test_close_stops_masters(
+    url: str, connections: SshConnectionPool, tmp_path: pathlib.Path
+) -> None:
+    GitOps(connections=connections).clone(url=url, to_path=str(tmp_path / 'copy'))
+    connections.close()
+    assert not list((tmp_path / 'control').iterdir())
+
+
+def test_private_key_is_used_for_push(
+    url: str, tmp_path: pathlib.Path, fake_ssh: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setenv('GFS_SSH', fake_ssh)
+    local = GitOps(private_key_path='/keys/id_rsa').clone(url=url, to_path=str(tmp_path / 'copy'))
+    (tmp_path / 'copy' / 'README.md').write_text('text\n', encoding='utf-8')
+    local.maybe_push('Save form submission')
+    pushes = [
+        line
+        for line in (tmp_path / 'ssh.log').read_text(encoding='utf-8').splitlines()
+        if 'git-receive-pack' in line
+    ]
+    assert pushes and all('-i /keys/id_rsa' in line for line in pushes)
+
+
+@pytest.mark.parametrize(
+    'remote_url',
+    ['/srv/repo.git', 'file:///srv/repo.git', 'https://github.com/a/b.git'],
+)
+def test_other_transports_are_ignored(remote_url: str, connections: SshConnectionPool) -> None:
+    connections.check(remote_url)
+    assert connections.stats.opened == 0
+
+
+@pytest.fixture(name='connections')
+def _connections(tmp_path: pathlib.Path, fake_ssh: str) -> SshConnectionPool:
+    return SshConnectionPool(str(tmp_path / 'control'), persist=60, ssh=fake_ssh)
+
+
+@pytest.fixture(name='fake_ssh')
+def _fake_ssh(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> str:
+    monkeypatch.setenv('FAKE_SSH_LOG', str(tmp_path / 'ssh.log'))
+    path = tmp_path / 'ssh'
+    path.write_text(FAKE_SSH, encoding='utf-8')
+    path.chmod(0o755)
+    return str(path)
+
+
+@pytest.fixture(name='url')
+def _url(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> str:
+    for name, value in GIT_IDENTITY.items():
+        monkeypatch.setenv(name, value)
+    return 'ssh://localhost' + make_remote(tmp_path, {'README.md': 'GFS-JWT:token\n'})
@@ -0,0 +1,47 @@
+import pytest
+
+from gitformsaver.token_cache import TokenCache
+
+
+def test_cache_counts_hits_and_misses(token_cache: TokenCache) -> None:
+    assert token_cache.get('token', 'repo', 'path', 'secret') is None
+    token_cache.put('token', 'repo', 'path', 'secret', True)
+    assert token_cache.get('token', 'repo', 'path', 'secret') is True
+    assert token_cache.get('token', 'repo', 'path', 'other-secret') is None
+    assert (token_cache.hits, token_cache.misses) == (1, 2)
+
+
+def test_cache_evicts_least_recently_used(token_cache: TokenCache) -> None:
+    token_cache.put('1', 'repo', 'path', '', True)
+    token_cache.put('2', 'repo', 'path', '', True)
+    token_cache.get('1', 'repo', 'path', '')
+    token_cache.put('3', 'repo', 'path', '', False)
+    assert len(token_cache) == 2
+    assert token_cache.get('2', 'repo', 'path', '') is None
+    assert token_cache.get('1', 'repo', 'path', '') is True
+    assert token_cache.get('3', 'repo', 'path', '') is False
+
+
+def test_cache_expires_entries(token_cache: TokenCache, clock: list) -> None:
+    token_cache.put('token', 'repo', 'path', '', True)
+    clock[0] += 11
+    assert token_cache.get('token', 'repo', 'path', '') is None
+    assert len(token_cache) == 0
+
+
+def test_cache_invalidates_target(token_cache: TokenCache) -> None:
+    token_cache.put('token', 'repo', 'path', '', True)
+    token_cache.put('token', 'repo', 'other-path', '', True)
+    token_cache.invalidate('repo', 'path')
+    assert token_cache.get('token', 'repo', 'path', '') is None
+    assert token_cache.get('token', 'repo', 'other-path', '') is True
+
+
+@pytest.fixture(name='clock')
+def _clock() -> list:
+    return [0.0]
+
+
+@pytest.fixture(name='token_cache')
+def _token_cache(clock: list) -> TokenCache:
+    return TokenCache(max_size=2, ttl=10, clock=lambda: clock[0])
@@ -0,0 +1,141 @@
+import asyncio
+import concurrent.futures
+from typing import Awaitable, Iterator, List, Sequence
+from unittest import mock
+
+import pytest
+
+from gitformsaver.authentication_interface import AuthenticationInterface
+from gitformsaver.http_server import make_authentication, make_token_signer
+from gitformsaver.settings import Settings
+from gitformsaver.token_signer import TokenRequest, TokenSigner
+
+from .async_utils import run
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class RecordingSigner:
+    def __init__(self) -> None:
+        self.batches: List[List[TokenRequest]] = []
+
+    def __call__(self, requests: Sequence[TokenRequest]) -> List[str]:
+        self.batches.append(list(requests))
+        return [f'{repo}:{path}:{secret}' for repo, path, secret in requests]
+
+
+async def gather(*coroutines: Awaitable[str], return_exceptions: bool = False) -> list:
+    return await asyncio.gather(*coroutines, return_exceptions=return_exceptions)
+
+
+def test_concurrent_requests_are_signed_in_one_batch(
+    executor: concurrent.futures.Executor, sign_batch: RecordingSigner
+) -> None:
+    signer = TokenSigner(mock.Mock(spec_set=AuthenticationInterface), executor, sign_batch)
+    tokens = run(gather(*(signer.create_token('repo', f'file{index}') for index in range(5))))
+    assert tokens == [f'repo:file{index}:' for index in range(5)]
+    assert len(sign_batch.batches) == 1
+
+
+def test_batches_are_bounded(
+    executor: concurrent.futures.Executor, sign_batch: RecordingSigner
+) -> None:
+    signer = TokenSigner(
+        mock.Mock(spec_set=AuthenticationInterface), executor, sign_batch, max_batch=2
+    )
+    run(gather(*(signer.create_token('repo', f'file{index}') for index in range(5))))
+    assert [len(batch) for batch in sign_batch.batches] == [2, 2, 1]
+
+
+def test_identical_requests_share_a_signature(
+    executor: concurrent.futures.Executor, sign_batch: RecordingSigner
+) -> None:
+    signer = TokenSigner(mock.Mock(spec_set=AuthenticationInterface), executor, sign_batch)
+    tokens = run(
+        gather(
+            signer.create_token('repo', 'file', 'a'),
+            signer.create_token('repo', 'file', 'a'),
+            signer.create_token('repo', 'file', 'b'),
+        )
+    )
+    assert tokens == ['repo:file:a', 'repo:file:a', 'repo:file:b']
+    assert sign_batch.batches == [[('repo', 'file', 'a'), ('repo', 'file', 'b')]]
+
+
+def test_issued_tokens_are_cached_until_ttl(
+    executor: concurrent.futures.Executor, sign_batch: RecordingSigner
+) -> None:
+    clock = FakeClock()
+    signer = TokenSigner(
+        mock.Mock(spec_set=AuthenticationInterface),
+        executor,
+        sign_batch,
+        cache_ttl=60,
+        clock=clock,
+    )
+
+    async def scenario() -> None:
+        await signer.create_token('repo', 'file')
+        await signer.create_token('repo', 'file')
+        assert len(sign_batch.batches) == 1
+        clock.now += 61
+        await signer.create_token('repo', 'file')
+        assert len(sign_batch.batches) == 2
+
+    run(scenario())
+
+
+def test_signing_errors_reach_all_waiters(executor: concurrent.futures.Executor) -> None:
+    sign_batch = mock.Mock(side_effect=ValueError("Bad key"))
+    signer = TokenSigner(mock.Mock(spec_set=AuthenticationInterface), executor, sign_batch)
+    results = run(
+        gather(
+            signer.create_token('repo', 'file'),
+            signer.create_token('repo', 'other'),
+            return_exceptions=True,
+        )
+    )
+    assert [type(result) for result in results] == [ValueError, ValueError]
+
+
+def test_without_executor_tokens_are_signed_inline() -> None:
+    authentication = mock.Mock(spec_set=AuthenticationInterface)
+    authentication.create_token.return_value = 'token'
+    signer = TokenSigner(authentication)
+    assert run(signer.create_token('repo', 'file', 'secret')) == 'token'
+    assert run(signer.create_token('repo', 'file', 'secret')) == 'token'
+    authentication.create_token.assert_called_once_with(repo='repo', path='file', secret='secret')
+
+
+@pytest.mark.parametrize('signing_executor', ['thread', 'process'])
+def test_executor_workers_sign_with_server_keys(signing_executor: str) -> None:
+    settings = Settings(
+        signing_algorithms=('HS256',),
+        signing_secret='server secret of at least 32 bytes',
+        signing_executor=signing_executor,
+        signing_workers=1,
+    )
+    authentication = make_authentication(settings)
+    signer = make_token_signer(settings, authentication)
+    try:
+        token = run(signer.create_token('repo', 'file'))
+    finally:
+        signer.close()
+    assert token == authentication.create_token('repo', 'file')
+
+
+@pytest.fixture(name='executor')
+def _executor() -> Iterator[concurrent.futures.Executor]:
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        yield executor
+
+
+@pytest.fixture(name='sign_batch')
+def _sign_batch() -> RecordingSigner:
+    return RecordingSigner()
@@ -0,0 +1,101 @@
+import json
+import pathlib
+import time
+from typing import List, Sequence
+from unittest import mock
+
+import pytest
+
+from gitformsaver.authentication_interface import AuthenticationInterface
+from gitformsaver.git_task_handler import GitTaskHandler, WriteTask
+from gitformsaver.lazy_git import LazyGit
+from gitformsaver.tracing import OtlpJsonExporter, Span, SpanExporter, Stage, Tracer
+
+
+class CollectingExporter(SpanExporter):
+    def __init__(self) -> None:
+        self.spans: List[Span] = []
+
+    def export(self, spans: Sequence[Span]) -> None:
+        self.spans.extend(spans)
+
+    def close(self) -> None:
+        pass
+
+
+def test_batch_stages_become_spans_of_each_submission(
+    tmp_path: pathlib.Path, exporter: CollectingExporter, tracer: Tracer
+) -> None:
+    (tmp_path / 'a.md').write_text('token\n', encoding='ascii')
+    git = mock.Mock(spec_set=LazyGit)
+    git.root = str(tmp_path)
+    authentication = mock.Mock(spec_set=AuthenticationInterface)
+    authentication.extract_token.return_value = 'token'
+    authentication.is_valid_token.return_value = True
+    handler = GitTaskHandler(git=git, repo='repo', authentication=authentication, tracer=tracer)
+    now = time.monotonic()
+    tasks = [
+        WriteTask('a.md', '1', queued_at=now, trace_id=tracer.new_trace_id(), accepted_at=now - 1),
+        WriteTask('a.md', '2', queued_at=now, trace_id=tracer.new_trace_id()),
+    ]
+    handler.handle_writes(tasks)
+    first = [span for span in exporter.spans if span.trace_id == tasks[0].trace_id]
+    assert [span.name for span in first] == [
+        'submission',
+        'accept',
+        'queue',
+        'pull',
+        'validate',
+        'write',
+        'commit',
+        'push',
+    ]
+    root = first[0]
+    assert root.span_id == tasks[0].trace_id[:16]
+    assert root.attributes == {'repo': 'repo', 'file': 'a.md', 'batch.size': 2}
+    assert all(span.parent_span_id == root.span_id for span in first[1:])
+    assert first[1].end_unix_ns - first[1].start_unix_ns == pytest.approx(1e9, rel=1e-3)
+    second = [span.name for span in exporter.spans if span.trace_id == tasks[1].trace_id]
+    assert 'accept' not in second
+
+
+def test_untraced_submissions_have_no_spans(
+    exporter: CollectingExporter, tracer: Tracer
+) -> None:
+    tracer.record_batch('repo', [WriteTask('a.md', '1')], [Stage('pull', 1, 2)], 3)
+    assert not exporter.spans
+
+
+def test_otlp_json_exporter_writes_a_request_per_line(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / 'spans.jsonl'
+    tracer = Tracer(OtlpJsonExporter(str(path)))
+    trace_id = tracer.new_trace_id()
+    now = time.monotonic_ns()
+    task = WriteTask('a.md', '1', queued_at=now / 1e9, trace_id=trace_id)
+    tracer.record_batch('repo', [task], [Stage('push', now, now + 10)], now + 20)
+    tracer.record_batch('repo', [task], [], now + 20)
+    tracer.close()
+    lines = path.read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 2
+    request = json.loads(lines[0])
+    resource_spans = request['resourceSpans'][0]
+    assert resource_spans['resource']['attributes'] == [
+        {'key': 'service.name', 'value': {'stringValue': 'gitformsaver'}}
+    ]
+    spans = resource_spans['scopeSpans'][0]['spans']
+    assert [span['name'] for span in spans] == ['submission', 'queue', 'push']
+    assert spans[0]['traceId'] == trace_id
+    assert 'parentSpanId' not in spans[0]
+    assert spans[2]['parentSpanId'] == spans[0]['spanId']
+    assert int(spans[2]['endTimeUnixNano']) - int(spans[2]['startTimeUnixNano']) == 10
+    assert {'key': 'batch.size', 'value': {'intValue': '1'}} in spans[0]['attributes']
+
+
+@pytest.fixture(name='exporter')
+def _exporter() -> CollectingExporter:
+    return CollectingExporter()
+
+
+@pytest.fixture(name='tracer')
+def _tracer(exporter: CollectingExporter) -> Tracer:
+    return Tracer(exporter)
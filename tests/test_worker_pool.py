@@ -0,0 +1,90 @@
+import threading
+import time
+from typing import Iterator, List, Optional
+
+import pytest
+
+from gitformsaver.worker_pool import Job, WorkerPool
+
+
+class CountdownJob(Job):
+    def __init__(self, name: str, turns: int, log: List[str]) -> None:
+        self.name = name
+        self.turns = turns
+        self.log = log
+        self.running = 0
+        self.overlapped = False
+        self.lock = threading.Lock()
+
+    def next_run(self) -> Optional[float]:
+        return 0.0 if self.turns else None
+
+    def run_once(self) -> None:
+        with self.lock:
+            self.running += 1
+            self.overlapped |= self.running > 1
+        time.sleep(0.001)
+        with self.lock:
+            self.turns -= 1
+            self.log.append(self.name)
+            self.running -= 1
+
+
+def test_jobs_take_turns(log: List[str]) -> None:
+    pool = WorkerPool(size=1)
+    busy, quiet = CountdownJob('busy', 3, log), CountdownJob('quiet', 2, log)
+    start = time.monotonic() + 0.05
+    pool.wake(busy, start)
+    pool.wake(quiet, start)
+    _wait_for(lambda: not busy.turns)
+    pool.stop()
+    assert log == ['busy', 'quiet', 'busy', 'quiet', 'busy']
+
+
+def test_job_is_never_run_concurrently(pool: WorkerPool, log: List[str]) -> None:
+    job = CountdownJob('job', 50, log)
+    for _ in range(50):
+        pool.wake(job)
+    _wait_for(lambda: not job.turns)
+    assert not job.overlapped
+
+
+def test_earlier_wake_up_wins(pool: WorkerPool, log: List[str]) -> None:
+    job = CountdownJob('job', 1, log)
+    pool.wake(job, time.monotonic() + 60)
+    pool.wake(job)
+    _wait_for(lambda: log == ['job'])
+
+
+def test_idle_workers_do_not_wake_up(pool: WorkerPool, log: List[str]) -> None:
+    pool.wake(CountdownJob('job', 1, log))
+    _wait_for(lambda: log == ['job'])
+    wakeups = pool.wakeups
+    time.sleep(0.3)
+    assert pool.wakeups == wakeups
+
+
+def test_stop_is_immediate() -> None:
+    pool = WorkerPool(size=4)
+    started_at = time.monotonic()
+    pool.stop()
+    assert time.monotonic() - started_at < 0.1
+
+
+def _wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture(name='log')
+def _log() -> List[str]:
+    return []
+
+
+@pytest.fixture(name='pool')
+def _pool() -> Iterator[WorkerPool]:
+    pool = WorkerPool(size=4)
+    yield pool
+    pool.stop()
@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+from typing import Iterator, List
+from unittest import mock
+
+import pytest
+
+from gitformsaver.errors import UnpushedError
+from gitformsaver.git_task_handler import GitTaskHandler, WriteTask
+from gitformsaver.git_thread import CoalescingPolicy, GitThread
+from gitformsaver.write_ahead_log import GroupCommitter, WriteAheadLog, find_logs, log_directory
+
+
+def test_append_is_durable_after_sync(wal_dir: str, committer: GroupCommitter) -> None:
+    wal = WriteAheadLog(wal_dir, 'repo', committer)
+    _, durable = wal.append(WriteTask('file', 'text', 'secret', 'url'))
+    assert durable.result(timeout=5) is None
+    wal.close()
+    recovered = WriteAheadLog(wal_dir, 'repo', committer).replay()
+    assert [task for _, task in recovered] == [WriteTask('file', 'text', 'secret', 'url')]
+
+
+def test_corrupt_record_is_skipped(wal_dir: str, committer: GroupCommitter) -> None:
+    wal = WriteAheadLog(wal_dir, 'repo', committer)
+    wal.append(WriteTask('file', 'a'))
+    wal.close()
+    with open(os.path.join(wal_dir, f'{0:012d}.wal'), 'ab') as fobj:
+        fobj.write(b'["file", "text", "secret"]\n{"garbage\n')
+    wal = WriteAheadLog(wal_dir, 'repo', committer)
+    wal.append(WriteTask('file', 'b'))
+    wal.close()
+    recovered = WriteAheadLog(wal_dir, 'repo', committer).replay()
+    assert [task.text for _, task in recovered] == ['a', 'b']
+
+
+def test_completed_segments_are_deleted(wal_dir: str, committer: GroupCommitter) -> None:
+    wal = WriteAheadLog(wal_dir, 'repo', committer, segment_bytes=1)
+    segments = [wal.append(WriteTask('file', text))[0] for text in 'ab']
+    wal.complete(segments)
+    wal.close()
+    assert not WriteAheadLog(wal_dir, 'repo', committer).replay()
+    assert len([name for name in os.listdir(wal_dir) if name.endswith('.wal')]) == 1
+
+
+def test_pushed_records_of_live_segment_are_not_replayed(
+    wal_dir: str, committer: GroupCommitter
+) -> None:
+    wal = WriteAheadLog(wal_dir, 'repo', committer)
+    records = [wal.append(WriteTask('file', text))[0] for text in 'abc']
+    wal.complete(records[:2])
+    wal.close()
+    recovered = WriteAheadLog(wal_dir, 'repo', committer).replay()
+    assert [task.text for _, task in recovered] == ['c']
+
+
+def test_torn_record_is_skipped(wal_dir: str, committer: GroupCommitter) -> None:
+    wal = WriteAheadLog(wal_dir, 'repo', committer)
+    wal.append(WriteTask('file', 'a'))
+    wal.close()
+    with open(os.path.join(wal_dir, f'{0:012d}.wal'), 'ab') as fobj:
+        fobj.write(b'["file", "b')
+    recovered = WriteAheadLog(wal_dir, 'repo', committer).replay()
+    assert [task.text for _, task in recovered] == ['a']
+
+
+def test_logs_are_found_by_repo(tmp_path, committer: GroupCommitter) -> None:
+    directory = log_directory(str(tmp_path), 'git@host:repo.git')
+    WriteAheadLog(directory, 'git@host:repo.git', committer).close()
+    assert find_logs(str(tmp_path)) == {'git@host:repo.git': directory}
+    assert log_directory('', 'git@host:repo.git') is None
+
+
+def test_git_thread_pushes_recovered_submissions(
+    wal_dir: str, committer: GroupCommitter, mock_handler: GitTaskHandler
+) -> None:
+    wal = WriteAheadLog(wal_dir, 'repo', committer)
+    wal.append(WriteTask('file', 'a'))
+    wal.close()
+    git_thread = GitThread(
+        mock_handler,
+        CoalescingPolicy(max_latency=60),
+        wal=WriteAheadLog(wal_dir, 'repo', committer),
+    )
+    assert git_thread.recover() == 1
+    git_thread.push_soon('file', 'b').result(timeout=5)
+    git_thread.stop()
+    (tasks,), _ = mock_handler.handle_writes.call_args
+    assert [(task.rel_path, task.text) for task in tasks] == [('file', 'a'), ('file', 'b')]
+    assert not WriteAheadLog(wal_dir, 'repo', committer).replay()
+
+
+def test_committed_submissions_are_not_replayed(
+    wal_dir: str, committer: GroupCommitter, mock_handler: GitTaskHandler
+) -> None:
+    mock_handler.handle_writes.side_effect = UnpushedError("Network is down")
+    git_thread = GitThread(
+        mock_handler, CoalescingPolicy(max_latency=0), wal=WriteAheadLog(wal_dir, 'repo', committer)
+    )
+    git_thread.push_soon('file', 'a').result(timeout=5)
+    git_thread.stop()
+    git_thread.close()
+    assert not git_thread.is_running
+    assert not WriteAheadLog(wal_dir, 'repo', committer).replay()
+
+
+def test_replacement_of_failed_thread_pushes_nothing_twice(
+    wal_dir: str, committer: GroupCommitter
+) -> None:
+    pushed: List[str] = []
+    pushing, resume = threading.Event(), threading.Event()
+
+    def handle_writes(tasks: List[WriteTask]) -> None:
+        if any(task.text == 'fail' for task in tasks):
+            raise RuntimeError("Pull failed")
+        pushing.set()
+        assert resume.wait(timeout=5)
+        pushed.extend(task.text for task in tasks)
+
+    handler = mock.Mock(spec_set=GitTaskHandler)
+    handler.handle_writes.side_effect = handle_writes
+    git_thread = GitThread(handler, wal=WriteAheadLog(wal_dir, 'repo', committer))
+    git_thread.push_soon('file', 'a').result(timeout=5)
+    assert pushing.wait(timeout=5)
+    # Shares the segment with the submission being pushed
+    git_thread.push_soon('file', 'fail').result(timeout=5)
+    resume.set()
+    _wait_for(lambda: not git_thread.is_running)
+    # Like GitThreadManager replacing the failed thread
+    git_thread.close()
+    handler.handle_writes.side_effect = lambda tasks: pushed.extend(task.text for task in tasks)
+    git_thread = GitThread(handler, wal=WriteAheadLog(wal_dir, 'repo', committer))
+    assert git_thread.recover() == 1
+    git_thread.push_soon('file', 'c').result(timeout=5)
+    git_thread.stop()
+    git_thread.close()
+    assert pushed == ['a', 'fail', 'c']
+    assert not WriteAheadLog(wal_dir, 'repo', committer).replay()
+
+
+def _wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture(name='wal_dir')
+def _wal_dir(tmp_path) -> str:
+    return str(tmp_path / 'wal')
+
+
+@pytest.fixture(name='committer')
+def _committer() -> Iterator[GroupCommitter]:
+    committer = GroupCommitter()
+    yield committer
+    committer.stop()
+
+
+@pytest.fixture(name='mock_handler')
+def _mock_handler() -> GitTaskHandler:
+    return mock.Mock(spec_set=GitTaskHandler)